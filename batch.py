@@ -0,0 +1,194 @@
+import sys
+import json
+import time
+import hashlib
+import collections
+from graph import graph_from_edges
+from graph_cache import read_graph_cached, cached_file_hash, DEFAULT_DIR
+from solve import solve
+from options import option_value
+
+# Solve a stream of jobs in one process.
+#
+# Jobs are read one per line from a JSONL file, e.g.
+#   {"id": 7, "graph": "data_test/mesh_examples/output_mesh_3_42.txt",
+#    "algorithm": "auto", "source": "s", "sink": "t", "outputs": ["flow", "cut"]}
+# where everything but "graph" is optional, with the defaults shown except
+# for outputs, which defaults to just the flow. Instead of a file, the graph
+# can be given inline as "edges": [[u, v, capacity], ...]. Results are
+# written one per line, in job order, as soon as each job is done:
+#   {"id": 7, "flow": 3, "algorithm": "dinic", "seconds": 0.001,
+#    "cut": {"capacity": 3, "source_side": [...], "edges": [[u, v, c], ...]}}
+# "stats" among the outputs adds the solver's operation counts, and results
+# served from the result cache have "cached": true. A job that fails gets
+# {"id": ..., "error": "..."} and the batch goes on. A job without an id,
+# such as a line that is not JSON, gets "id": null.
+#
+# Every flow is checked with certificate.verify_flow against the minimum cut
+# before its result is given out, and a flow that fails the check gives an
+# error result instead; --no-verify skips the check.
+#
+# Jobs flow through a chain of generators, so only one job is held at a
+# time. The most recently used graphs stay loaded, keyed by the hash of
+# their file's contents (or of their inline edges), so jobs on the same
+# graph load it once, and results are remembered by (graph hash, algorithm,
+# source, sink, outputs), so a repeated job is not solved again. Both caches
+# are bounded.
+#
+# Usage: python batch.py JOBS.jsonl [--out RESULTS.jsonl] [--graphs N] [--results N]
+#     [--no-verify]
+# with "-" for stdin or stdout.
+
+OUTPUTS = ("flow", "cut", "stats")
+
+DEFAULT_GRAPHS = 8
+DEFAULT_RESULTS = 100000
+
+class LRUCache:
+	def __init__(self, capacity):
+		self.capacity = capacity
+		self.items = collections.OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	# The value for key, or None if it is not cached.
+	def get(self, key):
+		value = self.items.get(key)
+		if value is None:
+			self.misses += 1
+		else:
+			self.hits += 1
+			self.items.move_to_end(key)
+		return value
+
+	def put(self, key, value):
+		self.items[key] = value
+		self.items.move_to_end(key)
+		while len(self.items) > self.capacity:
+			self.items.popitem(last=False)
+
+# The jobs in an iterable of JSONL lines, skipping blank ones. A line that is
+# not a JSON object gives a job with only an "error", so that it gets an
+# error result in its place.
+def read_jobs(lines):
+	for (line_number, line) in enumerate(lines, 1):
+		if not line.strip():
+			continue
+		try:
+			job = json.loads(line)
+		except json.JSONDecodeError as err:
+			job = {"error": f"line {line_number}: {err}"}
+		if not isinstance(job, dict):
+			job = {"error": f"line {line_number}: expected a JSON object"}
+		job.setdefault("id", None)
+		yield job
+
+class BatchSolver:
+	def __init__(self, graphs=DEFAULT_GRAPHS, results=DEFAULT_RESULTS, cache_dir=DEFAULT_DIR, verify=True):
+		self.graphs = LRUCache(graphs)
+		self.results = LRUCache(results)
+		self.cache_dir = cache_dir
+		self.verify = verify
+
+	# Content hash of a job's graph file, or of its inline edges.
+	def graph_digest(self, job):
+		if "edges" in job:
+			return hashlib.blake2b(json.dumps(job["edges"]).encode(), digest_size=16).hexdigest()
+		if "graph" not in job:
+			raise ValueError("job has no graph or edges")
+		return cached_file_hash(job["graph"], self.cache_dir)
+
+	# The graph of a job, with content hash digest, loaded once while it
+	# stays among the most recently used.
+	def load(self, job, digest):
+		graph = self.graphs.get(digest)
+		if graph is None:
+			if "edges" in job:
+				graph = graph_from_edges(job["edges"])
+			else:
+				graph = read_graph_cached(job["graph"], self.cache_dir)
+			self.graphs.put(digest, graph)
+		return graph
+
+	# The key under which the result of a job is remembered: (graph hash,
+	# algorithm, source, sink, outputs). Raises OSError or ValueError if the
+	# job is malformed or its graph file cannot be read.
+	def job_key(self, job):
+		if "error" in job:
+			raise ValueError(job["error"])
+		outputs = job.get("outputs", ["flow"])
+		if not isinstance(outputs, list) or not all(isinstance(output, str) for output in outputs):
+			raise ValueError(f"outputs must be a list of strings, some of {OUTPUTS}")
+		outputs = tuple(sorted(set(outputs)))
+		unknown = set(outputs) - set(OUTPUTS)
+		if unknown:
+			raise ValueError(f"unknown outputs {sorted(unknown)}, expected some of {OUTPUTS}")
+		return (self.graph_digest(job), job.get("algorithm", "auto"),
+				job.get("source", "s"), job.get("sink", "t"), outputs)
+
+	# The result of one job, without its id. Raises OSError, KeyError or
+	# ValueError if the job cannot be run.
+	def run(self, job):
+		key = self.job_key(job)
+		result = self.results.get(key)
+		if result is not None:
+			return dict(result, cached=True)
+		result = self.solve(job, key)
+		self.results.put(key, result)
+		return result
+
+	# Solve a job whose key is `key', bypassing the result cache, within
+	# budget, a Budget or None. Returns None if the budget runs out. Raises
+	# CertificateError (a ValueError) if the flow found fails verification.
+	def solve(self, job, key, budget=None):
+		(digest, algorithm, source, sink, outputs) = key
+		graph = self.load(job, digest)
+		if (source, sink) != ("s", "t") or graph.source is None or graph.sink is None:
+			graph = graph.with_terminals(source, sink)
+		start_time = time.perf_counter()
+		solution = solve(graph, algorithm, budget=budget)
+		if not solution.solver.complete:
+			return None
+		result = {"flow": solution.flow, "algorithm": solution.algorithm,
+				"seconds": time.perf_counter() - start_time}
+		if self.verify or "cut" in outputs:
+			in_source_side = solution.solver.reachable_from(solution.solver.source)
+		if self.verify:
+			solution.solver.certify(in_source_side)
+		if "cut" in outputs:
+			cut = solution.solver.describe_cut(in_source_side)
+			result["cut"] = {"capacity": cut.capacity, "source_side": cut.source_side, "edges": cut.edges}
+		if "stats" in outputs:
+			result["stats"] = solution.solver.stats()
+		return result
+
+	# Results for a stream of jobs, in the same order.
+	def run_all(self, jobs):
+		for job in jobs:
+			try:
+				result = self.run(job)
+			except (OSError, KeyError, ValueError, TypeError) as err:
+				result = {"error": err.args[0] if isinstance(err, KeyError) and err.args else str(err)}
+			yield dict(id=job.get("id"), **result)
+
+def write_results(results, out):
+	for result in results:
+		out.write(json.dumps(result) + "\n")
+		out.flush()
+
+if __name__ == "__main__":
+	if len(sys.argv) < 2:
+		print("Usage: python batch.py JOBS.jsonl [--out RESULTS.jsonl] [--graphs N] [--results N]")
+		exit(1)
+
+	jobs_file = sys.stdin if sys.argv[1] == "-" else open(sys.argv[1])
+	out_name = option_value("--out", "-", str)
+	out = sys.stdout if out_name == "-" else open(out_name, "w+")
+	batch = BatchSolver(option_value("--graphs", DEFAULT_GRAPHS, int),
+			option_value("--results", DEFAULT_RESULTS, int), verify="--no-verify" not in sys.argv[2:])
+
+	start_time = time.time()
+	write_results(batch.run_all(read_jobs(jobs_file)), out)
+	print(f"Done in {time.time() - start_time}s; graph cache {batch.graphs.hits} hits, "
+			f"{batch.graphs.misses} misses; result cache {batch.results.hits} hits, "
+			f"{batch.results.misses} misses", file=sys.stderr)
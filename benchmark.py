@@ -2,66 +2,169 @@ import time
 import sys
 import os
 import csv
+import json
 from ford_fulkerson import FordFulkerson
 from scaling_ford_fulkerson import ScalingFordFulkerson
-from preflow_push import PreflowPushSolver, file_to_adjmat
+from preflow_push import PreflowPushSolver
+from dinic import Dinic
+from boykov_kolmogorov import BoykovKolmogorov
+from graph_cache import read_graph_cached
+from instrumentation import Tracer
+from options import option_value
 
-def run_ff(filename, delimiter=" "):
-	ff = FordFulkerson(filename, delimiter)
-	ff_start = time.time()
+# Each runner times one solve on an already loaded graph, read through the
+# compiled graph cache so that only the first run on a file parses it. The
+# timer covers building the solver as well as running it, so that setup work
+# such as the initial saturating pushes of preflow-push counts for every
+# algorithm. After the timer stops, the flow is checked against the minimum
+# cut with certificate.verify_flow, which raises a CertificateError if it is
+# not a maximum flow.
+# benchmark_suite.py times the phases separately and with repeats. Each
+# runner also returns the solver's operation counts; given a Tracer with
+# timing on, these include the time spent in each phase of the solver.
+
+def run_ff(filename, tracer=None):
+	graph = read_graph_cached(filename)
+	ff_start = time.perf_counter()
+	ff = FordFulkerson(graph, tracer=tracer)
 	computed_flow_val = ff.ford_fulkerson()
-	ff_end = time.time()
+	ff_end = time.perf_counter()
 	time_taken = ff_end - ff_start
+	ff.certify()
 
-	return (time_taken, computed_flow_val)
+	return (time_taken, computed_flow_val, ff.stats())
 
-def run_sff(filename, delimiter=" "):
-	sff = ScalingFordFulkerson(filename, delimiter)
-	sff_start = time.time()
+def run_sff(filename, tracer=None):
+	graph = read_graph_cached(filename)
+	sff_start = time.perf_counter()
+	sff = ScalingFordFulkerson(graph, tracer=tracer)
 	computed_flow_val = sff.scaling_ff()
-	sff_end = time.time()
+	sff_end = time.perf_counter()
 	time_taken = sff_end - sff_start
+	sff.certify()
+
+	return (time_taken, computed_flow_val, sff.stats())
+
+def run_pfp(filename, tracer=None):
+	graph = read_graph_cached(filename)
+	pfp_start = time.perf_counter()
+	pfp = PreflowPushSolver(graph, tracer=tracer)
+	computed_flow_val = pfp.solve_max_flow()
+	pfp_end = time.perf_counter()
+	time_taken = pfp_end - pfp_start
+	pfp.certify()
 
-	return (time_taken, computed_flow_val)
+	return (time_taken, computed_flow_val, pfp.stats())
 
-def run_pfp(filename, delimiter=" "):
-	(src, sink, adjmat) = file_to_adjmat(filename, delimiter)
-	pfp = PreflowPushSolver(adjmat, src, sink)
-	pfp_start = time.time()
+# Run preflow-push with its global relabel and gap heuristics switched on
+# or off, also returning the number of pushes and relabels.
+def run_pfp_counts(filename, heuristics):
+	graph = read_graph_cached(filename)
+	pfp_start = time.perf_counter()
+	pfp = PreflowPushSolver(graph, False, heuristics, heuristics)
 	computed_flow_val = pfp.solve_max_flow()
-	pfp_end = time.time()
+	pfp_end = time.perf_counter()
 	time_taken = pfp_end - pfp_start
 
-	return (time_taken, computed_flow_val)
+	return (time_taken, computed_flow_val, pfp.num_pushes, pfp.num_relabels)
+
+def run_dinic(filename, tracer=None):
+	graph = read_graph_cached(filename)
+	dinic_start = time.perf_counter()
+	dinic = Dinic(graph, tracer=tracer)
+	computed_flow_val = dinic.dinic()
+	dinic_end = time.perf_counter()
+	time_taken = dinic_end - dinic_start
+	dinic.certify()
+
+	return (time_taken, computed_flow_val, dinic.stats())
+
+# Boykov-Kolmogorov only runs on grid graphs, so only the mesh sweep has it.
+def run_bk(filename, tracer=None):
+	graph = read_graph_cached(filename)
+	bk_start = time.perf_counter()
+	bk = BoykovKolmogorov(graph, tracer=tracer)
+	computed_flow_val = bk.boykov_kolmogorov()
+	bk_end = time.perf_counter()
+	time_taken = bk_end - bk_start
+	bk.certify()
 
-def test_all_algos(filename, delimiter=" "):
+	return (time_taken, computed_flow_val, bk.stats())
+
+# Write the operation counts of every algorithm on one file as a JSON line,
+# next to that file's row in a CSV file.
+def write_stats(stats_file, filename, results, bk_res=None):
+	(ff_res, sff_res, pfp_res, dinic_res) = results
+	stats = {"file": filename, "ff": ff_res[2], "sff": sff_res[2], "pfp": pfp_res[2], "dinic": dinic_res[2]}
+	if bk_res is not None:
+		stats["bk"] = bk_res[2]
+	stats_file.write(json.dumps(stats) + "\n")
+
+# A fresh Tracer for every run if phase timing was asked for, else None.
+def make_tracer():
+	return Tracer(timing=True) if "--phase-timing" in sys.argv[1:] else None
+
+def test_all_algos(filename):
 	print(f"Testing on {filename}")
-	pfp_res = run_pfp(filename, delimiter)
-	ff_res = run_ff(filename, delimiter)
-	sff_res = run_sff(filename, delimiter)
+	pfp_res = run_pfp(filename, make_tracer())
+	ff_res = run_ff(filename, make_tracer())
+	sff_res = run_sff(filename, make_tracer())
+	dinic_res = run_dinic(filename, make_tracer())
 
 	# Sanity check.
-	if not (ff_res[1] == sff_res[1] == pfp_res[1]):
+	if not (ff_res[1] == sff_res[1] == pfp_res[1] == dinic_res[1]):
 		print(f"ERROR: Algorithms calculate different flow vals on graph {filename}")
 		print(f"ERROR: FF gives flow val of {ff_res[1]}")
 		print(f"ERROR: SFF gives flow val of {sff_res[1]}")
 		print(f"ERROR: PFP gives flow val of {pfp_res[1]}")
+		print(f"ERROR: Dinic gives flow val of {dinic_res[1]}")
 		print("PANICKING.")
 		exit(1)
 
 	print(f"Successfully executed all algos on {filename}, w/ max flow {ff_res[1]}")
-	return (ff_res, sff_res, pfp_res)
+	return (ff_res, sff_res, pfp_res, dinic_res)
+
+# Run Boykov-Kolmogorov on a grid graph whose max flow is flow_val.
+def test_bk(filename, flow_val):
+	bk_res = run_bk(filename, make_tracer())
+	if bk_res[1] != flow_val:
+		print(f"ERROR: BK gives flow val of {bk_res[1]} on graph {filename}, the others {flow_val}")
+		print("PANICKING.")
+		exit(1)
+	return bk_res
 
 if __name__ == "__main__":
-	bipartite_dir = os.path.join("data_test", "bipartite_examples")
-	fixeddegree_dir = os.path.join("data_test", "fixeddegree_examples")  
-	mesh_dir = os.path.join("data_test", "mesh_examples")  
-	random_dir = os.path.join("data_test", "random_examples")
+	# --data-dir runs on another set of examples with the same layout, such
+	# as larger graphs written by `python generators.py sweep DIR'.
+	data_dir = option_value("--data-dir", "data_test", str)
+	bipartite_dir = os.path.join(data_dir, "bipartite_examples")
+	fixeddegree_dir = os.path.join(data_dir, "fixeddegree_examples")  
+	mesh_dir = os.path.join(data_dir, "mesh_examples")  
+	random_dir = os.path.join(data_dir, "random_examples")
 
-	sys.setrecursionlimit(10000)
+	if "--pfp-heuristics" in sys.argv[1:]:
+		with open("pfp_heuristics_benchmark.csv", "w+") as csvfile:
+			csv_writer = csv.writer(csvfile)
+			# Each row is the file and its max flow, then time, pushes and relabels
+			# with the heuristics on, then the same with them off.
+			for example_dir in [bipartite_dir, fixeddegree_dir, mesh_dir, random_dir]:
+				for f_name in os.listdir(example_dir):
+					full_name = os.path.join(example_dir, f_name)
+					if os.path.isfile(full_name):
+						print(f"Testing PFP heuristics on {full_name}")
+						on_res = run_pfp_counts(full_name, True)
+						off_res = run_pfp_counts(full_name, False)
+						if on_res[1] != off_res[1]:
+							print(f"ERROR: PFP heuristics change flow val on graph {full_name}")
+							print("PANICKING.")
+							exit(1)
+						csv_writer.writerow([full_name, on_res[1],
+											on_res[0], on_res[2], on_res[3],
+											off_res[0], off_res[2], off_res[3]])
+		exit(0)
 	
 	
-	with open("bipartite_benchmark.csv", "w+") as csvfile:
+	with open("bipartite_benchmark.csv", "w+") as csvfile, open("bipartite_benchmark_stats.jsonl", "w+") as stats_file:
 		csv_writer = csv.writer(csvfile)
 		# Each filename has form "$output_bipartite_${nodes_source}_${nodes_sink}_${maxProbability}.txt"
 		for f_name in os.listdir(bipartite_dir):
@@ -73,16 +176,17 @@ if __name__ == "__main__":
 				nodes_sink = int(params[1])
 				max_prob = float(params[2])
 	
-				# For some reason, bipartite graphs use tabs instead of spaces between fields.
-				(ff_res, sff_res, pfp_res) = test_all_algos(full_name, "\t")
+				(ff_res, sff_res, pfp_res, dinic_res) = test_all_algos(full_name)
+				write_stats(stats_file, full_name, (ff_res, sff_res, pfp_res, dinic_res))
 				csv_writer.writerow([nodes_source, nodes_sink, max_prob, 
 									ff_res[0], ff_res[1], 
 									sff_res[0], sff_res[1],
-									pfp_res[0], pfp_res[1]])
+									pfp_res[0], pfp_res[1],
+									dinic_res[0], dinic_res[1]])
 				
 	
 			
-	with open("fixeddegree_benchmark.csv", "w+") as csvfile:
+	with open("fixeddegree_benchmark.csv", "w+") as csvfile, open("fixeddegree_benchmark_stats.jsonl", "w+") as stats_file:
 		csv_writer = csv.writer(csvfile)
 		# Each filename has form "$output_dir/output_fixeddegree_${nodes_source}_${edges}_${minCapacity}_${maxCapacity}.txt"
 		for f_name in os.listdir(fixeddegree_dir):
@@ -95,13 +199,15 @@ if __name__ == "__main__":
 				min_cap = int(params[2])
 				max_cap = int(params[3])
 	
-				(ff_res, sff_res, pfp_res) = test_all_algos(full_name)
+				(ff_res, sff_res, pfp_res, dinic_res) = test_all_algos(full_name)
+				write_stats(stats_file, full_name, (ff_res, sff_res, pfp_res, dinic_res))
 				csv_writer.writerow([nodes_source, edges, min_cap, max_cap,
 									ff_res[0], ff_res[1], 
 									sff_res[0], sff_res[1],
-									pfp_res[0], pfp_res[1]])
+									pfp_res[0], pfp_res[1],
+									dinic_res[0], dinic_res[1]])
 	
-	with open("mesh_benchmark.csv", "w+") as csvfile:
+	with open("mesh_benchmark.csv", "w+") as csvfile, open("mesh_benchmark_stats.jsonl", "w+") as stats_file:
 		csv_writer = csv.writer(csvfile)
 		# Each filename has form "output_dir/output_mesh_${rows}_${columns}.txt"
 		for f_name in os.listdir(mesh_dir):
@@ -112,17 +218,23 @@ if __name__ == "__main__":
 				rows = int(params[0])
 				cols = int(params[1])
 	
-				(ff_res, sff_res, pfp_res) = test_all_algos(full_name)
+				(ff_res, sff_res, pfp_res, dinic_res) = test_all_algos(full_name)
+				bk_res = test_bk(full_name, ff_res[1])
+				write_stats(stats_file, full_name, (ff_res, sff_res, pfp_res, dinic_res), bk_res)
+				# Boykov-Kolmogorov's time and flow come after the columns
+				# the other families have.
 				csv_writer.writerow([rows, cols,
 									ff_res[0], ff_res[1], 
 									sff_res[0], sff_res[1],
-									pfp_res[0], pfp_res[1]])
+									pfp_res[0], pfp_res[1],
+									dinic_res[0], dinic_res[1],
+									bk_res[0], bk_res[1]])
 	
-	with open("random_benchmark.csv", "w+") as csvfile:
+	with open("random_benchmark.csv", "w+") as csvfile, open("random_benchmark_stats.jsonl", "w+") as stats_file:
 		csv_writer = csv.writer(csvfile)
 		# Each filename has form "output_random_${nodes_source}_${dense}_${minCapacity}_${maxCapacity}.txt"
 		for f_name in os.listdir(random_dir):
-			full_name = os.path.join(mesh_dir, f_name)
+			full_name = os.path.join(random_dir, f_name)
 			if os.path.isfile(full_name):
 				stem = os.path.splitext(f_name)[0]
 				params = stem.split("_")[2:]
@@ -130,9 +242,11 @@ if __name__ == "__main__":
 				dense = int(params[1])
 				min_cap = int(params[2])
 	
-				(ff_res, sff_res, pfp_res) = test_all_algos(full_name)
+				(ff_res, sff_res, pfp_res, dinic_res) = test_all_algos(full_name)
+				write_stats(stats_file, full_name, (ff_res, sff_res, pfp_res, dinic_res))
 				csv_writer.writerow([nodes_source, dense, min_cap,
 									ff_res[0], ff_res[1], 
 									sff_res[0], sff_res[1],
-									pfp_res[0], pfp_res[1]])
+									pfp_res[0], pfp_res[1],
+									dinic_res[0], dinic_res[1]])
 	
@@ -0,0 +1,228 @@
+import sys
+import os
+import gc
+import json
+import time
+import platform
+import statistics
+import subprocess
+import datetime
+import tracemalloc
+import numpy as np
+from graph import parse_edges, ResidualGraph
+from ford_fulkerson import FordFulkerson
+from scaling_ford_fulkerson import ScalingFordFulkerson
+from preflow_push import PreflowPushSolver
+from dinic import Dinic
+from bulk_push_relabel import BulkPushRelabel
+from options import option_value
+
+# Repeated, phase-by-phase benchmarks of the max-flow solvers.
+#
+# Every run is split into three phases, each timed with perf_counter_ns:
+#   load:  reading and parsing the graph file (parse_edges),
+#   build: building the shared CSR residual graph,
+#   solve: building the solver and running it to a maximum flow, so that
+#          setup done in a solver's constructor counts for every algorithm.
+# Each algorithm gets `warmup' untimed runs and then `repeats' timed ones per
+# file, reported as median, quartiles and IQR per phase. Peak memory per
+# phase is measured in one extra run under tracemalloc, since tracing slows
+# the timed runs down too much to share them.
+#
+# Usage:
+#   python benchmark_suite.py run [--repeats N] [--warmup N] [--algos ff,pfp]
+#       [--stride K] [--out results.json] [file or directory ...]
+#   python benchmark_suite.py compare baseline.json results.json [--threshold 0.1]
+
+# The solve phase of every algorithm, on a built ResidualGraph.
+SOLVERS = {
+	"ff": lambda graph: FordFulkerson(graph).ford_fulkerson(),
+	"sff": lambda graph: ScalingFordFulkerson(graph).scaling_ff(),
+	"pfp": lambda graph: PreflowPushSolver(graph).solve_max_flow(),
+	"dinic": lambda graph: Dinic(graph).dinic(),
+	"bpr": lambda graph: BulkPushRelabel(graph).solve_max_flow(),
+}
+
+PHASES = ("load", "build", "solve")
+
+DEFAULT_DIRS = [os.path.join("data_test", family + "_examples")
+		for family in ("bipartite", "fixeddegree", "mesh", "random")]
+
+# Relative slowdown of the median beyond which compare reports a regression.
+DEFAULT_THRESHOLD = 0.1
+
+# Run the three phases once. Returns the time of each phase in nanoseconds
+# and the flow value found.
+def timed_run(filename, algo):
+	solve = SOLVERS[algo]
+	gc.collect()
+	gc.disable()
+	try:
+		t0 = time.perf_counter_ns()
+		edges = parse_edges(filename)
+		t1 = time.perf_counter_ns()
+		graph = ResidualGraph(*edges)
+		t2 = time.perf_counter_ns()
+		flow_val = solve(graph)
+		t3 = time.perf_counter_ns()
+	finally:
+		gc.enable()
+	return ({"load": t1 - t0, "build": t2 - t1, "solve": t3 - t2}, flow_val)
+
+# Run the three phases once under tracemalloc. Returns for each phase the
+# peak number of bytes allocated during it, above what was allocated when it
+# started.
+def traced_run(filename, algo):
+	solve = SOLVERS[algo]
+	peaks = {}
+	tracemalloc.start()
+	try:
+		def measure(phase, run):
+			tracemalloc.reset_peak()
+			start = tracemalloc.get_traced_memory()[0]
+			result = run()
+			peaks[phase] = tracemalloc.get_traced_memory()[1] - start
+			return result
+
+		edges = measure("load", lambda: parse_edges(filename))
+		graph = measure("build", lambda: ResidualGraph(*edges))
+		measure("solve", lambda: solve(graph))
+	finally:
+		tracemalloc.stop()
+	return peaks
+
+# Median, quartiles and IQR of a list of times.
+def summarize(samples):
+	if len(samples) > 1:
+		(q1, median, q3) = statistics.quantiles(samples, n=4, method="inclusive")
+	else:
+		q1 = median = q3 = samples[0]
+	return {"median_ns": median, "q1_ns": q1, "q3_ns": q3, "iqr_ns": q3 - q1,
+			"min_ns": min(samples), "samples_ns": samples}
+
+def benchmark_file(filename, algo, repeats, warmup):
+	for _ in range(warmup):
+		timed_run(filename, algo)
+
+	times = {phase: [] for phase in PHASES}
+	flow_vals = set()
+	for _ in range(repeats):
+		(phase_times, flow_val) = timed_run(filename, algo)
+		flow_vals.add(flow_val)
+		for phase in PHASES:
+			times[phase].append(phase_times[phase])
+
+	if len(flow_vals) != 1:
+		print(f"ERROR: {algo} gives different flow vals on repeated runs of {filename}")
+		exit(1)
+
+	return {
+		"file": filename,
+		"family": os.path.basename(filename).split("_")[1],
+		"algo": algo,
+		"flow": flow_vals.pop(),
+		"phases": {phase: summarize(times[phase]) for phase in PHASES},
+		"peak_bytes": traced_run(filename, algo),
+	}
+
+# Description of the machine and software the benchmarks ran on.
+def machine_metadata(repeats, warmup):
+	try:
+		commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True,
+				text=True, check=True).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		commit = None
+
+	return {
+		"timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+		"git_commit": commit,
+		"python": platform.python_version(),
+		"implementation": platform.python_implementation(),
+		"numpy": np.__version__,
+		"platform": platform.platform(),
+		"machine": platform.machine(),
+		"processor": platform.processor(),
+		"cpu_count": os.cpu_count(),
+		"repeats": repeats,
+		"warmup": warmup,
+	}
+
+# Graph files named by the command line arguments, expanding directories.
+def list_files(paths, stride):
+	files = []
+	for path in paths:
+		if os.path.isdir(path):
+			files += sorted(os.path.join(path, f_name) for f_name in os.listdir(path)
+					if os.path.isfile(os.path.join(path, f_name)))
+		else:
+			files.append(path)
+	return files[::stride]
+
+def run_suite(files, algos, repeats, warmup):
+	results = []
+	for filename in files:
+		print(f"Benchmarking {filename}")
+		file_results = [benchmark_file(filename, algo, repeats, warmup) for algo in algos]
+		if len(set(res["flow"] for res in file_results)) > 1:
+			print(f"ERROR: Algorithms calculate different flow vals on graph {filename}")
+			for res in file_results:
+				print(f"ERROR: {res['algo'].upper()} gives flow val of {res['flow']}")
+			print("PANICKING.")
+			exit(1)
+		results += file_results
+
+	return {"metadata": machine_metadata(repeats, warmup), "results": results}
+
+# Compare the phase medians of two result files. A (file, algo, phase) is a
+# regression if its median grew by more than threshold and its IQR no
+# longer overlaps the baseline's, so that noisy runs are not flagged. Returns
+# the list of regressions.
+def compare(baseline, current, threshold):
+	baseline_results = {(res["file"], res["algo"]): res for res in baseline["results"]}
+	regressions = []
+	for res in current["results"]:
+		base = baseline_results.get((res["file"], res["algo"]))
+		if base is None:
+			continue
+		for phase in PHASES:
+			old = base["phases"][phase]
+			new = res["phases"][phase]
+			change = new["median_ns"] / old["median_ns"] - 1 if old["median_ns"] > 0 else 0.0
+			if change > threshold and new["q1_ns"] > old["q3_ns"]:
+				regressions.append((res["file"], res["algo"], phase, change))
+				print(f"REGRESSION: {res['algo']} {phase} on {res['file']}: "
+						f"{old['median_ns']} ns -> {new['median_ns']} ns ({change:+.1%})")
+			elif change < -threshold and new["q3_ns"] < old["q1_ns"]:
+				print(f"Improvement: {res['algo']} {phase} on {res['file']}: "
+						f"{old['median_ns']} ns -> {new['median_ns']} ns ({change:+.1%})")
+	return regressions
+
+if __name__ == "__main__":
+	if len(sys.argv) < 2 or sys.argv[1] not in ("run", "compare"):
+		print("Usage: python benchmark_suite.py run|compare ...")
+		exit(1)
+
+	# Arguments that are neither options nor their values.
+	args = sys.argv[2:]
+	paths = [arg for (i, arg) in enumerate(args)
+			if not arg.startswith("--") and (i == 0 or not args[i - 1].startswith("--"))]
+
+	if sys.argv[1] == "compare":
+		with open(paths[0]) as f:
+			baseline = json.load(f)
+		with open(paths[1]) as f:
+			current = json.load(f)
+		regressions = compare(baseline, current, option_value("--threshold", DEFAULT_THRESHOLD, float))
+		print(f"{len(regressions)} regressions")
+		exit(1 if regressions else 0)
+
+	repeats = option_value("--repeats", 5, int)
+	warmup = option_value("--warmup", 1, int)
+	algos = option_value("--algos", list(SOLVERS), lambda arg: arg.split(","))
+	stride = option_value("--stride", 1, int)
+	out = option_value("--out", "benchmark_results.json", str)
+
+	suite = run_suite(list_files(paths or DEFAULT_DIRS, stride), algos, repeats, warmup)
+	with open(out, "w+") as f:
+		json.dump(suite, f, indent=1)
+	print(f"Wrote {len(suite['results'])} results to {out}")
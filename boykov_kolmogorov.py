@@ -0,0 +1,443 @@
+import re
+import sys
+import time
+import collections
+import numpy as np
+from graph import read_graph
+from max_flow_solver import MaxFlowSolver
+from instrumentation import tracer_from_args
+
+# Boykov-Kolmogorov max flow for grid graphs such as the mesh examples, where
+# every node but the terminals is labeled "(r,c)" and only links to the
+# nodes left, right, above and below it. Loading any other graph raises
+# ValueError.
+#
+# Two search trees are grown, one from the source over arcs with residual
+# capacity and one into the sink. When they touch, the path through the
+# touching arc is augmented. Nodes whose tree arc got saturated become
+# orphans, which look for a new parent in their own tree still connected to
+# its terminal, and are freed with their subtree only if none is left. So
+# the trees survive from one augmentation to the next instead of being
+# searched again from scratch, which suits the short, many augmenting paths
+# of grid graphs. Parent choice and re-parenting use the distance and
+# timestamp heuristics of Boykov and Kolmogorov's paper.
+#
+# Instead of CSR arcs, the solver works on the grid itself: cell (r, c) is
+# number r * width + c of a grid with one empty row and column of padding on
+# every side, so that cell + self.steps[d] is the neighbor in direction d without
+# a bounds check. res[4 * cell + d] is the residual capacity from the cell to
+# its neighbor in direction d, summed over parallel arcs, and src[cell] and
+# snk[cell] those from the source and to the sink. Arcs into the source and
+# out of the sink never take part. The flow is copied back to self.residual
+# when the solve ends or runs out of budget.
+#
+# Usage: python boykov_kolmogorov.py FILE
+
+# Directions 0 to 3 are right, left, down and up, so that direction d ^ 1 is
+# opposite to d.
+
+# Trees of a node.
+FREE = 0
+SOURCE_TREE = 1
+SINK_TREE = 2
+
+# Parent of a tree root, and of an orphan or free node.
+TERMINAL = 4
+NO_PARENT = -1
+
+LABEL_PATTERN = re.compile(r"\((-?\d+),(-?\d+)\)")
+
+# Position of every node of graph in the grid, as three arrays: whether the
+# node is labeled "(r,c)", and its row and column counted from 1 (with the
+# smallest row and column in the graph as 1), or 0 if it is not.
+def grid_positions(graph):
+	rows = np.zeros(graph.num_nodes, dtype=np.int64)
+	cols = np.zeros(graph.num_nodes, dtype=np.int64)
+	labeled = np.zeros(graph.num_nodes, dtype=bool)
+	for (node, label) in enumerate(graph.labels):
+		match = LABEL_PATTERN.fullmatch(label)
+		if match is not None:
+			rows[node] = int(match.group(1))
+			cols[node] = int(match.group(2))
+			labeled[node] = True
+	if np.any(labeled):
+		rows[labeled] -= rows[labeled].min() - 1
+		cols[labeled] -= cols[labeled].min() - 1
+	return (labeled, rows, cols)
+
+# Whether BoykovKolmogorov can load graph: every node but the terminals is
+# labeled "(r,c)", and edges between two of them join neighbors.
+def is_grid(graph):
+	(labeled, rows, cols) = grid_positions(graph)
+	inner = np.ones(graph.num_nodes, dtype=bool)
+	inner[[graph.source, graph.sink]] = False
+	if np.any(inner & ~labeled):
+		return False
+	tails = graph.tails
+	heads = graph.heads
+	between = inner[tails] & inner[heads]
+	distance = np.abs(rows[tails] - rows[heads]) + np.abs(cols[tails] - cols[heads])
+	return not np.any(between & (distance > 1))
+
+class BoykovKolmogorov(MaxFlowSolver):
+	COUNTERS = ("augmenting_paths", "orphans", "arcs_scanned")
+
+	def __init__(self, graph, tracer=None):
+		self.num_orphans = 0
+		super().__init__(graph, tracer)
+
+	def load_graph(self, graph, residual=None):
+		super().load_graph(graph, residual)
+		self.positions = grid_positions(graph)
+		self.layout_grid()
+		self.state = None
+
+	def reset(self, source=None, sink=None):
+		relayout = source is not None or sink is not None
+		super().reset(source, sink)
+		if relayout:
+			self.layout_grid()
+		self.state = None
+
+	def flow_changed(self):
+		self.state = None
+
+	# Number the cells of the padded grid, and give every arc the slot of
+	# the grid state it belongs to: 4 * cell + d for an arc to the neighbor
+	# in direction d, 4N + cell for an arc from the source, 5N + cell for one
+	# to the sink and 6N for one from the source to the sink, with N the
+	# number of cells, or -1 for an arc that never carries new flow.
+	def layout_grid(self):
+		graph = self.graph
+		(labeled, rows, cols) = self.positions
+		inner = labeled.copy()
+		inner[[self.source, self.sink]] = False
+		unlabeled = np.flatnonzero(~labeled)
+		unlabeled = unlabeled[(unlabeled != self.source) & (unlabeled != self.sink)]
+		if len(unlabeled) > 0:
+			raise ValueError(f"Not a grid graph: node {graph.labels[unlabeled[0]]!r} is not labeled (r,c)")
+		self.width = int(cols.max()) + 2
+		self.num_cells = (int(rows.max()) + 2) * self.width
+		self.steps = (1, -1, self.width, -self.width)
+		cell = np.where(inner, rows * self.width + cols, -1)
+
+		num_cells = self.num_cells
+		tails = graph.tails.astype(np.int64)
+		heads = graph.heads.astype(np.int64)
+		tail_cells = cell[tails]
+		head_cells = cell[heads]
+		slots = np.full(graph.num_arcs, -1, dtype=np.int64)
+
+		between = (tail_cells >= 0) & (head_cells >= 0) & (tail_cells != head_cells)
+		step = head_cells[between] - tail_cells[between]
+		direction = np.full(len(step), -1, dtype=np.int64)
+		for (d, offset) in enumerate(self.steps):
+			direction[step == offset] = d
+		if np.any(direction < 0):
+			arc = int(np.flatnonzero(between)[np.argmax(direction < 0)])
+			labels = graph.labels
+			raise ValueError(f"Not a grid graph: edge between {labels[tails[arc]]!r} "
+					f"and {labels[heads[arc]]!r} does not join neighbors")
+		slots[between] = 4 * tail_cells[between] + direction
+
+		from_source = (tails == self.source) & (heads != self.source)
+		to_sink = (heads == self.sink) & (tails != self.sink)
+		slots[from_source & (head_cells >= 0)] = 4 * num_cells + head_cells[from_source & (head_cells >= 0)]
+		slots[to_sink & (tail_cells >= 0)] = 5 * num_cells + tail_cells[to_sink & (tail_cells >= 0)]
+		slots[from_source & to_sink] = 6 * num_cells
+
+		# Arcs with a slot, grouped by slot and in CSR order within one.
+		self.slot_arcs = np.flatnonzero(slots >= 0)
+		self.slot_arcs = self.slot_arcs[np.argsort(slots[self.slot_arcs], kind="stable")]
+		self.arc_slots = slots[self.slot_arcs]
+		self.arc_rev = graph.rev.astype(np.int64)
+
+	# Residual capacity of every slot, from self.residual.
+	def slot_residuals(self, residual):
+		totals = np.zeros(6 * self.num_cells + 1, dtype=np.int64)
+		np.add.at(totals, self.arc_slots, residual[self.slot_arcs])
+		return totals
+
+	# Load the grid state from the current flow. Paths s -> v -> t are
+	# augmented right away, and the nodes still linked to a terminal become
+	# the roots of the two trees.
+	def init_state(self):
+		self.base_residual = np.asarray(self.residual, dtype=np.int64)
+		totals = self.slot_residuals(self.base_residual)
+		n = self.num_cells
+		src = totals[4 * n:5 * n]
+		snk = totals[5 * n:6 * n]
+		direct = np.minimum(src, snk)
+		src -= direct
+		snk -= direct
+		self.base_totals = self.slot_residuals(self.base_residual)
+
+		self.res = totals[:4 * n].tolist()
+		self.src = src.tolist()
+		self.snk = snk.tolist()
+		tree = np.where(src > 0, SOURCE_TREE, np.where(snk > 0, SINK_TREE, FREE))
+		self.tree = tree.tolist()
+		self.parent = np.where(tree != FREE, TERMINAL, NO_PARENT).tolist()
+		self.timestamp = [0] * n
+		self.dist = np.where(tree != FREE, 1, 0).tolist()
+		self.time = 0
+		roots = np.flatnonzero(tree != FREE).tolist()
+		self.active = collections.deque(roots)
+		self.is_active = [False] * n
+		for v in roots:
+			self.is_active[v] = True
+		self.orphans = collections.deque()
+		self.state = "grid"
+
+	# Copy the flow of the grid state back to self.residual. The flow that
+	# went through a slot since `init_state' is spread over its arcs in CSR
+	# order, each taking up to its residual capacity, with one segmented
+	# prefix sum.
+	def store_flow(self):
+		totals = np.concatenate([self.res, self.src, self.snk, [0]]).astype(np.int64)
+		sent = np.maximum(self.base_totals - totals, 0)
+		arcs = self.slot_arcs
+		slots = self.arc_slots
+		residual = self.base_residual.copy()
+		caps = residual[arcs]
+		before = np.cumsum(caps) - caps
+		group_start = np.ones(len(arcs), dtype=bool)
+		group_start[1:] = slots[1:] != slots[:-1]
+		before -= np.maximum.accumulate(np.where(group_start, before, 0))
+		amounts = np.clip(sent[slots] - before, 0, caps)
+		residual[arcs] -= amounts
+		np.add.at(residual, self.arc_rev[arcs], amounts)
+		self.residual[:] = residual.tolist()
+
+	# Grow the trees from the active nodes until they touch. Returns the arc
+	# where they do as (cell of the source tree, direction), or None if the
+	# trees cannot grow any more, which means the flow is maximum.
+	def grow(self):
+		res = self.res
+		tree = self.tree
+		parent = self.parent
+		timestamp = self.timestamp
+		dist = self.dist
+		active = self.active
+		is_active = self.is_active
+		steps = self.steps
+		scanned = 0
+
+		while active:
+			p = active[0]
+			p_tree = tree[p]
+			if p_tree != FREE:
+				scanned += 4
+				for d in range(4):
+					q = p + steps[d]
+					if p_tree == SOURCE_TREE:
+						if res[4 * p + d] == 0:
+							continue
+						if tree[q] == SINK_TREE:
+							self.num_arcs_scanned += scanned
+							return (p, d)
+					else:
+						if res[4 * q + (d ^ 1)] == 0:
+							continue
+						if tree[q] == SOURCE_TREE:
+							self.num_arcs_scanned += scanned
+							return (q, d ^ 1)
+					if tree[q] == FREE:
+						tree[q] = p_tree
+						parent[q] = d ^ 1
+						timestamp[q] = timestamp[p]
+						dist[q] = dist[p] + 1
+						if not is_active[q]:
+							is_active[q] = True
+							active.append(q)
+					elif tree[q] == p_tree and timestamp[q] <= timestamp[p] and dist[q] > dist[p]:
+						# p is a closer parent for q.
+						parent[q] = d ^ 1
+						timestamp[q] = timestamp[p]
+						dist[q] = dist[p] + 1
+			active.popleft()
+			is_active[p] = False
+
+		self.num_arcs_scanned += scanned
+		return None
+
+	# Augment along the path through arc d of cell p, from the source tree
+	# into the sink tree, and collect the nodes cut off from their trees.
+	def augment(self, p, d):
+		res = self.res
+		parent = self.parent
+		steps = self.steps
+		orphans = self.orphans
+		q = p + steps[d]
+
+		bottleneck = res[4 * p + d]
+		v = p
+		while parent[v] != TERMINAL:
+			u = v + steps[parent[v]]
+			bottleneck = min(bottleneck, res[4 * u + (parent[v] ^ 1)])
+			v = u
+		bottleneck = min(bottleneck, self.src[v])
+		v = q
+		while parent[v] != TERMINAL:
+			bottleneck = min(bottleneck, res[4 * v + parent[v]])
+			v += steps[parent[v]]
+		bottleneck = min(bottleneck, self.snk[v])
+
+		res[4 * p + d] -= bottleneck
+		res[4 * q + (d ^ 1)] += bottleneck
+		length = 1
+		v = p
+		while parent[v] != TERMINAL:
+			up = parent[v]
+			u = v + steps[up]
+			res[4 * u + (up ^ 1)] -= bottleneck
+			res[4 * v + up] += bottleneck
+			if res[4 * u + (up ^ 1)] == 0:
+				parent[v] = NO_PARENT
+				orphans.append(v)
+			v = u
+			length += 1
+		self.src[v] -= bottleneck
+		if self.src[v] == 0:
+			parent[v] = NO_PARENT
+			orphans.append(v)
+		v = q
+		while parent[v] != TERMINAL:
+			up = parent[v]
+			u = v + steps[up]
+			res[4 * v + up] -= bottleneck
+			res[4 * u + (up ^ 1)] += bottleneck
+			if res[4 * v + up] == 0:
+				parent[v] = NO_PARENT
+				orphans.append(v)
+			v = u
+			length += 1
+		self.snk[v] -= bottleneck
+		if self.snk[v] == 0:
+			parent[v] = NO_PARENT
+			orphans.append(v)
+
+		self.num_augmenting_paths += 1
+		if self.tracer is not None:
+			self.tracer.event("augment", bottleneck=bottleneck, length=length + 1,
+					arcs_scanned=self.num_arcs_scanned)
+
+	# Find a new parent for every orphan, one in its own tree whose path up
+	# to the terminal is intact, preferring the one closest to the terminal.
+	# An orphan with none is freed, its children become orphans, and its
+	# neighbors that could take it back into their tree become active.
+	def adopt(self):
+		res = self.res
+		tree = self.tree
+		parent = self.parent
+		timestamp = self.timestamp
+		dist = self.dist
+		steps = self.steps
+		orphans = self.orphans
+		active = self.active
+		is_active = self.is_active
+		no_path = self.num_cells + 1
+		self.time += 1
+		now = self.time
+
+		while orphans:
+			v = orphans.popleft()
+			v_tree = tree[v]
+			self.num_orphans += 1
+			self.num_arcs_scanned += 4
+			best = NO_PARENT
+			best_dist = no_path
+			for d in range(4):
+				q = v + steps[d]
+				if tree[q] != v_tree:
+					continue
+				if v_tree == SOURCE_TREE:
+					if res[4 * q + (d ^ 1)] == 0:
+						continue
+				elif res[4 * v + d] == 0:
+					continue
+
+				# Distance of q from the terminal, if its path gets there.
+				length = 0
+				u = q
+				while True:
+					if timestamp[u] == now:
+						length += dist[u]
+						break
+					length += 1
+					if parent[u] == TERMINAL:
+						timestamp[u] = now
+						dist[u] = 1
+						break
+					if parent[u] == NO_PARENT:
+						length = -1
+						break
+					u += steps[parent[u]]
+				if length < 0:
+					continue
+				if length < best_dist:
+					best = d
+					best_dist = length
+				u = q
+				while timestamp[u] != now:
+					timestamp[u] = now
+					dist[u] = length
+					length -= 1
+					u += steps[parent[u]]
+
+			if best != NO_PARENT:
+				parent[v] = best
+				timestamp[v] = now
+				dist[v] = best_dist + 1
+				continue
+
+			for d in range(4):
+				q = v + steps[d]
+				if tree[q] != v_tree:
+					continue
+				if v_tree == SOURCE_TREE:
+					can_adopt = res[4 * q + (d ^ 1)] > 0
+				else:
+					can_adopt = res[4 * v + d] > 0
+				if can_adopt and not is_active[q]:
+					is_active[q] = True
+					active.append(q)
+				if parent[q] == d ^ 1:
+					parent[q] = NO_PARENT
+					orphans.append(q)
+			tree[v] = FREE
+
+	# Calculate the max flow from the solver's current flow and return its
+	# value, or, if the budget runs out first, the value of the flow so far;
+	# the next call goes on from there. The budget is checked after every
+	# augmenting path.
+	def boykov_kolmogorov(self, budget=None):
+		self.start_budget(budget)
+		if self.state is None:
+			self.init_state()
+
+		while True:
+			if self.out_of_budget():
+				self.store_flow()
+				return self.flow_value()
+			start = self.clock()
+			touch = self.grow()
+			self.end_phase("grow", start)
+			if touch is None:
+				break
+			self.augment(*touch)
+			start = self.clock()
+			self.adopt()
+			self.end_phase("adopt", start)
+
+		self.store_flow()
+		self.complete = True
+		return self.flow_value()
+
+if __name__ == "__main__":
+	graph = read_graph(sys.argv[1])
+	start_time = time.time()
+	solver = BoykovKolmogorov(graph, tracer_from_args(sys.argv[2:]))
+	print("Max Flow:", solver.boykov_kolmogorov())
+	print(f"Elapsed time: {time.time() - start_time}")
+	print(solver.stats())
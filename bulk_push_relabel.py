@@ -0,0 +1,203 @@
+import sys
+import time
+import numpy as np
+from graph import read_graph
+from max_flow_solver import MaxFlowSolver
+from instrumentation import tracer_from_args
+
+# Push-relabel in synchronous rounds, in the style of Goldberg's parallel
+# push-relabel: every round works on all active nodes (nodes other than the
+# terminals with excess) at once, with NumPy over the CSR arrays, so the
+# interpreter is paid per round instead of per push. In a round,
+#   - every active node pushes along its admissible arcs, those with
+#     residual capacity to a node one lower, in arc order: each arc takes
+#     what the arcs before it left of the node's excess, up to its residual
+#     capacity, which is a prefix sum over the node's arcs,
+#   - every node that was active and still has excess left of its own has
+#     saturated all its admissible arcs, and is relabeled to one above its
+#     lowest residual neighbor, a minimum over the node's arcs, taken with
+#     the heights from before the round.
+# An arc and its reverse are never both admissible, so no two pushes of a
+# round conflict, and relabeling from the old heights keeps the heights
+# valid. Heights are set to exact distances from the sink (or n plus the
+# distance from the source) by a global relabel, itself one vectorized BFS
+# level at a time, before the first round and whenever the relabels since
+# the last one add up to n.
+#
+# The state is kept in NumPy arrays while solving and only copied to
+# self.residual when the solve ends or runs out of budget.
+#
+# Usage: python bulk_push_relabel.py FILE
+class BulkPushRelabel(MaxFlowSolver):
+	COUNTERS = ("rounds", "pushes", "relabels", "global_relabels", "arcs_scanned")
+
+	def __init__(self, graph, tracer=None):
+		self.num_rounds = 0
+		self.num_pushes = 0
+		self.num_relabels = 0
+		self.num_global_relabels = 0
+		super().__init__(graph, tracer)
+
+	def load_graph(self, graph, residual=None):
+		super().load_graph(graph, residual)
+		self.arc_offsets = graph.offsets
+		self.arc_tails = graph.tails.astype(np.int64)
+		self.arc_heads = graph.heads.astype(np.int64)
+		self.arc_rev = graph.rev.astype(np.int64)
+		# Residual capacities, excesses and heights while solving, or None
+		# until the first solve.
+		self.state = None
+
+	def reset(self, source=None, sink=None):
+		super().reset(source, sink)
+		self.state = None
+
+	def flow_changed(self):
+		self.state = None
+
+	def cut_ranks(self):
+		if self.state is None:
+			return super().cut_ranks()
+		return -self.state[2]
+
+	# The arcs leaving each of nodes, in CSR order, and how many leave each.
+	def arcs_of(self, nodes):
+		starts = self.arc_offsets[nodes]
+		counts = self.arc_offsets[nodes + 1] - starts
+		firsts = np.cumsum(counts) - counts
+		total = int(counts.sum())
+		return (np.arange(total) + np.repeat(starts - firsts, counts), counts)
+
+	# Turn the current flow into a preflow, by saturating every arc leaving
+	# the source, and set up the arrays of the solve.
+	def init_state(self):
+		(caps, residual) = self.capacity_arrays()
+		excess = self.node_excess((caps, residual))
+		arcs = np.arange(self.offsets[self.source], self.offsets[self.source + 1])
+		amounts = residual[arcs]
+		residual[arcs] = 0
+		np.add.at(residual, self.arc_rev[arcs], amounts)
+		excess[self.source] -= int(amounts.sum())
+		np.add.at(excess, self.arc_heads[arcs], amounts)
+		height = np.zeros(self.num_nodes, dtype=np.int64)
+		self.state = (residual, excess, height)
+		self.global_relabel()
+
+	# Set every height to the distance to the sink over residual arcs, or for
+	# nodes that cannot reach the sink, to n plus the distance to the source.
+	# Nodes that can reach neither get 2n and never have excess.
+	def global_relabel(self):
+		(residual, excess, height) = self.state
+		n = self.num_nodes
+		start = self.clock()
+		self.num_global_relabels += 1
+		self.relabels_since_global = 0
+
+		height[:] = 2 * n
+		height[self.sink] = 0
+		height[self.source] = n
+		for root in (self.sink, self.source):
+			frontier = np.array([root])
+			level = height[root]
+			while len(frontier) > 0:
+				(arcs, _) = self.arcs_of(frontier)
+				self.num_arcs_scanned += len(arcs)
+				# Arc rev[a] goes from the head of a into the frontier.
+				nodes = self.arc_heads[arcs[residual[self.arc_rev[arcs]] > 0]]
+				nodes = np.unique(nodes[height[nodes] == 2 * n])
+				level += 1
+				height[nodes] = level
+				frontier = nodes
+		self.end_phase("global_relabel", start)
+
+	# Nodes other than the terminals with excess, in increasing order, out
+	# of the given ones.
+	def active_among(self, nodes):
+		excess = self.state[1]
+		return nodes[(excess[nodes] > 0) & (nodes != self.source) & (nodes != self.sink)]
+
+	# One round of pushes and relabels over the active nodes, given in
+	# increasing order. Returns the nodes active after it.
+	def round(self, active):
+		(residual, excess, height) = self.state
+		self.num_rounds += 1
+		(arcs, counts) = self.arcs_of(active)
+		self.num_arcs_scanned += len(arcs)
+		tails = self.arc_tails[arcs]
+		heads = self.arc_heads[arcs]
+		admissible = (residual[arcs] > 0) & (height[tails] == height[heads] + 1)
+		arcs = arcs[admissible]
+		tails = tails[admissible]
+		heads = heads[admissible]
+		caps = residual[arcs]
+
+		# Residual capacity of the admissible arcs before each one with the
+		# same tail; arcs of a node are contiguous in CSR order.
+		before = np.cumsum(caps) - caps
+		group_start = np.ones(len(arcs), dtype=bool)
+		group_start[1:] = tails[1:] != tails[:-1]
+		before -= np.maximum.accumulate(np.where(group_start, before, 0))
+		amounts = np.clip(excess[tails] - before, 0, caps)
+
+		pushed = amounts > 0
+		arcs = arcs[pushed]
+		amounts = amounts[pushed]
+		self.num_pushes += len(arcs)
+		residual[arcs] -= amounts
+		residual[self.arc_rev[arcs]] += amounts
+		sent = np.zeros(len(active), dtype=np.int64)
+		np.add.at(sent, np.searchsorted(active, tails[pushed]), amounts)
+		excess[active] -= sent
+		left = excess[active]
+		receivers = heads[pushed]
+		np.add.at(excess, receivers, amounts)
+
+		# Relabel the nodes that kept some of their own excess, to one above
+		# their lowest residual neighbor.
+		stuck = active[left > 0]
+		if len(stuck) > 0:
+			(arcs, counts) = self.arcs_of(stuck)
+			self.num_arcs_scanned += len(arcs)
+			neighbor_heights = np.where(residual[arcs] > 0, height[self.arc_heads[arcs]], 4 * self.num_nodes)
+			firsts = np.cumsum(counts) - counts
+			height[stuck] = np.minimum.reduceat(neighbor_heights, firsts) + 1
+			self.num_relabels += len(stuck)
+			self.relabels_since_global += len(stuck)
+
+		return self.active_among(np.unique(np.concatenate([stuck, receivers])))
+
+	# Calculate the max flow and return its value, or, if the budget runs out
+	# first, the flow that has reached the sink so far; the next call goes on
+	# from there. The budget is checked once per round.
+	def solve_max_flow(self, budget=None):
+		self.start_budget(budget)
+		if self.state is None:
+			self.init_state()
+		(residual, excess, height) = self.state
+		start = self.clock()
+
+		active = self.active_among(np.arange(self.num_nodes))
+		while len(active) > 0:
+			if self.out_of_budget():
+				self.end_phase("rounds", start)
+				self.residual[:] = residual.tolist()
+				return int(excess[self.sink])
+			if self.relabels_since_global >= self.num_nodes:
+				self.global_relabel()
+			if self.tracer is not None:
+				self.tracer.event("round", active=len(active))
+			active = self.round(active)
+
+		self.end_phase("rounds", start)
+		self.residual[:] = residual.tolist()
+		self.complete = True
+		return self.flow_value()
+
+if __name__ == "__main__":
+	graph = read_graph(sys.argv[1])
+	start_time = time.time()
+	solver = BulkPushRelabel(graph, tracer_from_args(sys.argv[2:]))
+	flow_val = solver.solve_max_flow()
+	print(f"Max flow is: {flow_val}")
+	print(f"Elapsed time: {time.time() - start_time}")
+	print(solver.stats())
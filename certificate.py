@@ -0,0 +1,90 @@
+import numpy as np
+
+# Check that a flow is a maximum flow, from the flow on every edge and an s-t
+# cut, in a handful of O(n + m) array operations:
+#   - every edge carries between 0 and its capacity,
+#   - inflow equals outflow at every node but the source and sink, from two
+#     bincounts, over the heads and over the tails,
+#   - the cut separates the source from the sink, and its capacity equals
+#     the flow value. By weak duality no flow exceeds any cut, so a flow
+#     as large as some cut is maximum, and that cut minimum.
+# Each failed check raises its own subclass of CertificateError, carrying the
+# offending edges or nodes, so callers can report or handle it; being a
+# ValueError, it also ends up where other bad input does, e.g. as an error
+# result in batch.py. MaxFlowSolver.certify runs it on a solver's flow.
+
+class CertificateError(ValueError):
+	pass
+
+# Edges, given by index, whose flow is negative or above their capacity.
+class CapacityViolation(CertificateError):
+	def __init__(self, edges, flows, caps):
+		self.edges = edges
+		self.flows = flows
+		self.caps = caps
+		super().__init__(f"{len(edges)} edges violate capacity, e.g. edge {edges[0]} "
+				f"with flow {flows[0]} and capacity {caps[0]}")
+
+# Nodes other than the terminals whose inflow is not their outflow, with
+# inflow minus outflow of each.
+class ConservationViolation(CertificateError):
+	def __init__(self, nodes, imbalances):
+		self.nodes = nodes
+		self.imbalances = imbalances
+		super().__init__(f"{len(nodes)} nodes violate conservation, e.g. node {nodes[0]} "
+				f"with inflow minus outflow {imbalances[0]}")
+
+class InvalidCut(CertificateError):
+	pass
+
+# The flow is feasible but smaller than the cut: either the flow is not
+# maximum or the cut is not minimum.
+class CutMismatch(CertificateError):
+	def __init__(self, flow_value, cut_capacity):
+		self.flow_value = flow_value
+		self.cut_capacity = cut_capacity
+		super().__init__(f"Flow value {flow_value} differs from cut capacity {cut_capacity}")
+
+# Largest sum that float64, and so np.bincount with weights, adds up exactly.
+EXACT_SUM = 2 ** 53
+
+# Verify a flow given as arrays over the edges, with edge i going from
+# tails[i] to heads[i] with capacity caps[i] and carrying flows[i], against
+# a cut given by in_source_side, whether each node is on the source's side.
+# Nodes are numbered from 0 to len(in_source_side) - 1. Returns the flow
+# value, or raises a CertificateError.
+def verify_flow(tails, heads, caps, flows, source, sink, in_source_side):
+	tails = np.asarray(tails, dtype=np.int64)
+	heads = np.asarray(heads, dtype=np.int64)
+	caps = np.asarray(caps, dtype=np.int64)
+	flows = np.asarray(flows, dtype=np.int64)
+	in_source_side = np.asarray(in_source_side, dtype=bool)
+	n = len(in_source_side)
+
+	bad = np.flatnonzero((flows < 0) | (flows > caps))
+	if len(bad) > 0:
+		raise CapacityViolation(bad, flows[bad], caps[bad])
+
+	# Flows are now non-negative, so if their total is exact in float64,
+	# every partial sum of the bincounts is too.
+	if int(flows.sum()) < EXACT_SUM:
+		net = (np.bincount(heads, weights=flows, minlength=n)
+				- np.bincount(tails, weights=flows, minlength=n)).astype(np.int64)
+	else:
+		net = np.zeros(n, dtype=np.int64)
+		np.add.at(net, heads, flows)
+		np.add.at(net, tails, -flows)
+	inner = np.ones(n, dtype=bool)
+	inner[[source, sink]] = False
+	bad = np.flatnonzero(inner & (net != 0))
+	if len(bad) > 0:
+		raise ConservationViolation(bad, net[bad])
+
+	if not in_source_side[source] or in_source_side[sink]:
+		raise InvalidCut("Cut does not separate the source from the sink")
+	flow_value = int(net[sink])
+	crossing = in_source_side[tails] & ~in_source_side[heads]
+	cut_capacity = int(caps[crossing].sum())
+	if flow_value != cut_capacity:
+		raise CutMismatch(flow_value, cut_capacity)
+	return flow_value
@@ -0,0 +1,118 @@
+import sys
+import collections
+from graph import read_graph
+from max_flow_solver import MaxFlowSolver
+from instrumentation import tracer_from_args
+
+# Dinic's algorithm: repeatedly build the BFS level graph of the residual
+# graph and saturate it with a blocking flow. Runs in O(n^2 m) in general and
+# O(m sqrt(n)) on unit-capacity graphs such as the bipartite examples.
+class Dinic(MaxFlowSolver):
+	# Distance from the source of every node in the residual graph, or -1 if
+	# unreachable. Nodes no closer to the source than the sink are not
+	# expanded, since no shortest augmenting path passes through them.
+	def bfs_levels(self, residual_graph):
+		level = [-1] * self.num_nodes
+		level[self.source] = 0
+		queue = collections.deque([self.source])
+
+		scanned = 0
+		while queue:
+			u = queue.popleft()
+			if level[self.sink] >= 0 and level[u] >= level[self.sink]:
+				break
+			scanned += self.offsets[u + 1] - self.offsets[u]
+			for arc in range(self.offsets[u], self.offsets[u + 1]):
+				next_node = self.heads[arc]
+				if level[next_node] < 0 and residual_graph[arc] > 0:
+					level[next_node] = level[u] + 1
+					queue.append(next_node)
+
+		self.num_searches += 1
+		self.num_arcs_scanned += scanned
+		return level
+
+	# Saturate the level graph with an iterative DFS. current[u] is the first
+	# arc of u not yet known to be useless in this phase, so every arc is
+	# skipped at most once per phase.
+	def blocking_flow(self, residual_graph, level):
+		current = self.offsets[:-1]
+		path = []
+		u = self.source
+		total = 0
+		scanned = 0
+
+		while True:
+			if u == self.sink:
+				bottleneck = min(residual_graph[arc] for arc in path)
+				for arc in path:
+					residual_graph[arc] -= bottleneck
+					residual_graph[self.rev[arc]] += bottleneck
+				total += bottleneck
+				self.num_augmenting_paths += 1
+				self.num_arcs_scanned += scanned
+				scanned = 0
+				if self.out_of_budget():
+					return total
+
+				# Retreat to the tail of the first saturated arc on the path.
+				for i in range(len(path)):
+					if residual_graph[path[i]] == 0:
+						break
+				u = self.heads[self.rev[path[i]]]
+				del path[i:]
+				continue
+
+			arc = current[u]
+			end = self.offsets[u + 1]
+			next_level = level[u] + 1
+			while arc < end and (residual_graph[arc] == 0 or level[self.heads[arc]] != next_level):
+				arc += 1
+			scanned += arc - current[u]
+			current[u] = arc
+
+			if arc < end:
+				scanned += 1
+				path.append(arc)
+				u = self.heads[arc]
+			elif u == self.source:
+				self.num_arcs_scanned += scanned
+				return total
+			else:
+				# Dead end: u cannot reach the sink in this phase.
+				arc = path.pop()
+				u = self.heads[self.rev[arc]]
+				current[u] += 1
+
+	# Run phases from the solver's current flow until the sink is unreachable,
+	# and return the value of the resulting maximum flow, or of the flow so
+	# far if the budget runs out first. The budget is also checked after
+	# every augmenting path of a blocking flow.
+	def dinic(self, budget=None):
+		self.start_budget(budget)
+		residual_graph = self.residual
+
+		while True:
+			if self.out_of_budget():
+				return self.flow_value()
+			start = self.clock()
+			level = self.bfs_levels(residual_graph)
+			self.end_phase("bfs", start)
+			if level[self.sink] < 0:
+				break  # No more augmenting paths
+
+			start = self.clock()
+			paths = self.num_augmenting_paths
+			flow = self.blocking_flow(residual_graph, level)
+			self.end_phase("blocking_flow", start)
+			self.trace("phase", sink_level=level[self.sink], flow=flow,
+					paths=self.num_augmenting_paths - paths)
+
+		self.complete = True
+		return self.flow_value()
+
+if __name__ == "__main__":
+	dinic = Dinic(read_graph(sys.argv[1]), tracer_from_args(sys.argv[2:]))
+	result = dinic.dinic()
+	print("Max Flow:", result)
+	print(dinic.stats())
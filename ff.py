@@ -1,19 +1,23 @@
 # Python program for implementation 
 # of Ford Fulkerson algorithm
-from collections import defaultdict
+from collections import defaultdict, deque
 import sys
+from graph import read_graph
  
 # This class represents a directed graph 
-# using adjacency matrix representation
+# using the shared CSR residual graph representation
 class Graph:
  
     def __init__(self, graph):
-        self.graph = graph  # residual graph
-        self. ROW = len(graph)
-        # self.COL = len(gr[0])
+        self.graph = graph.residual_copy()  # residual graph, one entry per arc
+        self.offsets = graph.offsets.tolist()
+        self.heads = graph.heads.tolist()
+        self.rev = graph.rev.tolist()
+        self. ROW = graph.num_nodes
  
     '''Returns true if there is a path from source 's' to sink 't' in
-    residual graph. Also fills parent[] to store the path '''
+    residual graph. Also fills parent[] to store the path, as the arc
+    used to reach each vertex '''
  
     def BFS(self, s, t, parent):
  
@@ -21,7 +25,7 @@ class Graph:
         visited = [False]*(self.ROW)
  
         # Create a queue for BFS
-        queue = []
+        queue = deque()
  
         # Mark the source node as visited and enqueue it
         queue.append(s)
@@ -31,19 +35,20 @@ class Graph:
         while queue:
  
             # Dequeue a vertex from queue and print it
-            u = queue.pop(0)
+            u = queue.popleft()
  
             # Get all adjacent vertices of the dequeued vertex u
             # If a adjacent has not been visited, then mark it
             # visited and enqueue it
-            for ind, val in enumerate(self.graph[u]):
-                if visited[ind] == False and val > 0:
+            for arc in range(self.offsets[u], self.offsets[u + 1]):
+                ind = self.heads[arc]
+                if visited[ind] == False and self.graph[arc] > 0:
                       # If we find a connection to the sink node, 
                     # then there is no point in BFS anymore
                     # We just have to set its parent and can return true
                     queue.append(ind)
                     visited[ind] = True
-                    parent[ind] = u
+                    parent[ind] = arc
                     if ind == t:
                         return True
  
@@ -69,8 +74,8 @@ class Graph:
             path_flow = float("Inf")
             s = sink
             while(s !=  source):
-                path_flow = min (path_flow, self.graph[parent[s]][s])
-                s = parent[s]
+                path_flow = min (path_flow, self.graph[parent[s]])
+                s = self.heads[self.rev[parent[s]]]
  
             # Add path flow to overall flow
             max_flow +=  path_flow
@@ -79,47 +84,16 @@ class Graph:
             # along the path
             v = sink
             while(v !=  source):
-                u = parent[v]
-                self.graph[u][v] -= path_flow
-                self.graph[v][u] += path_flow
-                v = parent[v]
+                arc = parent[v]
+                self.graph[arc] -= path_flow
+                self.graph[self.rev[arc]] += path_flow
+                v = self.heads[self.rev[arc]]
  
         return max_flow
  
-def file_to_adjmat(fname):
-	with open(fname, "r") as f:
-		line = f.readline()
-		node_to_index = {}
-		edges = {}
-		index = 0
-		while line:
-			fields = line.split(' ')
-			if fields[0] not in node_to_index:
-				node_to_index[fields[0]] = index
-				edges[index] = {}
-				index += 1
-			if fields[1] not in node_to_index:
-				node_to_index[fields[1]] = index
-				edges[index] = {}
-				index += 1
-	
-			src_ind = node_to_index[fields[0]]
-			dst_ind = node_to_index[fields[1]]
-			edges[src_ind][dst_ind] = int(fields[2])
-			line = f.readline()
-		
-		adj_mat = [[0 for i in range(index)] for i in range(index)]
-		for (src, dst_dict) in edges.items():
-			for (dst, cap) in dst_dict.items():
-				adj_mat[src][dst] = cap
-		
-		src = node_to_index['s']
-		sink = node_to_index['t']
-		return (src, sink, adj_mat)
-  
-(src, sink, graph) = file_to_adjmat(sys.argv[1]) 
+graph = read_graph(sys.argv[1])
  
 g = Graph(graph)
  
   
-print ("The maximum possible flow is %d " % g.FordFulkerson(src, sink))
+print ("The maximum possible flow is %d " % g.FordFulkerson(graph.source, graph.sink))
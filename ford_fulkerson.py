@@ -1,92 +1,256 @@
 import sys
 import os
+import collections
 import numpy as np
+from graph import read_graph
+from max_flow_solver import MaxFlowSolver
+from instrumentation import tracer_from_args
 
-class FordFulkerson:
-	def __init__(self, graph_file, file_delim=" "):
-		self.graph, self.node_mapping = self.read_graph(graph_file, file_delim)
-		self.num_nodes = len(self.node_mapping)
-		self.source = self.node_mapping['s']
-		self.sink = self.node_mapping['t']
+# Ways of finding an augmenting path: "dfs" finds any path, "bfs" finds a
+# shortest one, which makes the solver Edmonds-Karp. "dense" also finds
+# shortest paths, but on an n x n residual matrix, expanding a whole BFS level
+# at a time with NumPy; it is meant for dense graphs such as the random
+# family, where it costs a few array operations per augmenting path.
+SEARCH_MODES = ("dfs", "bfs", "dense")
 
-	def read_graph(self, graph_file, delimiter=" "):
-		with open(graph_file, 'r') as file:
-			lines = file.readlines()
+# Largest graph the dense search takes; its matrix is n^2 64-bit integers.
+DENSE_MAX_NODES = 4096
 
-		graph = []
-		node_mapping = {}
-		node_count = 0
+class FordFulkerson(MaxFlowSolver):
+	def __init__(self, graph, search="dfs", tracer=None):
+		if search not in SEARCH_MODES:
+			raise ValueError(f"Unknown search mode {search!r}, expected one of {SEARCH_MODES}")
+		if search == "dense" and graph.num_nodes > DENSE_MAX_NODES:
+			raise ValueError(f"Dense search needs at most {DENSE_MAX_NODES} nodes, graph has {graph.num_nodes}")
+		self.search = search
+		super().__init__(graph, tracer)
 
-		for line in lines:
-			# Bizzarely, this is last line of mesh graph files.
-			if line == "Done Mesh\n":
-				continue
+	# path is a list of arc indices in the residual graph.
+	def augment(self, path, residual_graph):
+		# Find the minimum capacity along the path and update the residual graph
+		min_capacity = min(residual_graph[arc] for arc in path)
+		for arc in path:
+			residual_graph[arc] -= min_capacity
+			residual_graph[self.rev[arc]] += min_capacity
 
-			u, v, capacity = filter(None, line.split(delimiter))
-			if u not in node_mapping:
-				node_mapping[u] = node_count
-				node_count += 1
-			if v not in node_mapping:
-				node_mapping[v] = node_count
-				node_count += 1
+		return min_capacity
 
-			u, v, capacity = node_mapping[u], node_mapping[v], int(capacity)
-			graph.append((u, v, capacity))
+	# Depth-first search for a path of arcs with residual capacity from start
+	# to end, with an explicit stack so long paths cannot overflow the Python
+	# call stack. Returns the path as a list of arcs, or None.
+	def dfs(self, start, end, residual_graph):
+		self.stamp += 1
+		stamp = self.stamp
+		visited = self.visited
+		offsets = self.offsets
+		heads = self.heads
 
-		adjacency_matrix = np.zeros((node_count, node_count), dtype=int)
+		visited[start] = stamp
+		path = []
+		# next_arc[i] is the next arc to try from the i-th node on the path.
+		next_arc = [offsets[start]]
+		node = start
+		scanned = 0
 
-		for u, v, capacity in graph:
-			adjacency_matrix[u][v] = capacity
+		while node != end:
+			arc = next_arc[-1]
+			last_arc = offsets[node + 1]
+			while arc < last_arc and (visited[heads[arc]] == stamp or residual_graph[arc] <= 0):
+				arc += 1
 
-		return adjacency_matrix, node_mapping
+			if arc < last_arc:
+				scanned += arc + 1 - next_arc[-1]
+				next_arc[-1] = arc + 1
+				node = heads[arc]
+				visited[node] = stamp
+				path.append(arc)
+				next_arc.append(offsets[node])
+			else:
+				# Dead end; revert changes to the path.
+				scanned += last_arc - next_arc.pop()
+				if not path:
+					path = None
+					break
+				node = heads[self.rev[path.pop()]]
 
-	def augment(self, path, residual_graph):
-		# Find the minimum capacity along the path and update the residual graph
-		min_capacity = min(residual_graph[u][v] for u, v in path)
-		for u, v in path:
-			residual_graph[u][v] -= min_capacity
-			residual_graph[v][u] += min_capacity
+		self.num_searches += 1
+		self.num_arcs_scanned += scanned
+		return path
 
-		return min_capacity
+	# Breadth-first search for a shortest path of arcs with residual capacity
+	# from start to end. Returns the path as a list of arcs, or None.
+	def bfs(self, start, end, residual_graph):
+		self.stamp += 1
+		stamp = self.stamp
+		visited = self.visited
+		parent_arc = self.parent_arc
+		offsets = self.offsets
+		heads = self.heads
+
+		visited[start] = stamp
+		queue = collections.deque([start])
+		scanned = 0
+		while queue and visited[end] != stamp:
+			node = queue.popleft()
+			scanned += offsets[node + 1] - offsets[node]
+			for arc in range(offsets[node], offsets[node + 1]):
+				next_node = heads[arc]
+				if visited[next_node] != stamp and residual_graph[arc] > 0:
+					visited[next_node] = stamp
+					parent_arc[next_node] = arc
+					queue.append(next_node)
+
+		self.num_searches += 1
+		self.num_arcs_scanned += scanned
+		if visited[end] != stamp:
+			return None
+
+		path = []
+		node = end
+		while node != start:
+			arc = parent_arc[node]
+			path.append(arc)
+			node = heads[self.rev[arc]]
+		path.reverse()
+		return path
+
+	# The residual capacities as an n x n matrix, with parallel arcs between
+	# two nodes added up.
+	def dense_matrix(self):
+		n = self.num_nodes
+		matrix = np.zeros((n, n), dtype=np.int64)
+		np.add.at(matrix, (self.graph.tails, self.graph.heads), np.asarray(self.residual, dtype=np.int64))
+		return matrix
 
-	def dfs(self, start, end, path, residual_graph, visited):
+	# Breadth-first search on the residual matrix, one level at a time: the
+	# next level is every unvisited node with residual capacity from some
+	# node of the frontier, and its parent the first such frontier node.
+	# Returns the nodes of a shortest path from start to end, or None.
+	def dense_bfs(self, start, end, matrix):
+		n = self.num_nodes
+		visited = np.zeros(n, dtype=bool)
 		visited[start] = True
-		path.append(start)
+		parent = np.zeros(n, dtype=np.int64)
+		frontier = np.array([start])
+		scanned = 0
 
-		if start == end:
-			return path
+		while not visited[end]:
+			scanned += len(frontier) * n
+			reach = (matrix[frontier] > 0) & ~visited
+			nodes = np.flatnonzero(reach.any(axis=0))
+			if len(nodes) == 0:
+				break
+			parent[nodes] = frontier[reach[:, nodes].argmax(axis=0)]
+			visited[nodes] = True
+			frontier = nodes
+
+		self.num_searches += 1
+		self.num_arcs_scanned += scanned
+		if not visited[end]:
+			return None
+
+		path = [end]
+		while path[-1] != start:
+			path.append(int(parent[path[-1]]))
+		path.reverse()
+		return np.array(path)
+
+	# Augment along a path of nodes in the residual matrix.
+	def augment_dense(self, path, matrix):
+		tails = path[:-1]
+		heads = path[1:]
+		min_capacity = int(matrix[tails, heads].min())
+		matrix[tails, heads] -= min_capacity
+		matrix[heads, tails] += min_capacity
+		return min_capacity
+
+	# Write the flow found on the residual matrix back to self.residual. The
+	# flow added between two nodes, start_matrix - matrix, is spread over
+	# the arcs between them in order, each taking what its residual capacity
+	# allows.
+	def store_dense(self, start_matrix, matrix):
+		graph = self.graph
+		n = self.num_nodes
+		residual = np.asarray(self.residual, dtype=np.int64)
+		added = (start_matrix - matrix)[graph.tails, graph.heads]
+
+		order = np.argsort(graph.tails * n + graph.heads, kind="stable")
+		caps = residual[order]
+		before = np.cumsum(caps) - caps
+		# Residual capacity of the earlier arcs between the same two nodes.
+		group_start = np.ones(len(order), dtype=bool)
+		keys = (graph.tails * n + graph.heads)[order]
+		group_start[1:] = keys[1:] != keys[:-1]
+		before -= np.maximum.accumulate(np.where(group_start, before, 0))
+		taken = np.clip(added[order] - before, 0, caps)
+
+		residual[order] -= taken
+		residual[graph.rev[order]] += taken
+		self.residual[:] = residual.tolist()
+
+	# Ford-Fulkerson with the dense search, on the residual matrix.
+	def ford_fulkerson_dense(self):
+		start_matrix = self.dense_matrix()
+		matrix = start_matrix.copy()
+
+		while True:
+			if self.out_of_budget():
+				self.store_dense(start_matrix, matrix)
+				return self.flow_value()
+			scanned = self.num_arcs_scanned
+			start = self.clock()
+			path = self.dense_bfs(self.source, self.sink, matrix)
+			self.end_phase("search", start)
+			if path is None:
+				break
 
-		for next_node, capacity in enumerate(residual_graph[start]):
-			if not visited[next_node] and capacity > 0:
-				result = self.dfs(next_node, end, path, residual_graph, visited)
-				if result:
-					return result
+			bottleneck = self.augment_dense(path, matrix)
+			self.num_augmenting_paths += 1
+			self.trace("augment", bottleneck=bottleneck, length=len(path) - 1,
+					arcs_scanned=self.num_arcs_scanned - scanned)
 
-		path.pop()  # Revert changes to the path
-		return None
+		self.store_dense(start_matrix, matrix)
+		self.complete = True
+		return self.flow_value()
 
-	def ford_fulkerson(self):
-		max_flow = 0
-		residual_graph = self.graph.copy()
+	# Augment until no augmenting path is left, starting from the solver's
+	# current flow, and return the value of the resulting maximum flow, or
+	# of the flow so far if the budget runs out first.
+	def ford_fulkerson(self, budget=None):
+		self.start_budget(budget)
+		if self.search == "dense":
+			return self.ford_fulkerson_dense()
+		residual_graph = self.residual
+		search = self.dfs if self.search == "dfs" else self.bfs
 
 		while True:
-			# Find an augmenting path using DFS
-			path = self.dfs(self.source, self.sink, [], residual_graph, [False] * self.num_nodes)
+			if self.out_of_budget():
+				return self.flow_value()
+			# Find an augmenting path using DFS or BFS
+			scanned = self.num_arcs_scanned
+			start = self.clock()
+			path = search(self.source, self.sink, residual_graph)
+			self.end_phase("search", start)
 
 			if not path:
 				break  # No more augmenting paths
 
 			# Augment the flow along the path
-			flow = self.augment([(path[i], path[i + 1]) for i in range(len(path) - 1)], residual_graph)
-			max_flow += flow
+			bottleneck = self.augment(path, residual_graph)
+			self.num_augmenting_paths += 1
+			self.trace("augment", bottleneck=bottleneck, length=len(path),
+					arcs_scanned=self.num_arcs_scanned - scanned)
 
-		return max_flow
+		self.complete = True
+		return self.flow_value()
 
 
 
 
 if __name__ == "__main__":
-	ford_fulkerson = FordFulkerson(sys.argv[1])
+	search = "bfs" if "--bfs" in sys.argv[2:] else "dense" if "--dense" in sys.argv[2:] else "dfs"
+	ford_fulkerson = FordFulkerson(read_graph(sys.argv[1]), search, tracer_from_args(sys.argv[2:]))
 	result = ford_fulkerson.ford_fulkerson()
 	print("Max Flow:", result)
+	print(ford_fulkerson.stats())
 
@@ -0,0 +1,369 @@
+import sys
+import os
+import numpy as np
+from graph import INDEX_DTYPE, CAP_DTYPE
+
+# Generators for the four graph families of data_test, which so far came
+# from an external Java generator:
+#
+#   MeshGraph(rows, cols)                            output_mesh_{rows}_{cols}
+#   BipartiteGraph(n_source, n_sink, prob)           output_bipartite_{n_source}_{n_sink}_{prob}
+#   FixedDegreeGraph(n, degree, min_cap, max_cap)    output_fixeddegree_{n}_{degree}_{min}_{max}
+#   RandomGraph(n, dense, min_cap, max_cap)          output_random_{n}_{dense}_{min}_{max}
+#
+# Graphs are seeded and reproducible: the same parameters and seed always give
+# the same edges, whether they are written to a file with `write' or built in
+# memory with `edge_arrays'. Edges are produced in blocks of at most about
+# CHUNK_EDGES, as NumPy arrays, and are formatted into text a block at a time
+# with vectorized digit arithmetic, so neither output builds per-edge Python
+# objects and memory use does not grow with the size of the graph.
+
+CHUNK_EDGES = 1 << 18
+
+# Powers of ten from 10 up, for counting the digits of a capacity or index.
+_POWERS = 10 ** np.arange(1, 19, dtype=np.int64)
+
+# ASCII digits of non-negative integers, left-aligned in the rows of a byte
+# matrix, and the number of digits of each.
+def _digits(values):
+	values = np.asarray(values, dtype=np.int64)
+	lengths = np.searchsorted(_POWERS, values, side="right") + 1
+	width = int(lengths.max()) if len(values) > 0 else 1
+	exponents = np.maximum(lengths[:, None] - 1 - np.arange(width), 0)
+	digits = values[:, None] // (10 ** exponents) % 10
+	return ((digits + ord("0")).astype(np.uint8), lengths)
+
+# Text of `rows' lines, each the concatenation of pieces, where a piece is a
+# bytes constant shared by every line or an array of one integer per line.
+def _render(pieces, rows):
+	columns = []
+	masks = []
+	for piece in pieces:
+		if isinstance(piece, bytes):
+			columns.append(np.broadcast_to(np.frombuffer(piece, dtype=np.uint8), (rows, len(piece))))
+			masks.append(np.ones((rows, len(piece)), dtype=bool))
+		else:
+			(digits, lengths) = _digits(piece)
+			columns.append(digits)
+			masks.append(np.arange(digits.shape[1]) < lengths[:, None])
+	return np.hstack(columns)[np.hstack(masks)]
+
+# Flat positions below total chosen independently with probability prob, in
+# increasing order and in arrays of about CHUNK_EDGES. Gaps between chosen
+# positions are drawn from a geometric distribution, so the work is linear in
+# the number of positions chosen rather than in total.
+def _bernoulli_positions(rng, total, prob):
+	if prob <= 0 or total <= 0:
+		return
+	if prob >= 1:
+		for start in range(0, total, CHUNK_EDGES):
+			yield np.arange(start, min(start + CHUNK_EDGES, total), dtype=np.int64)
+		return
+
+	last = -1
+	while True:
+		positions = last + np.cumsum(rng.geometric(prob, size=CHUNK_EDGES))
+		done = positions[-1] >= total
+		positions = positions[positions < total]
+		if len(positions) > 0:
+			yield positions
+			last = int(positions[-1])
+		if done:
+			return
+
+# For each vertex in `vertices', `degree' distinct targets among the n
+# vertices 0 to n - 1 other than itself, in random order.
+def _distinct_others(rng, vertices, n, degree):
+	rows = len(vertices)
+	if 2 * degree > n - 1:
+		# Dense: a random permutation of the other vertices, cut short.
+		picks = np.argsort(rng.random((rows, n - 1)), axis=1)[:, :degree]
+	else:
+		# Sparse: sample with replacement and redraw the rare rows with a
+		# repeated target.
+		picks = rng.integers(0, n - 1, size=(rows, degree))
+		while degree > 1:
+			ordered = np.sort(picks, axis=1)
+			repeated = np.any(ordered[:, 1:] == ordered[:, :-1], axis=1)
+			if not repeated.any():
+				break
+			picks[repeated] = rng.integers(0, n - 1, size=(int(repeated.sum()), degree))
+	# Skip over the vertex itself.
+	return picks + (picks >= vertices[:, None])
+
+# Base class of the graph families.
+#
+# Nodes come in kinds, such as the source "s", the sink "t" and the two sides
+# of a bipartite graph. Subclasses list the kinds and their sizes in
+# self.kinds, give the label of the i-th node of each kind as pieces for
+# `_render' in `label_pieces', and yield their edges from `blocks' as
+# (tail kind, tail indices, head kind, head indices, capacities). Within a
+# block, all tails are of one kind and all heads are of one kind.
+class GraphFamily:
+	def __init__(self, kinds, seed):
+		self.kinds = [("s", 1)] + kinds + [("t", 1)]
+		self.seed = seed
+		# Dense node ID of the first node of every kind, in order of kinds.
+		self.first_id = {}
+		num_nodes = 0
+		for (kind, count) in self.kinds:
+			self.first_id[kind] = num_nodes
+			num_nodes += count
+		self.num_nodes = num_nodes
+
+	def label_pieces(self, kind, index):
+		return [kind.encode()]
+
+	# Capacities drawn uniformly from [min_cap, max_cap].
+	def random_caps(self, rng, size):
+		return rng.integers(self.min_cap, self.max_cap + 1, size=size, dtype=CAP_DTYPE)
+
+	# Write the graph to fname as lines of "u v capacity".
+	def write(self, fname):
+		with open(fname, "wb") as f:
+			for (tail_kind, tails, head_kind, heads, caps) in self.blocks():
+				pieces = (self.label_pieces(tail_kind, tails) + [b" "]
+						+ self.label_pieces(head_kind, heads) + [b" ", caps, b"\n"])
+				_render(pieces, len(caps)).tofile(f)
+
+	# The graph as (tails, heads, caps, node_mapping), as returned by
+	# graph.parse_edges, ready for ResidualGraph.
+	def edge_arrays(self):
+		tails = []
+		heads = []
+		caps = []
+		for (tail_kind, tail_index, head_kind, head_index, block_caps) in self.blocks():
+			tails.append(self.first_id[tail_kind] + np.broadcast_to(tail_index, block_caps.shape))
+			heads.append(self.first_id[head_kind] + np.broadcast_to(head_index, block_caps.shape))
+			caps.append(block_caps)
+		return (np.concatenate(tails).astype(INDEX_DTYPE), np.concatenate(heads).astype(INDEX_DTYPE),
+				np.concatenate(caps).astype(CAP_DTYPE), self.node_mapping())
+
+	def node_mapping(self):
+		labels = []
+		for (kind, count) in self.kinds:
+			for start in range(0, count, CHUNK_EDGES):
+				index = np.arange(start, min(start + CHUNK_EDGES, count), dtype=np.int64)
+				text = _render(self.label_pieces(kind, index) + [b"\n"], len(index))
+				labels += text.tobytes().decode().split("\n")[:-1]
+		return dict(zip(labels, range(len(labels))))
+
+# A rows x cols grid with every node (r, c) linked to its right neighbor and,
+# in both directions, to the nodes above and below it. The source feeds the
+# first column and the last column drains into the sink. Every edge has the
+# same capacity; the Java generator always used 1.
+class MeshGraph(GraphFamily):
+	def __init__(self, rows, cols, capacity=1, seed=0):
+		self.rows = rows
+		self.cols = cols
+		self.capacity = capacity
+		super().__init__([("grid", rows * cols)], seed)
+
+	def filename(self):
+		return f"output_mesh_{self.rows}_{self.cols}.txt"
+
+	def label_pieces(self, kind, index):
+		if kind != "grid":
+			return super().label_pieces(kind, index)
+		return [b"(", index // self.cols + 1, b",", index % self.cols + 1, b")"]
+
+	def caps(self, size):
+		return np.full(size, self.capacity, dtype=CAP_DTYPE)
+
+	def blocks(self):
+		rows = self.rows
+		cols = self.cols
+		row_starts = np.arange(rows, dtype=np.int64) * cols
+		cols_per_block = max(1, CHUNK_EDGES // (2 * rows))
+
+		yield ("s", 0, "grid", row_starts, self.caps(rows))
+
+		# Edges to the right, column by column.
+		for c0 in range(0, cols - 1, cols_per_block):
+			c1 = min(c0 + cols_per_block, cols - 1)
+			tails = (row_starts[None, :] + np.arange(c0, c1)[:, None]).ravel()
+			yield ("grid", tails, "grid", tails + 1, self.caps(len(tails)))
+
+		# Edges down and back up, column by column.
+		for c0 in range(0, cols, cols_per_block):
+			c1 = min(c0 + cols_per_block, cols)
+			upper = (row_starts[None, :-1] + np.arange(c0, c1)[:, None]).ravel()
+			lower = upper + cols
+			tails = np.stack([upper, lower], axis=1).ravel()
+			heads = np.stack([lower, upper], axis=1).ravel()
+			yield ("grid", tails, "grid", heads, self.caps(len(tails)))
+
+		yield ("grid", row_starts + cols - 1, "t", 0, self.caps(rows))
+
+# The source feeds n_source left nodes l1, l2, ..., each left node is linked
+# to each of the n_sink right nodes r1, r2, ... with probability prob, and
+# every right node drains into the sink. The default capacity range is the
+# one of the bipartite examples in data_test.
+class BipartiteGraph(GraphFamily):
+	def __init__(self, n_source, n_sink, prob, min_cap=6, max_cap=44, seed=0):
+		self.n_source = n_source
+		self.n_sink = n_sink
+		self.prob = prob
+		self.min_cap = min_cap
+		self.max_cap = max_cap
+		super().__init__([("l", n_source), ("r", n_sink)], seed)
+
+	def filename(self):
+		return f"output_bipartite_{self.n_source}_{self.n_sink}_{self.prob}.txt"
+
+	def label_pieces(self, kind, index):
+		return [kind.encode(), index + 1] if kind in ("l", "r") else super().label_pieces(kind, index)
+
+	def blocks(self):
+		rng = np.random.default_rng(self.seed)
+		left = np.arange(self.n_source, dtype=np.int64)
+		right = np.arange(self.n_sink, dtype=np.int64)
+
+		yield ("s", 0, "l", left, self.random_caps(rng, len(left)))
+		for positions in _bernoulli_positions(rng, self.n_source * self.n_sink, self.prob):
+			yield ("l", positions // self.n_sink, "r", positions % self.n_sink,
+					self.random_caps(rng, len(positions)))
+		yield ("r", right, "t", 0, self.random_caps(rng, len(right)))
+
+# n nodes v1 to vn, each with edges to `degree' distinct other nodes chosen
+# at random. The source feeds `degree' random nodes and `degree' random nodes
+# drain into the sink.
+class FixedDegreeGraph(GraphFamily):
+	def __init__(self, n, degree, min_cap, max_cap, seed=0):
+		if degree > n - 1:
+			raise ValueError(f"Degree {degree} is too large for {n} nodes")
+		self.n = n
+		self.degree = degree
+		self.min_cap = min_cap
+		self.max_cap = max_cap
+		super().__init__([("v", n)], seed)
+
+	def filename(self):
+		return f"output_fixeddegree_{self.n}_{self.degree}_{self.min_cap}_{self.max_cap}.txt"
+
+	def label_pieces(self, kind, index):
+		return [b"v", index + 1] if kind == "v" else super().label_pieces(kind, index)
+
+	def blocks(self):
+		rng = np.random.default_rng(self.seed)
+		n = self.n
+		degree = self.degree
+
+		yield ("s", 0, "v", rng.choice(n, degree, replace=False), self.random_caps(rng, degree))
+		yield ("v", rng.choice(n, degree, replace=False), "t", 0, self.random_caps(rng, degree))
+
+		rows_per_block = max(1, CHUNK_EDGES // max(degree, 1))
+		for v0 in range(0, n, rows_per_block):
+			vertices = np.arange(v0, min(v0 + rows_per_block, n), dtype=np.int64)
+			heads = _distinct_others(rng, vertices, n, degree).ravel()
+			yield ("v", np.repeat(vertices, degree), "v", heads, self.random_caps(rng, len(heads)))
+
+# Nodes 1 to n - 1, with each pair linked, in both directions and with the
+# same capacity, with probability dense percent. The source feeds, and the
+# sink is fed by, each node with the same probability.
+class RandomGraph(GraphFamily):
+	def __init__(self, n, dense, min_cap, max_cap, seed=0):
+		self.n = n
+		self.dense = dense
+		self.min_cap = min_cap
+		self.max_cap = max_cap
+		super().__init__([("node", n - 1)], seed)
+
+	def filename(self):
+		return f"output_random_{self.n}_{self.dense}_{self.min_cap}_{self.max_cap}.txt"
+
+	def label_pieces(self, kind, index):
+		return [index + 1] if kind == "node" else super().label_pieces(kind, index)
+
+	def blocks(self):
+		rng = np.random.default_rng(self.seed)
+		m = self.n - 1
+		prob = self.dense / 100
+
+		for positions in _bernoulli_positions(rng, m, prob):
+			yield ("s", 0, "node", positions, self.random_caps(rng, len(positions)))
+
+		# Pairs i < j are numbered row by row; row i starts at pair
+		# i * (2m - i - 1) / 2.
+		for pairs in _bernoulli_positions(rng, m * (m - 1) // 2, prob):
+			i = (m - 2 - np.floor(np.sqrt(-8.0 * pairs + 4.0 * m * (m - 1) - 7) / 2 - 0.5)).astype(np.int64)
+			# Fix rounding errors of the square root on large graphs.
+			i -= pairs < i * (2 * m - i - 1) // 2
+			i += pairs >= (i + 1) * (2 * m - i - 2) // 2
+			j = pairs - i * (2 * m - i - 1) // 2 + i + 1
+			caps = self.random_caps(rng, len(pairs))
+			yield ("node", np.stack([i, j], axis=1).ravel(), "node", np.stack([j, i], axis=1).ravel(),
+					np.repeat(caps, 2))
+
+		for positions in _bernoulli_positions(rng, m, prob):
+			yield ("node", positions, "t", 0, self.random_caps(rng, len(positions)))
+
+FAMILIES = {"mesh": MeshGraph, "bipartite": BipartiteGraph,
+		"fixeddegree": FixedDegreeGraph, "random": RandomGraph}
+
+# Parse a parameter from a file name: an int if it is one, else a float.
+def _parse_param(param):
+	try:
+		return int(param)
+	except ValueError:
+		return float(param)
+
+# The generator for a file name of the form output_{family}_{params}.txt.
+def from_filename(fname, seed=0):
+	stem = os.path.splitext(os.path.basename(fname))[0]
+	parts = stem.split("_")
+	return FAMILIES[parts[1]](*[_parse_param(param) for param in parts[2:]], seed=seed)
+
+# Largest graph of each family in data_test, which `sweep' scales up.
+BASE_PARAMS = {
+	"mesh": (23, 52),
+	"bipartite": (33, 47, 0.948227),
+	"fixeddegree": (33, 5, 6, 64),
+	"random": (33, 92, 6, 64),
+}
+
+# Generator for the base graph of a family with about `scale' times as many
+# edges: node counts grow with the scale for the mesh, bipartite and random
+# families, whose edge counts are quadratic in them, and linearly for
+# fixed-degree graphs.
+def scaled(family, scale, seed=0):
+	params = list(BASE_PARAMS[family])
+	if family == "fixeddegree":
+		params[0] = int(params[0] * scale)
+	elif family == "random":
+		params[0] = int(params[0] * scale ** 0.5)
+	else:
+		params[0] = int(params[0] * scale ** 0.5)
+		params[1] = int(params[1] * scale ** 0.5)
+	return FAMILIES[family](*params, seed=seed)
+
+# Write every family at every scale to out_dir/{family}_examples, the layout
+# of data_test, so that `benchmark.py --data-dir out_dir' can run on it.
+def sweep(out_dir, scales, seed=0):
+	for family in FAMILIES:
+		family_dir = os.path.join(out_dir, family + "_examples")
+		os.makedirs(family_dir, exist_ok=True)
+		for scale in scales:
+			generator = scaled(family, scale, seed)
+			print(f"Writing {generator.filename()}")
+			generator.write(os.path.join(family_dir, generator.filename()))
+
+# Usage:
+#   python generators.py FAMILY PARAMS... [--seed N] [--out DIR]
+#   python generators.py sweep DIR [--scales 1,10,100] [--seed N]
+if __name__ == "__main__":
+	args = sys.argv[1:]
+	seed = int(args[args.index("--seed") + 1]) if "--seed" in args else 0
+
+	if args[0] == "sweep":
+		scales = [float(scale) for scale in args[args.index("--scales") + 1].split(",")] if "--scales" in args else [1, 10, 100]
+		sweep(args[1], scales, seed)
+	else:
+		out_dir = args[args.index("--out") + 1] if "--out" in args else "."
+		params = []
+		for arg in args[1:]:
+			if arg.startswith("--"):
+				break
+			params.append(_parse_param(arg))
+		generator = FAMILIES[args[0]](*params, seed=seed)
+		generator.write(os.path.join(out_dir, generator.filename()))
@@ -0,0 +1,213 @@
+import sys
+import collections
+import concurrent.futures
+import numpy as np
+from graph import read_graph
+from solve import ALGORITHMS
+from options import option_value
+
+# Gomory-Hu cut trees, built with Gusfield's algorithm.
+#
+# Every edge of the network is taken as undirected, with its capacity in both
+# directions (ResidualGraph.undirected), since directed networks have no cut
+# tree in general. The tree has an edge (u, parent[u]) of weight weight[u]
+# for every node u but the root, node 0, and the minimum cut between any two
+# nodes is the lightest edge on the tree path between them. Removing that
+# edge splits the tree into the two sides of such a cut.
+#
+# Building it takes n - 1 max flows on the same graph. One solver is built
+# and `reset' to new terminals for each of them, so the graph is parsed and
+# the solver's arrays are allocated only once. With several workers, every
+# worker process gets its own solver, and the cuts of the next few nodes are
+# computed ahead of time with the parents they have so far. A cut is only
+# used if its node's parent has not changed since, and is redone otherwise.
+#
+# Usage: python gomory_hu.py FILE [--algo dinic] [--workers N]
+
+# Solver of a worker process, set up once by `init_worker'.
+worker_solver = None
+
+# A solver for graph, with arbitrary terminals until it is reset.
+def make_solver(graph, algorithm):
+	(solver_class, method) = ALGORITHMS[algorithm]
+	solver = solver_class(graph.with_terminals(graph.labels[1], graph.labels[0]))
+	return (solver, getattr(solver, method))
+
+# Max flow value between nodes s and t, and for every node whether it is on
+# s's side of a minimum cut between them.
+def min_cut_side(solver, solve, s, t):
+	labels = solver.graph.labels
+	solver.reset(labels[s], labels[t])
+	flow_val = solve()
+	return (flow_val, np.array(solver.reachable_from(s), dtype=bool))
+
+def init_worker(graph, algorithm):
+	global worker_solver
+	worker_solver = make_solver(graph, algorithm)
+
+def worker_cut(s, t):
+	return min_cut_side(*worker_solver, s, t)
+
+class GomoryHuTree:
+	def __init__(self, graph, algorithm="dinic", workers=1):
+		if graph.num_nodes < 2:
+			raise ValueError("A cut tree needs at least two nodes")
+		self.graph = graph.undirected()
+		self.labels = graph.labels
+		self.node_mapping = graph.node_mapping
+		n = graph.num_nodes
+		self.parent = np.zeros(n, dtype=np.int64)
+		self.weight = np.zeros(n, dtype=np.int64)
+		# Number of max flows computed, and how many of them were computed
+		# ahead of time and thrown away because the parent had changed.
+		self.num_solves = 0
+		self.num_wasted = 0
+		self.depth = None
+
+		if workers > 1:
+			self.build_parallel(algorithm, workers)
+		else:
+			(solver, solve) = make_solver(self.graph, algorithm)
+			for s in range(1, n):
+				self.add_cut(s, *min_cut_side(solver, solve, s, int(self.parent[s])))
+
+	# Gusfield's update for the minimum cut between s and its parent t, of
+	# value flow_val, with s_side the nodes on s's side.
+	def add_cut(self, s, flow_val, s_side):
+		parent = self.parent
+		t = int(parent[s])
+		self.num_solves += 1
+		self.weight[s] = flow_val
+		moved = s_side & (parent == t)
+		moved[s] = False
+		parent[moved] = s
+		if s_side[parent[t]]:
+			parent[s] = parent[t]
+			parent[t] = s
+			self.weight[s] = self.weight[t]
+			self.weight[t] = flow_val
+
+	def build_parallel(self, algorithm, workers):
+		n = self.graph.num_nodes
+		with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+				initargs=(self.graph, algorithm)) as executor:
+			ahead = collections.OrderedDict()
+			next_s = 1
+			for s in range(1, n):
+				while next_s < n and len(ahead) < 2 * workers:
+					t = int(self.parent[next_s])
+					ahead[next_s] = (t, executor.submit(worker_cut, next_s, t))
+					next_s += 1
+
+				(t, future) = ahead.pop(s)
+				if t != self.parent[s]:
+					future.cancel()
+					self.num_wasted += 1
+					future = executor.submit(worker_cut, s, int(self.parent[s]))
+				self.add_cut(s, *future.result())
+
+	# Depth of every node in the tree, computed on the first query.
+	def node_depths(self):
+		if self.depth is None:
+			parent = self.parent.tolist()
+			depth = [-1] * len(parent)
+			depth[0] = 0
+			for u in range(len(parent)):
+				path = []
+				while depth[u] < 0:
+					path.append(u)
+					u = parent[u]
+				for v in reversed(path):
+					depth[v] = depth[u] + 1
+					u = v
+			self.depth = depth
+		return self.depth
+
+	# The lightest tree edge between the nodes labeled u and v, as the node
+	# below it. Raises ValueError if u and v are the same node.
+	def lightest_edge(self, u, v):
+		u = self.node_mapping[u]
+		v = self.node_mapping[v]
+		if u == v:
+			raise ValueError("Need two different nodes")
+		depth = self.node_depths()
+		parent = self.parent
+		weight = self.weight
+		best = None
+		while u != v:
+			if depth[u] < depth[v]:
+				(u, v) = (v, u)
+			if best is None or weight[u] < weight[best]:
+				best = u
+			u = int(parent[u])
+		return best
+
+	# Value of a minimum cut between the nodes labeled u and v.
+	def min_cut_value(self, u, v):
+		return int(self.weight[self.lightest_edge(u, v)])
+
+	# A minimum cut between the nodes labeled u and v, as its value and the
+	# labels of the nodes on u's side.
+	def min_cut(self, u, v):
+		below = self.lightest_edge(u, v)
+		parent = self.parent.tolist()
+		depth = self.node_depths()
+		# The nodes whose path to the root passes through `below'.
+		in_subtree = [False] * len(parent)
+		in_subtree[below] = True
+		for w in sorted(range(len(parent)), key=depth.__getitem__):
+			if w != below and w != 0 and in_subtree[parent[w]]:
+				in_subtree[w] = True
+		if not in_subtree[self.node_mapping[u]]:
+			in_subtree = [not side for side in in_subtree]
+		side = [self.labels[w] for w in range(len(parent)) if in_subtree[w]]
+		return (int(self.weight[below]), side)
+
+	# The tree edges as (label, parent label, weight) triples.
+	def edges(self):
+		labels = self.labels
+		return [(labels[u], labels[p], w) for (u, (p, w)) in
+				enumerate(zip(self.parent.tolist(), self.weight.tolist())) if u != 0]
+
+	# Minimum cut values between all pairs of nodes, as an n x n matrix in
+	# node order, with zeros on the diagonal. O(n^2).
+	def all_pairs(self):
+		n = self.graph.num_nodes
+		children = [[] for _ in range(n)]
+		for (u, p) in enumerate(self.parent.tolist()):
+			if u != 0:
+				children[p].append(u)
+		weight = self.weight.tolist()
+
+		# The tree as an undirected adjacency list of (neighbor, weight).
+		adjacent = [[(c, weight[c]) for c in children[u]] for u in range(n)]
+		for u in range(1, n):
+			adjacent[u].append((int(self.parent[u]), weight[u]))
+
+		cuts = np.zeros((n, n), dtype=np.int64)
+		for root in range(n):
+			row = cuts[root]
+			seen = [False] * n
+			seen[root] = True
+			stack = [(root, None)]
+			while stack:
+				(u, lightest) = stack.pop()
+				for (v, w) in adjacent[u]:
+					if not seen[v]:
+						seen[v] = True
+						v_lightest = w if lightest is None else min(lightest, w)
+						row[v] = v_lightest
+						stack.append((v, v_lightest))
+		return cuts
+
+if __name__ == "__main__":
+	graph = read_graph(sys.argv[1])
+	algorithm = option_value("--algo", "dinic", str)
+	if algorithm not in ALGORITHMS:
+		print(f"ERROR: Unknown algorithm {algorithm}")
+		exit(1)
+
+	tree = GomoryHuTree(graph, algorithm, option_value("--workers", 1, int))
+	for (u, p, w) in tree.edges():
+		print(u, p, w)
+	print(f"{tree.num_solves} cuts, {tree.num_wasted} computed ahead and redone")
@@ -0,0 +1,314 @@
+import copy
+import collections
+import numpy as np
+
+# Node and arc indices are stored as 32-bit ints, capacities as 64-bit ints.
+INDEX_DTYPE = np.int32
+CAP_DTYPE = np.int64
+
+# Most decimal digits of a capacity in a graph file: every 18-digit number
+# fits in CAP_DTYPE, where longer ones could wrap around.
+MAX_DIGITS = 18
+
+# Residual graph in compressed sparse row (CSR) form, shared by all solvers.
+#
+# Every edge (u, v, c) of the input is stored as a forward arc u -> v with
+# capacity c, paired with a reverse arc v -> u of capacity 0. The arcs
+# leaving node u occupy indices offsets[u] to offsets[u + 1] - 1 of the
+# heads, tails and caps arrays, and rev[a] is the index of the arc paired
+# with arc a. Memory is O(n + m), and a search from u only touches the arcs
+# actually leaving u.
+#
+# The graph itself is read-only: solvers copy self.caps into their own
+# residual capacity array before they start pushing flow.
+#
+# The source and sink are the nodes labeled `source' and `sink', "s" and "t"
+# by default. They are None if the graph has no such node, in which case
+# terminals must be chosen with `with_terminals' before solving.
+class ResidualGraph:
+	def __init__(self, tails, heads, caps, node_mapping, source="s", sink="t"):
+		tails = np.asarray(tails, dtype=INDEX_DTYPE)
+		heads = np.asarray(heads, dtype=INDEX_DTYPE)
+		caps = np.asarray(caps, dtype=CAP_DTYPE)
+
+		self._node_mapping = node_mapping
+		self._labels = [None] * len(node_mapping)
+		for (label, index) in node_mapping.items():
+			self._labels[index] = label
+		self._label_table = None
+
+		self.num_nodes = len(node_mapping)
+		self.num_edges = len(tails)
+		self.num_arcs = 2 * self.num_edges
+		self.source = node_mapping.get(source)
+		self.sink = node_mapping.get(sink)
+
+		# Before sorting, arc 2i is the forward arc of edge i and arc 2i + 1
+		# is its reverse, so the partner of unsorted arc a is a ^ 1.
+		arc_tails = np.empty(self.num_arcs, dtype=INDEX_DTYPE)
+		arc_heads = np.empty(self.num_arcs, dtype=INDEX_DTYPE)
+		arc_caps = np.zeros(self.num_arcs, dtype=CAP_DTYPE)
+		arc_tails[0::2] = tails
+		arc_tails[1::2] = heads
+		arc_heads[0::2] = heads
+		arc_heads[1::2] = tails
+		arc_caps[0::2] = caps
+
+		# A stable sort keeps the arcs of each node in input order.
+		order = np.argsort(arc_tails, kind="stable")
+		position = np.empty(self.num_arcs, dtype=INDEX_DTYPE)
+		position[order] = np.arange(self.num_arcs, dtype=INDEX_DTYPE)
+
+		self.tails = arc_tails[order]
+		self.heads = arc_heads[order]
+		self.caps = arc_caps[order]
+		self.rev = position[order ^ 1]
+		# self.edge_arcs[i] is the forward arc of the i-th input edge.
+		self.edge_arcs = position[0::2]
+
+		self.offsets = np.zeros(self.num_nodes + 1, dtype=np.int64)
+		np.cumsum(np.bincount(self.tails, minlength=self.num_nodes), out=self.offsets[1:])
+
+		# Maps (tail, head) to the forward arcs of those edges; built on first
+		# use.
+		self.edge_index = None
+
+	# A graph from arrays that are already in CSR order, as kept by
+	# graph_cache, without sorting or copying them. The node labels are
+	# given as label_table, the UTF-8 bytes of the labels in node order
+	# separated by "\n", and only decoded when first needed. source and
+	# sink are node numbers, or None.
+	@classmethod
+	def from_csr(cls, label_table, offsets, tails, heads, caps, rev, edge_arcs, source, sink):
+		graph = cls.__new__(cls)
+		graph._labels = None
+		graph._node_mapping = None
+		graph._label_table = label_table
+		graph.num_nodes = len(offsets) - 1
+		graph.num_edges = len(edge_arcs)
+		graph.num_arcs = len(tails)
+		graph.source = source
+		graph.sink = sink
+		graph.offsets = offsets
+		graph.tails = tails
+		graph.heads = heads
+		graph.caps = caps
+		graph.rev = rev
+		graph.edge_arcs = edge_arcs
+		graph.edge_index = None
+		return graph
+
+	# labels[u] is the label of node u, and node_mapping[label] the node with
+	# that label.
+	@property
+	def labels(self):
+		if self._labels is None:
+			table = bytes(self._label_table).decode()
+			self._labels = table.split("\n") if self.num_nodes > 0 else []
+		return self._labels
+
+	@property
+	def node_mapping(self):
+		if self._node_mapping is None:
+			self._node_mapping = dict(zip(self.labels, range(self.num_nodes)))
+		return self._node_mapping
+
+	# The same graph with the nodes labeled source and sink as terminals. The
+	# arrays are shared, not copied.
+	def with_terminals(self, source, sink):
+		if source not in self.node_mapping or sink not in self.node_mapping:
+			raise KeyError(f"No node labeled {source!r} or {sink!r}")
+		graph = copy.copy(self)
+		graph.source = self.node_mapping[source]
+		graph.sink = self.node_mapping[sink]
+		return graph
+
+	# The same graph with every edge undirected: the reverse arc of an edge
+	# gets the edge's capacity too, so flow can cross it either way. Only the
+	# capacity array is copied.
+	def undirected(self):
+		graph = copy.copy(self)
+		graph.caps = self.caps.copy()
+		graph.caps[self.rev[self.edge_arcs]] = self.caps[self.edge_arcs]
+		return graph
+
+	# Forward arcs of the edges (u, v), in input order: more than one for
+	# parallel edges, and none if there is no such edge.
+	def find_edges(self, u, v):
+		if self.edge_index is None:
+			tails = self.tails[self.edge_arcs].tolist()
+			heads = self.heads[self.edge_arcs].tolist()
+			self.edge_index = collections.defaultdict(list)
+			for (pair, arc) in zip(zip(tails, heads), self.edge_arcs.tolist()):
+				self.edge_index[pair].append(arc)
+		return self.edge_index.get((u, v), [])
+
+	# Return a fresh residual capacity array for a solver to work on. Solvers
+	# walk it one arc at a time from Python, where lists index faster than
+	# NumPy arrays.
+	def residual_copy(self):
+		return self.caps.tolist()
+
+# Drop trailing lines that are not edges. The Java mesh generator, for
+# instance, ends every file with "Done Mesh".
+def _strip_trailer(data):
+	data = data.rstrip()
+	while data:
+		line_start = data.rfind(b"\n") + 1
+		if len(data[line_start:].split()) == 3:
+			break
+		data = data[:line_start].rstrip()
+	return data
+
+# Bytes at or below this value (space, tab, CR, LF) separate tokens.
+_SEPARATOR_MAX = ord(" ")
+
+# Start (inclusive) and end (exclusive) positions of every whitespace
+# separated token in buf.
+def _token_bounds(buf):
+	is_sep = np.ones(len(buf) + 2, dtype=np.int8)
+	is_sep[1:-1] = buf <= _SEPARATOR_MAX
+	edges = np.diff(is_sep)
+	return (np.flatnonzero(edges == -1), np.flatnonzero(edges == 1))
+
+# Parse the decimal tokens buf[starts[i]:ends[i]] into integers.
+def _parse_ints(buf, starts, ends, fname):
+	lengths = ends - starts
+	token_offsets = np.zeros(len(starts), dtype=np.int64)
+	np.cumsum(lengths[:-1], out=token_offsets[1:])
+
+	if len(lengths) > 0 and lengths.max() > MAX_DIGITS:
+		raise ValueError(f"{fname}: capacities must have at most {MAX_DIGITS} digits")
+
+	# Position in buf of every digit, and its power of ten within its token.
+	positions = np.arange(int(lengths.sum())) + np.repeat(starts - token_offsets, lengths)
+	digits = buf[positions].astype(CAP_DTYPE) - ord("0")
+	if np.any((digits < 0) | (digits > 9)):
+		raise ValueError(f"{fname}: capacities must be non-negative integers")
+	powers = 10 ** (np.repeat(ends, lengths) - positions - 1).astype(CAP_DTYPE)
+	return np.add.reduceat(digits * powers, token_offsets)
+
+# Labels of up to 8 bytes, such as "s", "l12" or "(3,1)", are packed into a
+# single big-endian uint64 key, left-aligned and zero-padded, so that they
+# can be grouped with an integer sort.
+def _short_label_keys(buf, starts, ends):
+	padded_buf = np.zeros(len(buf) + 8, dtype=np.uint8)
+	padded_buf[:len(buf)] = buf
+	# One unaligned 8-byte word starting at every byte of the file.
+	words = np.ndarray(shape=(len(buf),), dtype=">u8", buffer=padded_buf, strides=(1,))
+	keys = words[starts].astype(np.uint64)
+	unused_bits = ((8 - (ends - starts)) * 8).astype(np.uint64)
+	return (keys >> unused_bits) << unused_bits
+
+# Labels of one longer length are copied into the rows of a byte matrix,
+# viewed as byte strings of that length.
+def _long_label_keys(buf, starts, length):
+	windows = np.lib.stride_tricks.sliding_window_view(buf, length)
+	return np.ascontiguousarray(windows[starts]).view(f"S{length}").ravel()
+
+# Group equal keys with one unstable sort; np.unique would need a slower
+# stable sort to also report first occurrences. Returns the group of every
+# key, and the first key and the value of every group.
+def _group_keys(keys):
+	order = np.argsort(keys)
+	sorted_keys = keys[order]
+	is_new = np.ones(len(keys), dtype=bool)
+	is_new[1:] = sorted_keys[1:] != sorted_keys[:-1]
+	group_starts = np.flatnonzero(is_new)
+	groups = np.empty(len(keys), dtype=INDEX_DTYPE)
+	groups[order] = np.cumsum(is_new) - 1
+	return (groups, np.minimum.reduceat(order, group_starts), sorted_keys[group_starts])
+
+# Intern the label tokens buf[starts[i]:ends[i]]. Returns the list of distinct
+# labels in order of first appearance, and for every token the dense ID of
+# its label in that list. Labels of up to 8 bytes are grouped as uint64 keys,
+# and longer ones separately for every length, so that memory stays in
+# proportion to the bytes of the labels.
+def _intern_labels(buf, starts, ends):
+	if len(starts) == 0:
+		return ([], np.zeros(0, dtype=INDEX_DTYPE))
+
+	lengths = ends - starts
+	short = np.flatnonzero(lengths <= 8)
+	classes = [(short, _short_label_keys(buf, starts[short], ends[short]))]
+	for length in np.unique(lengths[lengths > 8]).tolist():
+		tokens = np.flatnonzero(lengths == length)
+		classes.append((tokens, _long_label_keys(buf, starts[tokens], length)))
+
+	# Group every class, then number all groups by first appearance and
+	# scatter back to tokens.
+	labels = []
+	first_seen = []
+	token_groups = []
+	num_groups = 0
+	for (tokens, keys) in classes:
+		if len(tokens) == 0:
+			continue
+		(groups, first, distinct) = _group_keys(keys)
+		if distinct.dtype != np.uint64:
+			labels += distinct.tolist()
+		else:
+			labels += distinct.astype(">u8").view("S8").tolist()
+		first_seen.append(tokens[first])
+		token_groups.append((tokens, groups + num_groups))
+		num_groups += len(distinct)
+
+	by_appearance = np.argsort(np.concatenate(first_seen))
+	rank = np.empty(num_groups, dtype=INDEX_DTYPE)
+	rank[by_appearance] = np.arange(num_groups, dtype=INDEX_DTYPE)
+	ids = np.empty(len(starts), dtype=INDEX_DTYPE)
+	for (tokens, groups) in token_groups:
+		ids[tokens] = rank[groups]
+	return ([labels[group].decode() for group in by_appearance.tolist()], ids)
+
+# Read a graph file into edge arrays (tails, heads, caps) plus a mapping
+# from node label to dense integer ID.
+#
+# The whole file is read at once and tokenized with NumPy over the raw byte
+# buffer, so spaces, tabs and CRLF line endings all work without the caller
+# naming a delimiter, as does a trailing non-edge line such as "Done Mesh".
+# Labels are interned in bulk, and nodes are numbered in order of first
+# appearance, as the old line-by-line reader did.
+def parse_edges(fname):
+	with open(fname, "rb") as f:
+		buf = np.frombuffer(_strip_trailer(f.read()), dtype=np.uint8)
+
+	(starts, ends) = _token_bounds(buf)
+	if len(starts) % 3 != 0:
+		raise ValueError(f"{fname}: expected lines of the form 'u v capacity'")
+	num_edges = len(starts) // 3
+
+	caps = _parse_ints(buf, starts[2::3], ends[2::3], fname)
+
+	# Tails and heads interleaved, so first appearance follows file order.
+	label_starts = np.empty(2 * num_edges, dtype=np.int64)
+	label_ends = np.empty(2 * num_edges, dtype=np.int64)
+	label_starts[0::2] = starts[0::3]
+	label_starts[1::2] = starts[1::3]
+	label_ends[0::2] = ends[0::3]
+	label_ends[1::2] = ends[1::3]
+	(labels, ids) = _intern_labels(buf, label_starts, label_ends)
+
+	node_mapping = dict(zip(labels, range(len(labels))))
+	return (ids[0::2], ids[1::2], caps, node_mapping)
+
+def read_graph(fname):
+	return ResidualGraph(*parse_edges(fname))
+
+# A graph from a list of [u, v, capacity] edges, as sent in JSON, with the
+# nodes numbered in order of first appearance as in read_graph.
+def graph_from_edges(edges, source="s", sink="t"):
+	node_mapping = {}
+	tails = []
+	heads = []
+	caps = []
+	for edge in edges:
+		if not isinstance(edge, (list, tuple)) or len(edge) != 3:
+			raise ValueError(f"expected edges of the form [u, v, capacity], got {edge!r}")
+		(u, v, cap) = edge
+		if not isinstance(cap, int) or cap < 0:
+			raise ValueError("capacities must be non-negative integers")
+		tails.append(node_mapping.setdefault(str(u), len(node_mapping)))
+		heads.append(node_mapping.setdefault(str(v), len(node_mapping)))
+		caps.append(cap)
+	return ResidualGraph(tails, heads, caps, node_mapping, source, sink)
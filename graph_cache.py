@@ -0,0 +1,190 @@
+import os
+import sys
+import time
+import struct
+import hashlib
+import tempfile
+import numpy as np
+from graph import read_graph, ResidualGraph, INDEX_DTYPE, CAP_DTYPE
+
+# Compiled graph files, cached on disk and memory-mapped.
+#
+# The first time a text graph file is read with `read_graph_cached', the
+# built ResidualGraph is written to the cache directory under the hash of
+# the file's contents. Later reads of the same contents, from any path and
+# any process, map that file with numpy.memmap instead of parsing the text:
+# the CSR arrays are views of the mapped file, shared between processes
+# through the page cache, and the label table is only decoded if labels are
+# asked for. The sharing stops at the solvers, though: MaxFlowSolver copies
+# the arrays it walks into Python lists, so every solving process still
+# holds its own O(m) copy. What the cache saves them is the parsing.
+#
+# A compiled file is a 64-byte header, then the label table and the arrays,
+# each starting on a 64-byte boundary:
+#   header:    MAGIC, then num_nodes, num_edges, the label table's size in
+#              bytes, and the source and sink nodes (-1 if there are none)
+#              as little-endian int64s,
+#   labels:    the node labels in node order, UTF-8, separated by "\n",
+#   offsets:   int64[num_nodes + 1],
+#   tails, heads:  int32[2 * num_edges],
+#   caps:      int64[2 * num_edges],
+#   rev:       int32[2 * num_edges],
+#   edge_arcs: int32[num_edges].
+#
+# Hashing a large file takes a while too, so the hash of every text file is
+# remembered in the cache's "paths" subdirectory, together with its size and
+# modification time, and only computed again when either changes.
+#
+# When the directory grows beyond max_bytes, the least recently used files
+# are deleted; every cache hit refreshes its file's modification time.
+# GRAPH_CACHE_DIR and GRAPH_CACHE_MAX_BYTES override the defaults.
+#
+# Usage: python graph_cache.py FILE ...   (compile files ahead of time)
+
+MAGIC = b"MFGRAPH1"
+HEADER = struct.Struct("<8s5q")
+ALIGN = 64
+
+DEFAULT_DIR = os.environ.get("GRAPH_CACHE_DIR",
+		os.path.join(os.path.expanduser("~"), ".cache", "max_flow_graphs"))
+DEFAULT_MAX_BYTES = int(os.environ.get("GRAPH_CACHE_MAX_BYTES", 4 << 30))
+
+# Type and length of every array after the label table, in file order.
+def _layout(num_nodes, num_edges):
+	return [
+		("offsets", np.int64, num_nodes + 1),
+		("tails", INDEX_DTYPE, 2 * num_edges),
+		("heads", INDEX_DTYPE, 2 * num_edges),
+		("caps", CAP_DTYPE, 2 * num_edges),
+		("rev", INDEX_DTYPE, 2 * num_edges),
+		("edge_arcs", INDEX_DTYPE, num_edges),
+	]
+
+def _aligned(pos):
+	return (pos + ALIGN - 1) // ALIGN * ALIGN
+
+def file_hash(fname):
+	digest = hashlib.blake2b(digest_size=16)
+	with open(fname, "rb") as f:
+		for chunk in iter(lambda: f.read(1 << 20), b""):
+			digest.update(chunk)
+	return digest.hexdigest()
+
+# Content hash of fname, from the remembered hash if the file has not
+# changed since it was computed.
+def cached_file_hash(fname, cache_dir):
+	stat = os.stat(fname)
+	key = hashlib.blake2b(os.path.realpath(fname).encode(), digest_size=16).hexdigest()
+	record_path = os.path.join(cache_dir, "paths", key)
+	stamp = f"{stat.st_size} {stat.st_mtime_ns}"
+	try:
+		with open(record_path) as f:
+			(record_stamp, digest) = f.read().rsplit(" ", 1)
+		if record_stamp == stamp:
+			return digest
+	except (FileNotFoundError, ValueError):
+		pass
+
+	digest = file_hash(fname)
+	os.makedirs(os.path.dirname(record_path), exist_ok=True)
+	def write_record(tmp_path):
+		with open(tmp_path, "w") as f:
+			f.write(f"{stamp} {digest}")
+	_write_atomically(record_path, write_record)
+	return digest
+
+# Write a file with write(path) under a temporary name and rename it, so
+# that other processes never see it half-written.
+def _write_atomically(path, write):
+	(fd, tmp_path) = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+	os.close(fd)
+	try:
+		write(tmp_path)
+		os.replace(tmp_path, path)
+	except BaseException:
+		os.remove(tmp_path)
+		raise
+
+def write_compiled(graph, path):
+	label_table = "\n".join(graph.labels).encode()
+	with open(path, "wb") as f:
+		f.write(HEADER.pack(MAGIC, graph.num_nodes, graph.num_edges, len(label_table),
+				-1 if graph.source is None else graph.source, -1 if graph.sink is None else graph.sink))
+		f.seek(ALIGN)
+		f.write(label_table)
+		for (name, dtype, _) in _layout(graph.num_nodes, graph.num_edges):
+			f.seek(_aligned(f.tell()))
+			f.write(np.ascontiguousarray(getattr(graph, name), dtype=dtype).tobytes())
+
+# Map a compiled graph file. The arrays of the graph are read-only views of
+# the mapping. Raises ValueError if path is not a compiled graph file.
+def load_compiled(path):
+	data = np.memmap(path, dtype=np.uint8, mode="r")
+	if len(data) < HEADER.size:
+		raise ValueError(f"{path}: not a compiled graph file")
+	(magic, num_nodes, num_edges, label_bytes, source, sink) = HEADER.unpack(data[:HEADER.size].tobytes())
+	if magic != MAGIC:
+		raise ValueError(f"{path}: not a compiled graph file")
+
+	label_table = data[ALIGN:ALIGN + label_bytes]
+	pos = ALIGN + label_bytes
+	arrays = {}
+	for (name, dtype, length) in _layout(num_nodes, num_edges):
+		pos = _aligned(pos)
+		end = pos + length * np.dtype(dtype).itemsize
+		if end > len(data):
+			raise ValueError(f"{path}: truncated compiled graph file")
+		arrays[name] = data[pos:end].view(dtype)
+		pos = end
+	return ResidualGraph.from_csr(label_table, source=None if source < 0 else source,
+			sink=None if sink < 0 else sink, **arrays)
+
+# Delete the least recently used files of the cache until it holds at most
+# max_bytes, but never the file `keep'.
+def evict(cache_dir, max_bytes, keep=None):
+	entries = []
+	for f_name in os.listdir(cache_dir):
+		path = os.path.join(cache_dir, f_name)
+		if f_name.endswith(".graph"):
+			try:
+				stat = os.stat(path)
+			except FileNotFoundError:
+				continue
+			entries.append((stat.st_mtime_ns, stat.st_size, path))
+
+	total = sum(size for (_, size, _) in entries)
+	for (_, size, path) in sorted(entries):
+		if total <= max_bytes:
+			break
+		if path == keep:
+			continue
+		try:
+			os.remove(path)
+		except FileNotFoundError:
+			pass
+		total -= size
+
+# Read a text graph file like graph.read_graph, through the cache.
+def read_graph_cached(fname, cache_dir=None, max_bytes=None):
+	cache_dir = DEFAULT_DIR if cache_dir is None else cache_dir
+	max_bytes = DEFAULT_MAX_BYTES if max_bytes is None else max_bytes
+	path = os.path.join(cache_dir, cached_file_hash(fname, cache_dir) + ".graph")
+
+	try:
+		graph = load_compiled(path)
+		os.utime(path)
+		return graph
+	except (FileNotFoundError, ValueError):
+		pass
+
+	graph = read_graph(fname)
+	os.makedirs(cache_dir, exist_ok=True)
+	_write_atomically(path, lambda tmp_path: write_compiled(graph, tmp_path))
+	evict(cache_dir, max_bytes, keep=path)
+	return graph
+
+if __name__ == "__main__":
+	for fname in sys.argv[1:]:
+		start_time = time.time()
+		read_graph_cached(fname)
+		print(f"{fname}: {time.time() - start_time}s")
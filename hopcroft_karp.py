@@ -0,0 +1,307 @@
+import sys
+import collections
+import numpy as np
+from graph import read_graph
+from max_flow_solver import MaxFlowSolver
+from preflow_push import PreflowPushSolver
+
+# A matching-shaped flow network: the source only feeds the left nodes, only
+# the right nodes drain into the sink, and every other edge goes from a left
+# node to a right node with the same capacity, `unit'. Nodes are numbered
+# 0, 1, ... within each side, and left_caps[u] (right_caps[v]) is the total
+# capacity into (out of) left node u (right node v), in units.
+BipartiteInstance = collections.namedtuple("BipartiteInstance", [
+	"unit", "left", "right", "left_caps", "right_caps",
+	"edge_left", "edge_right", "middle_arcs", "source_arcs", "sink_arcs"])
+
+# Recognize a matching-shaped network, looking only at edges of positive
+# capacity, and ignoring edges out of a node that nothing flows into or into
+# a node that nothing flows out of, such as those left behind when
+# `update_edges' removes a source or sink edge; no flow can use them.
+# Returns a BipartiteInstance, or None if the network is not one, or if some
+# source or sink capacity is not a whole number of units. The terminals are
+# the graph's own unless other node numbers are given, and the capacities
+# are too unless an array of capacities of all arcs is given.
+def detect_bipartite(graph, source=None, sink=None, arc_caps=None):
+	s = graph.source if source is None else source
+	t = graph.sink if sink is None else sink
+	arc_caps = graph.caps if arc_caps is None else arc_caps
+	arcs = graph.edge_arcs[arc_caps[graph.edge_arcs] > 0]
+	tails = graph.tails[arcs]
+	heads = graph.heads[arcs]
+	caps = arc_caps[arcs]
+
+	from_s = tails == s
+	to_t = heads == t
+	if np.any(heads == s) or np.any(tails == t) or np.any(from_s & to_t):
+		return None
+
+	# side[v] is 1 for left nodes, 2 for right nodes and 3 for both.
+	side = np.zeros(graph.num_nodes, dtype=np.int8)
+	side[heads[from_s]] |= 1
+	side[tails[to_t]] |= 2
+	middle = ~from_s & ~to_t
+	into = np.bincount(heads, minlength=graph.num_nodes)
+	out_of = np.bincount(tails, minlength=graph.num_nodes)
+	middle &= (into[tails] > 0) & (out_of[heads] > 0)
+	if np.any(side == 3) or np.any(side[tails[middle]] != 1) or np.any(side[heads[middle]] != 2):
+		return None
+
+	middle_caps = caps[middle]
+	unit = int(middle_caps[0]) if len(middle_caps) > 0 else 1
+	if np.any(middle_caps != unit):
+		return None
+
+	left = np.flatnonzero(side == 1)
+	right = np.flatnonzero(side == 2)
+	index = np.zeros(graph.num_nodes, dtype=np.int64)
+	index[left] = np.arange(len(left))
+	index[right] = np.arange(len(right))
+
+	left_caps = np.bincount(index[heads[from_s]], weights=caps[from_s], minlength=len(left)).astype(np.int64)
+	right_caps = np.bincount(index[tails[to_t]], weights=caps[to_t], minlength=len(right)).astype(np.int64)
+	if np.any(left_caps % unit) or np.any(right_caps % unit):
+		return None
+
+	return BipartiteInstance(unit, left, right, left_caps // unit, right_caps // unit,
+			index[tails[middle]], index[heads[middle]], arcs[middle], arcs[from_s], arcs[to_t])
+
+# Hopcroft-Karp for matching-shaped networks, in O(m sqrt(n)) for a unit
+# network. Each phase finds the shortest augmenting paths with one BFS from
+# every left node with spare capacity, then augments along vertex-disjoint
+# shortest paths with a DFS. Source and sink capacities above one unit make
+# this a b-matching, where a node may be matched as many times as it has
+# units of capacity; paths then start and end at any node with units left.
+#
+# Unlike the general solvers, this one does not continue from the current
+# flow: `hopcroft_karp' starts from an empty matching, unless it resumes a
+# solve that ran out of budget, and after `update_edges' it solves the
+# changed instance from scratch. The flow it finds is written back to
+# self.residual, so that min_cut and the rest of MaxFlowSolver work on it.
+class HopcroftKarp(MaxFlowSolver):
+	def __init__(self, graph, tracer=None):
+		self.matched = []
+		super().__init__(graph, tracer)
+
+	def load_graph(self, graph, residual=None):
+		super().load_graph(graph, residual)
+		# The tables of a solve that ran out of budget, to resume it.
+		self.tables = None
+		self.detect_instance()
+
+	def reset(self, source=None, sink=None):
+		super().reset(source, sink)
+		self.detect_instance()
+		self.matched = []
+		self.tables = None
+
+	def flow_changed(self):
+		self.detect_instance()
+		self.matched = []
+		self.tables = None
+
+	# Recognize the instance between the solver's terminals, with its current
+	# capacities.
+	def detect_instance(self):
+		self.instance = detect_bipartite(self.graph, self.source, self.sink, np.asarray(self.caps, dtype=np.int64))
+		if self.instance is None:
+			raise ValueError("Graph is not a bipartite matching instance between these terminals")
+
+	# Shortest-path layers from every left node with units left. dist[u] is
+	# the layer of left node u, and dist_r[v] that of the left nodes from
+	# which right node v was first reached, so that the DFS only goes on
+	# from v when it comes from that layer. Returns both and whether an
+	# augmenting path exists.
+	def bfs_layers(self, cap_l, cap_r, l_off, l_edges, r_off, r_edges, e_left, e_right):
+		matched = self.matched
+		dist = [-1] * len(cap_l)
+		dist_r = [-1] * len(cap_r)
+		queue = collections.deque()
+		for u in range(len(cap_l)):
+			if cap_l[u] > 0:
+				dist[u] = 0
+				queue.append(u)
+
+		found_at = -1
+		scanned = 0
+		while queue:
+			u = queue.popleft()
+			if found_at >= 0 and dist[u] >= found_at:
+				break
+			scanned += l_off[u + 1] - l_off[u]
+			for i in range(l_off[u], l_off[u + 1]):
+				e = l_edges[i]
+				if matched[e]:
+					continue
+				v = e_right[e]
+				if cap_r[v] > 0:
+					found_at = dist[u]
+					continue
+				if dist_r[v] >= 0:
+					continue
+				dist_r[v] = dist[u]
+				scanned += r_off[v + 1] - r_off[v]
+				for j in range(r_off[v], r_off[v + 1]):
+					e2 = r_edges[j]
+					w = e_left[e2]
+					if matched[e2] and dist[w] < 0:
+						dist[w] = dist[u] + 1
+						queue.append(w)
+
+		self.num_searches += 1
+		self.num_arcs_scanned += scanned
+		return (dist, dist_r, found_at >= 0)
+
+	# Find one augmenting path from left node u0 in the layered graph and
+	# augment along it. it_l and it_r are the current-edge pointers of the
+	# phase; nodes found to be dead ends are taken out of the layers.
+	def augment_from(self, u0, dist, dist_r, it_l, it_r, cap_l, cap_r, l_off, l_edges, r_off, r_edges, e_left, e_right):
+		matched = self.matched
+		# Every step is (e, e2, u): from left node u over unmatched edge e
+		# to a right node, then back over its matched edge e2.
+		path = []
+		u = u0
+		while True:
+			advanced = False
+			while it_l[u] < l_off[u + 1]:
+				e = l_edges[it_l[u]]
+				if matched[e]:
+					it_l[u] += 1
+					continue
+				v = e_right[e]
+				if cap_r[v] > 0:
+					matched[e] = True
+					for (e1, e2, _) in path:
+						matched[e1] = True
+						matched[e2] = False
+					cap_r[v] -= 1
+					cap_l[u0] -= 1
+					self.num_augmenting_paths += 1
+					return True
+
+				next_layer = dist[u] + 1
+				if dist_r[v] == dist[u]:
+					while it_r[v] < r_off[v + 1]:
+						e2 = r_edges[it_r[v]]
+						if matched[e2] and dist[e_left[e2]] == next_layer:
+							break
+						it_r[v] += 1
+				if dist_r[v] == dist[u] and it_r[v] < r_off[v + 1]:
+					path.append((e, e2, u))
+					u = e_left[e2]
+					advanced = True
+					break
+				it_l[u] += 1
+
+			if not advanced:
+				dist[u] = -1
+				if not path:
+					return False
+				(e, e2, u) = path.pop()
+				it_r[e_right[e]] += 1
+
+	# Compute a maximum (b-)matching and return the value of the
+	# corresponding maximum flow, or of the matching so far if the budget
+	# runs out first. The budget is checked once per phase.
+	def hopcroft_karp(self, budget=None):
+		self.start_budget(budget)
+		if self.tables is None:
+			inst = self.instance
+			e_left = inst.edge_left.tolist()
+			e_right = inst.edge_right.tolist()
+			(l_off, l_edges) = self.adjacency(inst.edge_left, len(inst.left))
+			(r_off, r_edges) = self.adjacency(inst.edge_right, len(inst.right))
+			self.matched = [False] * len(e_left)
+			self.tables = (inst.left_caps.tolist(), inst.right_caps.tolist(),
+					l_off, l_edges, r_off, r_edges, e_left, e_right)
+		tables = self.tables
+		(cap_l, cap_r, l_off, _, r_off, _, _, _) = tables
+
+		while True:
+			if self.out_of_budget():
+				self.store_flow(cap_l, cap_r)
+				return self.flow_value()
+			start = self.clock()
+			(dist, dist_r, found) = self.bfs_layers(*tables)
+			self.end_phase("bfs", start)
+			if not found:
+				break
+
+			start = self.clock()
+			paths = self.num_augmenting_paths
+			it_l = l_off[:-1]
+			it_r = r_off[:-1]
+			for u in range(len(cap_l)):
+				while dist[u] == 0 and cap_l[u] > 0 and self.augment_from(u, dist, dist_r, it_l, it_r, *tables):
+					pass
+			self.end_phase("augment", start)
+			self.trace("phase", paths=self.num_augmenting_paths - paths)
+
+		self.tables = None
+		self.store_flow(cap_l, cap_r)
+		self.complete = True
+		return self.flow_value()
+
+	# Offsets and edge numbers of the edges at each node of one side, given
+	# the node of every edge on that side.
+	def adjacency(self, edge_nodes, num_nodes):
+		offsets = np.zeros(num_nodes + 1, dtype=np.int64)
+		np.cumsum(np.bincount(edge_nodes, minlength=num_nodes), out=offsets[1:])
+		return (offsets.tolist(), np.argsort(edge_nodes, kind="stable").tolist())
+
+	# Write the flow of the matching into self.residual. The units used at a
+	# node are spread over its source or sink arcs in order, in case there
+	# are parallel ones.
+	def store_flow(self, cap_l, cap_r):
+		inst = self.instance
+		unit = inst.unit
+		residual = np.array(self.caps, dtype=np.int64)
+		rev = self.graph.rev
+
+		flows = np.array(self.matched, dtype=np.int64) * unit
+		residual[inst.middle_arcs] -= flows
+		residual[rev[inst.middle_arcs]] = flows
+
+		left_flow = ((inst.left_caps - np.array(cap_l, dtype=np.int64)) * unit).tolist()
+		right_flow = ((inst.right_caps - np.array(cap_r, dtype=np.int64)) * unit).tolist()
+		index = {int(v): i for (i, v) in enumerate(inst.left.tolist())}
+		index.update({int(v): i for (i, v) in enumerate(inst.right.tolist())})
+		for (arcs, node_of, node_flow) in ((inst.source_arcs, self.graph.heads, left_flow),
+				(inst.sink_arcs, self.graph.tails, right_flow)):
+			for arc in arcs.tolist():
+				i = index[int(node_of[arc])]
+				amount = min(int(residual[arc]), node_flow[i])
+				node_flow[i] -= amount
+				residual[arc] -= amount
+				residual[rev[arc]] += amount
+
+		self.residual = residual.tolist()
+
+	# The matched pairs as (left label, right label, flow) triples.
+	def matching(self):
+		inst = self.instance
+		labels = self.graph.labels
+		pairs = []
+		for (e, is_matched) in enumerate(self.matched):
+			if is_matched:
+				pairs.append((labels[inst.left[inst.edge_left[e]]], labels[inst.right[inst.edge_right[e]]], inst.unit))
+		return pairs
+
+# The solver to use on graph: Hopcroft-Karp if it is matching-shaped, and
+# preflow-push otherwise. Returns the solver and its solve method.
+def solver_for(graph, tracer=None):
+	if detect_bipartite(graph) is not None:
+		solver = HopcroftKarp(graph, tracer)
+		return (solver, solver.hopcroft_karp)
+	solver = PreflowPushSolver(graph, tracer=tracer)
+	return (solver, solver.solve_max_flow)
+
+if __name__ == "__main__":
+	graph = read_graph(sys.argv[1])
+	if detect_bipartite(graph) is None:
+		print("Not a bipartite matching instance")
+		exit(1)
+	hk = HopcroftKarp(graph)
+	print("Max Flow:", hk.hopcroft_karp())
+	print("Matched pairs:", len(hk.matching()))
+	print(hk.stats())
@@ -0,0 +1,51 @@
+import json
+import atexit
+import time
+import collections
+
+# Optional trace of a solver run.
+#
+# Every solver keeps plain integer operation counters (pushes, arcs scanned,
+# ...) that are always on and cost one addition each. Anything more, i.e.
+# trace events and phase timings, only happens when a Tracer is passed to the
+# solver; without one, solvers skip it after a single `is None' test, so no
+# strings or dicts are built in their inner loops.
+#
+# Events are written to `out', if given, as one JSON object per line, e.g.
+#   {"event": "augment", "bottleneck": 3, "length": 5, "arcs_scanned": 40}
+# With timing, the time spent in each named phase of the solver (searches,
+# blocking flows, global relabels, ...) is added up in self.phase_ns. Phases
+# may nest, e.g. global relabels happen inside a preflow-push discharge.
+class Tracer:
+	def __init__(self, out=None, timing=False):
+		self.out = out
+		self.timing = timing
+		self.phase_ns = collections.defaultdict(int)
+		self.event_counts = collections.Counter()
+
+	def event(self, kind, **fields):
+		self.event_counts[kind] += 1
+		if self.out is not None:
+			fields["event"] = kind
+			self.out.write(json.dumps(fields) + "\n")
+
+	# Start time of a phase, to be passed to `end_phase'.
+	def clock(self):
+		return time.perf_counter_ns() if self.timing else 0
+
+	def end_phase(self, name, start):
+		if self.timing:
+			self.phase_ns[name] += time.perf_counter_ns() - start
+
+# Tracer for a solver's command line arguments: "--trace FILE" writes the
+# trace to FILE, which is closed when the script exits, and "--phase-timing"
+# turns on phase timing. None if neither was given.
+def tracer_from_args(args):
+	out = None
+	if "--trace" in args and args.index("--trace") + 1 < len(args):
+		out = open(args[args.index("--trace") + 1], "w")
+		atexit.register(out.close)
+	timing = "--phase-timing" in args
+	if out is None and not timing:
+		return None
+	return Tracer(out, timing)
@@ -0,0 +1,465 @@
+import time
+import collections
+import numpy as np
+from graph import ResidualGraph
+from certificate import verify_flow
+
+# A minimum s-t cut: the labels of the nodes on the source side, the cut
+# edges as (u, v, capacity) label triples, and the total capacity.
+MinCut = collections.namedtuple("MinCut", ["source_side", "edges", "capacity"])
+
+# Bounds on the maximum flow value during a solve: `lower' is the flow that
+# has reached the sink so far, and `upper' the capacity of the best cut seen.
+# Both equal the maximum flow once `complete'.
+Progress = collections.namedtuple("Progress", ["lower", "upper", "complete"])
+
+# Limits on one solve: a number of seconds, a number of operations (arcs
+# scanned, as counted in num_arcs_scanned), and a cancellation token, which
+# is any object with an is_set() method, such as a threading.Event or a
+# multiprocessing.Event set by another thread or process. Any of them may be
+# None. A solver given a budget checks it once per augmenting path or phase,
+# and preflow-push every CHECK_INTERVAL pushes and relabels, so a solve can
+# overrun it by one such step, e.g. a failed search over the whole graph.
+class Budget:
+	def __init__(self, seconds=None, operations=None, cancel=None):
+		self.seconds = seconds
+		self.operations = operations
+		self.cancel = cancel
+		self.deadline = None
+		self.max_operations = None
+
+	# Start counting from now and from the solver's operations so far.
+	def start(self, solver):
+		if self.seconds is not None:
+			self.deadline = time.perf_counter() + self.seconds
+		if self.operations is not None:
+			self.max_operations = solver.operations() + self.operations
+
+	def exhausted(self, solver):
+		return ((self.deadline is not None and time.perf_counter() >= self.deadline)
+				or (self.max_operations is not None and solver.operations() >= self.max_operations)
+				or (self.cancel is not None and self.cancel.is_set()))
+
+# Base class of the max-flow solvers.
+#
+# A solver keeps its own copy of the arc capacities (self.caps) and of the
+# residual capacities (self.residual), both indexed by the arcs of the
+# shared, read-only ResidualGraph. Because that state lives on the solver,
+# solving again after `update_edges' continues from the previous flow
+# instead of starting from zero.
+#
+# Every solve method takes an optional Budget. When the budget runs out, the
+# method stops early and returns the flow that has reached the sink so far,
+# self.complete stays False, and `progress' gives bounds on the maximum
+# flow. Calling the method again, with a new budget or none, continues
+# where it stopped.
+class MaxFlowSolver:
+	# Operation counters reported by `stats', each kept in self.num_<name>.
+	COUNTERS = ("augmenting_paths", "searches", "arcs_scanned")
+
+	# tracer, if given, is an instrumentation.Tracer that receives trace
+	# events and phase timings.
+	def __init__(self, graph, tracer=None):
+		self.tracer = tracer
+		self.num_augmenting_paths = 0
+		self.num_searches = 0
+		self.num_arcs_scanned = 0
+		self.load_graph(graph)
+
+	# Point the solver at `graph'. If residual is given, it is the residual
+	# capacity of every arc of `graph', i.e. a flow to start from; otherwise
+	# the solver starts from zero flow. Subclasses that keep per-node or
+	# per-arc state of their own extend this.
+	def load_graph(self, graph, residual=None):
+		if graph.source is None or graph.sink is None:
+			raise ValueError("Graph has no source or sink; pick them with graph.with_terminals")
+		self.graph = graph
+		self.num_nodes = graph.num_nodes
+		self.source = graph.source
+		self.sink = graph.sink
+
+		# Plain list copies of the CSR arrays, since the solvers walk them
+		# one element at a time. These are private to the solver even when
+		# the graph's arrays are mapped from the graph cache.
+		self.offsets = graph.offsets.tolist()
+		self.heads = graph.heads.tolist()
+		self.tails = graph.tails.tolist()
+		self.rev = graph.rev.tolist()
+		self.caps = graph.residual_copy()
+		self.residual = graph.residual_copy() if residual is None else residual
+
+		# Scratch arrays reused by every search. A node counts as visited in
+		# the current search iff visited[node] == self.stamp, so starting a new
+		# search only needs self.stamp += 1 instead of clearing the array.
+		self.visited = [0] * self.num_nodes
+		self.stamp = 0
+		self.parent_arc = [-1] * self.num_nodes
+		self.start_budget(None)
+		self.complete = False
+		self.upper_bound = None
+
+	# Go back to zero flow, between new terminals if the labels of a source
+	# and sink are given, without rebuilding any of the solver's arrays. This
+	# is how one loaded graph is solved for many (source, sink) pairs.
+	def reset(self, source=None, sink=None):
+		if source is not None:
+			self.source = self.graph.node_mapping[source]
+		if sink is not None:
+			self.sink = self.graph.node_mapping[sink]
+		if self.source == self.sink:
+			raise ValueError("Source and sink must be different nodes")
+		self.residual[:] = self.caps
+		self.complete = False
+		self.upper_bound = None
+
+	# Operations done so far, as counted against a Budget.
+	def operations(self):
+		return self.num_arcs_scanned
+
+	# Called by solve methods before they start. budget may be None.
+	def start_budget(self, budget):
+		self.budget = budget
+		if budget is not None:
+			budget.start(self)
+
+	def out_of_budget(self):
+		return self.budget is not None and self.budget.exhausted(self)
+
+	# The capacities and residual capacities of the arcs, as arrays.
+	def capacity_arrays(self):
+		return (np.asarray(self.caps, dtype=np.int64), np.asarray(self.residual, dtype=np.int64))
+
+	# Net flow into every node, as an array. For a flow this is zero but at
+	# the terminals; for a preflow it is the excess of every node. arrays
+	# are those of `capacity_arrays', if already at hand.
+	def node_excess(self, arrays=None):
+		(caps, residual) = self.capacity_arrays() if arrays is None else arrays
+		net_out = caps - residual
+		totals = np.zeros(len(net_out) + 1, dtype=np.int64)
+		np.cumsum(net_out, out=totals[1:])
+		offsets = self.graph.offsets
+		return totals[offsets[:-1]] - totals[offsets[1:]]
+
+	# Breadth-first distance of every node from the source over arcs with
+	# residual capacity, with num_nodes for the nodes it cannot reach.
+	def source_levels(self):
+		level = [self.num_nodes] * self.num_nodes
+		level[self.source] = 0
+		queue = collections.deque([self.source])
+		while queue:
+			u = queue.popleft()
+			for arc in range(self.offsets[u], self.offsets[u + 1]):
+				v = self.heads[arc]
+				if level[v] == self.num_nodes and self.residual[arc] > 0:
+					level[v] = level[u] + 1
+					queue.append(v)
+		return level
+
+	# Ranks of the nodes for `cut_bound': the source levels, but solvers
+	# with labels of their own may use those instead.
+	def cut_ranks(self):
+		return self.source_levels()
+
+	# The lowest capacity of the cuts S_k = {v : rank[v] <= k}, for
+	# rank[source] <= k < rank[sink], computed for all k at once in O(n + m).
+	# The capacity of a cut is the residual capacity of the arcs leaving it
+	# plus the excess of the nodes outside it, which holds for a preflow as
+	# well as for a flow. Returns None if there is no such cut.
+	def cut_bound(self, rank, arrays=None):
+		arrays = self.capacity_arrays() if arrays is None else arrays
+		residual = arrays[1]
+		graph = self.graph
+		rank = np.asarray(rank, dtype=np.int64)
+		low = rank[self.source]
+		num_cuts = rank[self.sink] - low
+		if num_cuts <= 0:
+			return None
+
+		# An arc from rank a to rank b > a leaves S_k for a <= k < b.
+		tail_ranks = np.clip(rank[graph.tails] - low, 0, num_cuts)
+		head_ranks = np.clip(rank[graph.heads] - low, 0, num_cuts)
+		crossing = (residual > 0) & (tail_ranks < head_ranks)
+		leaving = np.zeros(num_cuts + 1, dtype=np.int64)
+		np.add.at(leaving, tail_ranks[crossing], residual[crossing])
+		np.add.at(leaving, head_ranks[crossing], -residual[crossing])
+
+		# A node of rank r is outside S_k for k < r.
+		outside = np.zeros(num_cuts + 1, dtype=np.int64)
+		np.add.at(outside, np.clip(rank - low, 0, num_cuts), self.node_excess(arrays))
+		outside_after = np.cumsum(outside[::-1])[::-1]
+		return int((np.cumsum(leaving)[:-1] + outside_after[1:]).min())
+
+	# Bounds on the maximum flow. While a solve is incomplete, the upper
+	# bound is the best of the cuts around the source and the sink and the
+	# cuts of `cut_ranks', over every call so far.
+	def progress(self):
+		if self.complete:
+			flow_val = self.flow_value()
+			return Progress(flow_val, flow_val, True)
+
+		arrays = self.capacity_arrays()
+		caps = arrays[0]
+		(s, t) = (self.source, self.sink)
+		bounds = [int(caps[self.offsets[s]:self.offsets[s + 1]].sum()),
+				int(caps[self.graph.rev[self.offsets[t]:self.offsets[t + 1]]].sum()),
+				self.cut_bound(self.cut_ranks(), arrays)]
+		if self.upper_bound is not None:
+			bounds.append(self.upper_bound)
+		self.upper_bound = min(bound for bound in bounds if bound is not None)
+		return Progress(int(self.node_excess(arrays)[t]), self.upper_bound, False)
+
+	# Value of the current flow, i.e. the net flow leaving the source.
+	def flow_value(self):
+		val = 0
+		for arc in range(self.offsets[self.source], self.offsets[self.source + 1]):
+			val += self.caps[arc] - self.residual[arc]
+		return val
+
+	# For every node, whether it can be reached from start along arcs with
+	# residual capacity. One breadth-first search, O(n + m).
+	def reachable_from(self, start):
+		self.stamp += 1
+		stamp = self.stamp
+		visited = self.visited
+		offsets = self.offsets
+		heads = self.heads
+		residual = self.residual
+
+		visited[start] = stamp
+		queue = collections.deque([start])
+		while queue:
+			node = queue.popleft()
+			for arc in range(offsets[node], offsets[node + 1]):
+				next_node = heads[arc]
+				if visited[next_node] != stamp and residual[arc] > 0:
+					visited[next_node] = stamp
+					queue.append(next_node)
+
+		return [mark == stamp for mark in visited]
+
+	# The cut between the nodes for which in_source_side holds and the rest,
+	# with edges and nodes given by their original labels.
+	def describe_cut(self, in_source_side):
+		graph = self.graph
+		in_source_side = np.asarray(in_source_side, dtype=bool)
+		edge_arcs = graph.edge_arcs
+		caps = np.asarray(self.caps, dtype=graph.caps.dtype)[edge_arcs]
+		tails = graph.tails[edge_arcs]
+		heads = graph.heads[edge_arcs]
+
+		crossing = in_source_side[tails] & ~in_source_side[heads] & (caps > 0)
+		labels = graph.labels
+		edges = [(labels[u], labels[v], c) for (u, v, c) in
+			zip(tails[crossing].tolist(), heads[crossing].tolist(), caps[crossing].tolist())]
+		source_side = [labels[u] for u in np.flatnonzero(in_source_side).tolist()]
+		return MinCut(source_side, edges, int(caps[crossing].sum()))
+
+	# Minimum s-t cut of the graph, read off the residual graph: the source
+	# side is every node still reachable from the source. Only valid once the
+	# solver has found a maximum flow.
+	def min_cut(self):
+		return self.describe_cut(self.reachable_from(self.source))
+
+	# Check with certificate.verify_flow that the current flow is a maximum
+	# flow, against the cut given by in_source_side, by default the one of
+	# `min_cut'. Returns the flow value, or raises a CertificateError.
+	def certify(self, in_source_side=None):
+		if in_source_side is None:
+			in_source_side = self.reachable_from(self.source)
+		(caps, residual) = self.capacity_arrays()
+		arcs = self.graph.edge_arcs
+		return verify_flow(self.graph.tails[arcs], self.graph.heads[arcs], caps[arcs],
+				caps[arcs] - residual[arcs], self.source, self.sink, in_source_side)
+
+	# Operation counts so far, plus the time spent in each phase if the
+	# solver is traced with timing on.
+	def stats(self):
+		stats = {name: getattr(self, "num_" + name) for name in self.COUNTERS}
+		if self.tracer is not None and self.tracer.timing:
+			stats["phase_ns"] = dict(self.tracer.phase_ns)
+		return stats
+
+	# Record a trace event, if the solver is traced. Only for events that
+	# are rare next to the work around them; inner loops test self.tracer
+	# themselves, so that the keyword arguments are not built for nothing.
+	def trace(self, kind, **fields):
+		if self.tracer is not None:
+			self.tracer.event(kind, **fields)
+
+	# Start time of a phase for `end_phase', if the solver is traced.
+	def clock(self):
+		return 0 if self.tracer is None else self.tracer.clock()
+
+	def end_phase(self, name, start):
+		if self.tracer is not None:
+			self.tracer.end_phase(name, start)
+
+	# Called after `update_edges' has changed the flow. Solvers that keep
+	# state derived from the flow, such as excesses or heights, refresh it.
+	def flow_changed(self):
+		pass
+
+	# Apply a batch of edge changes, each a (u, v, capacity) triple of node
+	# labels and the new capacity of edge (u, v). Capacity 0 deletes an edge,
+	# and an edge not yet in the graph is inserted. If the batch changes the
+	# same edge more than once, the last change wins. Parallel edges from u
+	# to v count as one: the first gets the new capacity and the others are
+	# set to 0. Where a lower capacity leaves more flow on an edge than it can
+	# carry, the excess is cancelled along residual paths near the edge, so
+	# the next solve continues from a feasible flow close to the previous
+	# optimum.
+	#
+	# A batch does not cost time in proportion to its size: each residual
+	# path of the repair is one BFS, O(n + m), `flow_changed' may rebuild
+	# O(n + m) solver state (preflow-push recomputes its preflow), and any
+	# inserted edge rebuilds the graph and the solver's arrays, O(m). What
+	# the warm start saves is the solve itself, which goes on from the
+	# previous flow instead of from zero. Batching changes keeps the O(m)
+	# work to once per batch.
+	def update_edges(self, changes):
+		latest = {}
+		for (u_label, v_label, capacity) in changes:
+			latest[(u_label, v_label)] = capacity
+
+		new_edges = []
+		# Flow imbalance left at each node by lowering capacities.
+		surplus = collections.defaultdict(int)
+		deficit = collections.defaultdict(int)
+
+		for ((u_label, v_label), capacity) in latest.items():
+			u = self.graph.node_mapping.get(u_label)
+			v = self.graph.node_mapping.get(v_label)
+			arcs = [] if u is None or v is None else self.graph.find_edges(u, v)
+			if not arcs:
+				if capacity > 0:
+					new_edges.append((u_label, v_label, capacity))
+				continue
+
+			for (i, arc) in enumerate(arcs):
+				new_capacity = capacity if i == 0 else 0
+				flow = self.caps[arc] - self.residual[arc]
+				self.caps[arc] = new_capacity
+				if flow <= new_capacity:
+					self.residual[arc] = new_capacity - flow
+				else:
+					self.residual[arc] = 0
+					self.residual[self.rev[arc]] = new_capacity
+					surplus[u] += flow - new_capacity
+					deficit[v] += flow - new_capacity
+
+		if new_edges:
+			self.insert_edges(new_edges)
+		self.restore_conservation(surplus, deficit)
+		self.complete = False
+		self.upper_bound = None
+		self.flow_changed()
+
+	# Rebuild the graph with extra edges, given as (u, v, capacity) label
+	# triples, carrying the current capacities and flow over. This is O(m)
+	# array work, not a new solve.
+	def insert_edges(self, new_edges):
+		graph = self.graph
+		edge_arcs = graph.edge_arcs
+		caps = np.array(self.caps, dtype=graph.caps.dtype)
+		residual = np.array(self.residual, dtype=graph.caps.dtype)
+		edge_caps = caps[edge_arcs]
+		edge_flows = edge_caps - residual[edge_arcs]
+
+		node_mapping = dict(graph.node_mapping)
+		for (u_label, v_label, _) in new_edges:
+			for label in (u_label, v_label):
+				if label not in node_mapping:
+					node_mapping[label] = len(node_mapping)
+
+		tails = np.concatenate([graph.tails[edge_arcs], [node_mapping[e[0]] for e in new_edges]])
+		heads = np.concatenate([graph.heads[edge_arcs], [node_mapping[e[1]] for e in new_edges]])
+		edge_caps = np.concatenate([edge_caps, [e[2] for e in new_edges]])
+		new_graph = ResidualGraph(tails, heads, edge_caps, node_mapping,
+				graph.labels[self.source], graph.labels[self.sink])
+
+		old_edge_arcs = new_graph.edge_arcs[:graph.num_edges]
+		new_residual = new_graph.caps.copy()
+		new_residual[old_edge_arcs] -= edge_flows
+		new_residual[new_graph.rev[old_edge_arcs]] = edge_flows
+		self.load_graph(new_graph, new_residual.tolist())
+
+	# Breadth-first search over arcs with residual capacity from start to the
+	# nearest node for which is_target holds. Returns the path as a list of
+	# arcs, or None.
+	def find_residual_path(self, start, is_target):
+		self.stamp += 1
+		stamp = self.stamp
+		self.visited[start] = stamp
+		queue = collections.deque([start])
+
+		while queue:
+			node = queue.popleft()
+			if node != start and is_target(node):
+				path = []
+				while node != start:
+					arc = self.parent_arc[node]
+					path.append(arc)
+					node = self.tails[arc]
+				path.reverse()
+				return path
+
+			for arc in range(self.offsets[node], self.offsets[node + 1]):
+				next_node = self.heads[arc]
+				if self.visited[next_node] != stamp and self.residual[arc] > 0:
+					self.visited[next_node] = stamp
+					self.parent_arc[next_node] = arc
+					queue.append(next_node)
+
+		return None
+
+	# Push `amount' units along a path of arcs, which must all have at least
+	# that much residual capacity.
+	def push_path(self, path, amount):
+		for arc in path:
+			self.residual[arc] -= amount
+			self.residual[self.rev[arc]] += amount
+
+	# Make flow conserved again at every node but the source and sink, given
+	# the surplus (inflow above outflow) and deficit (outflow above inflow)
+	# left at nodes by cutting flow on edges. Each surplus is sent to the
+	# nearest node that can take it: a node with a deficit, the sink, or back
+	# to the source. Remaining deficits are made up by cancelling flow that
+	# reached the sink. Raises ValueError if some imbalance cannot be
+	# removed, which does not happen for imbalances left by cutting flow.
+	def restore_conservation(self, surplus, deficit):
+		for terminal in (self.source, self.sink):
+			surplus.pop(terminal, None)
+			deficit.pop(terminal, None)
+		# A node that lost both inflow and outflow only has to get rid of
+		# the difference.
+		for node in set(surplus) & set(deficit):
+			net = surplus[node] - deficit[node]
+			surplus[node] = max(net, 0)
+			deficit[node] = max(-net, 0)
+
+		def is_outlet(node):
+			return deficit.get(node, 0) > 0 or node == self.sink or node == self.source
+
+		for u in list(surplus):
+			while surplus[u] > 0:
+				path = self.find_residual_path(u, is_outlet)
+				if path is None:
+					raise ValueError(f"No residual path to take the surplus of node {self.graph.labels[u]!r}")
+				end = self.heads[path[-1]]
+				amount = min(surplus[u], min(self.residual[arc] for arc in path))
+				if end != self.sink and end != self.source:
+					amount = min(amount, deficit[end])
+					deficit[end] -= amount
+				self.push_path(path, amount)
+				surplus[u] -= amount
+
+		for v in list(deficit):
+			while deficit[v] > 0:
+				path = self.find_residual_path(self.sink, lambda node: node == v)
+				if path is None:
+					path = self.find_residual_path(self.source, lambda node: node == v)
+				if path is None:
+					raise ValueError(f"No residual path to make up the deficit of node {self.graph.labels[v]!r}")
+				amount = min(deficit[v], min(self.residual[arc] for arc in path))
+				self.push_path(path, amount)
+				deficit[v] -= amount
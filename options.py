@@ -0,0 +1,10 @@
+import sys
+
+# Command line options shared by the scripts, which parse sys.argv by hand.
+
+# Value of a --name option on the command line, or default.
+def option_value(name, default, convert):
+	args = sys.argv[1:]
+	if name in args and args.index(name) + 1 < len(args):
+		return convert(args[args.index(name) + 1])
+	return default
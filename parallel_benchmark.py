@@ -0,0 +1,163 @@
+import os
+import csv
+import json
+import signal
+import time
+import concurrent.futures
+from benchmark import run_ff, run_sff, run_pfp, run_dinic, run_bk
+from options import option_value
+
+# Parallel version of the benchmark sweep in benchmark.py. Every (file,
+# algorithm) pair is a separate job on a process pool, so one slow solver on
+# a large graph only holds up its own worker, and the sweep uses every core.
+# Results are written to the same CSV and stats files, with the same
+# columns, as the serial sweep; the stats of a job that timed out are null.
+#
+# Usage: python parallel_benchmark.py [--workers N] [--timeout SECONDS] [--data-dir DIR]
+
+# Algorithms in the order of their columns in the CSV files.
+RUNNERS = {"ff": run_ff, "sff": run_sff, "pfp": run_pfp, "dinic": run_dinic, "bk": run_bk}
+
+# Algorithms that only run on the mesh family, as in the serial sweep.
+MESH_ONLY = ("bk",)
+
+# Written in place of the time, and with an empty flow value, for a job that
+# ran out of time.
+TIMEOUT = "timeout"
+
+DEFAULT_TIMEOUT = 600
+
+def bipartite_params(params):
+	# "output_bipartite_${nodes_source}_${nodes_sink}_${maxProbability}.txt"
+	return [int(params[0]), int(params[1]), float(params[2])]
+
+def fixeddegree_params(params):
+	# "output_fixeddegree_${nodes_source}_${edges}_${minCapacity}_${maxCapacity}.txt"
+	return [int(params[0]), int(params[1]), int(params[2]), int(params[3])]
+
+def mesh_params(params):
+	# "output_mesh_${rows}_${columns}.txt"
+	return [int(params[0]), int(params[1])]
+
+def random_params(params):
+	# "output_random_${nodes_source}_${dense}_${minCapacity}_${maxCapacity}.txt"
+	return [int(params[0]), int(params[1]), int(params[2])]
+
+# CSV file, example directory within the data directory and file name
+# parser of each graph family.
+FAMILIES = [
+	("bipartite_benchmark.csv", "bipartite_examples", bipartite_params),
+	("fixeddegree_benchmark.csv", "fixeddegree_examples", fixeddegree_params),
+	("mesh_benchmark.csv", "mesh_examples", mesh_params),
+	("random_benchmark.csv", "random_examples", random_params),
+]
+
+class JobTimeout(Exception):
+	pass
+
+def raise_timeout(signum, frame):
+	raise JobTimeout()
+
+# Run one algorithm on one file in a worker process. Returns (time, flow val,
+# stats), or None if the job took longer than timeout seconds, wall-clock,
+# including reading the graph.
+def run_job(algo, filename, timeout):
+	signal.signal(signal.SIGALRM, raise_timeout)
+	# The alarm can go off while it is being disarmed, so the timeout is
+	# caught outside the finally clause as well.
+	try:
+		signal.setitimer(signal.ITIMER_REAL, timeout)
+		try:
+			return RUNNERS[algo](filename)
+		finally:
+			signal.setitimer(signal.ITIMER_REAL, 0)
+	except JobTimeout:
+		return None
+
+# The algorithms run on the files of the family with CSV file csv_name.
+def family_algos(csv_name):
+	return [algo for algo in RUNNERS if algo not in MESH_ONLY or csv_name == "mesh_benchmark.csv"]
+
+# Every benchmark file in data_dir, as (csv name, file name, params), in the
+# order the serial sweep visits them.
+def list_files(data_dir):
+	files = []
+	for (csv_name, example_dir, parse_params) in FAMILIES:
+		example_dir = os.path.join(data_dir, example_dir)
+		for f_name in os.listdir(example_dir):
+			full_name = os.path.join(example_dir, f_name)
+			if os.path.isfile(full_name):
+				stem = os.path.splitext(f_name)[0]
+				files.append((csv_name, full_name, parse_params(stem.split("_")[2:])))
+	return files
+
+# Run every job and return a dict from (algo, file name) to its result.
+# Larger files are submitted first, so that the longest jobs do not end up
+# running alone at the end of the sweep.
+def run_all(files, workers, timeout):
+	files = sorted(files, key=lambda file: os.path.getsize(file[1]), reverse=True)
+	results = {}
+	with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+		futures = {}
+		for (csv_name, name, _) in files:
+			for algo in family_algos(csv_name):
+				futures[executor.submit(run_job, algo, name, timeout)] = (algo, name)
+
+		for future in concurrent.futures.as_completed(futures):
+			(algo, name) = futures[future]
+			results[(algo, name)] = future.result()
+			if results[(algo, name)] is None:
+				print(f"{algo} timed out after {timeout}s on {name}")
+			else:
+				print(f"{algo} finished {name} in {results[(algo, name)][0]}")
+	return results
+
+# Check that every algorithm that finished on a file found the same flow val.
+def cross_check(files, results):
+	ok = True
+	for (csv_name, name, _) in files:
+		flow_vals = {algo: results[(algo, name)][1] for algo in family_algos(csv_name)
+				if results[(algo, name)] is not None}
+		if len(set(flow_vals.values())) > 1:
+			ok = False
+			print(f"ERROR: Algorithms calculate different flow vals on graph {name}")
+			for (algo, flow_val) in flow_vals.items():
+				print(f"ERROR: {algo.upper()} gives flow val of {flow_val}")
+	return ok
+
+# Write the CSV files, and next to each the stats file with a JSON line of
+# operation counts for every row, as benchmark.write_stats does; solve.py
+# matches the two up by line.
+def write_csvs(files, results):
+	rows = {csv_name: [] for (csv_name, _, _) in FAMILIES}
+	stats = {csv_name: [] for (csv_name, _, _) in FAMILIES}
+	for (csv_name, name, params) in files:
+		row = list(params)
+		file_stats = {"file": name}
+		for algo in family_algos(csv_name):
+			res = results[(algo, name)]
+			row += [TIMEOUT, ""] if res is None else [res[0], res[1]]
+			file_stats[algo] = None if res is None else res[2]
+		rows[csv_name].append(row)
+		stats[csv_name].append(file_stats)
+
+	for (csv_name, csv_rows) in rows.items():
+		with open(csv_name, "w+") as csvfile:
+			csv.writer(csvfile).writerows(csv_rows)
+		with open(csv_name[:-len(".csv")] + "_stats.jsonl", "w+") as stats_file:
+			for file_stats in stats[csv_name]:
+				stats_file.write(json.dumps(file_stats) + "\n")
+
+if __name__ == "__main__":
+	workers = option_value("--workers", os.cpu_count(), int)
+	timeout = option_value("--timeout", DEFAULT_TIMEOUT, float)
+
+	files = list_files(option_value("--data-dir", "data_test", str))
+	start_time = time.time()
+	results = run_all(files, workers, timeout)
+	print(f"Ran {len(results)} jobs on {workers} workers in {time.time() - start_time}s")
+
+	if not cross_check(files, results):
+		print("PANICKING.")
+		exit(1)
+	write_csvs(files, results)
@@ -1,171 +1,173 @@
 import sys
-import heapq
 import time
-import pprint
 import collections
-import time
+from graph import read_graph
+from max_flow_solver import MaxFlowSolver
+from instrumentation import tracer_from_args
+
+# Pushes and relabels between two checks of a solve's budget.
+CHECK_INTERVAL = 256
+
+class PreflowPushSolver(MaxFlowSolver):
+	COUNTERS = ("arcs_scanned", "pushes", "saturating_pushes", "nonsaturating_pushes",
+			"relabels", "global_relabels", "gaps", "bucket_scans")
 
-# Delimiter is space in all file types except bipartite, where it is tab.
-def file_to_adjmat(fname, delimiter=' '):
-	with open(fname, "r") as f:
-		line = f.readline()
-		node_to_index = {}
-		edges = {}
-		index = 0
-
-		# This accounts for weird case where last line of mesh graph files
-		# as generated by Java code is "Done Mesh\n".
-		while line and line != "Done Mesh\n":
-			fields = list(filter(None, line.split(delimiter)))
-			if fields[0] not in node_to_index:
-				node_to_index[fields[0]] = index
-				edges[index] = {}
-				index += 1
-			if fields[1] not in node_to_index:
-				node_to_index[fields[1]] = index
-				edges[index] = {}
-				index += 1
-
-			src_ind = node_to_index[fields[0]]
-			dst_ind = node_to_index[fields[1]]
-			edges[src_ind][dst_ind] = int(fields[2])
-			line = f.readline()
-
-		adj_mat = [[0 for i in range(index)] for i in range(index)]
-		for (src, dst_dict) in edges.items():
-			for (dst, cap) in dst_dict.items():
-				adj_mat[src][dst] = cap
-
-		src = node_to_index['s']
-		sink = node_to_index['t']
-		return (src, sink, adj_mat)
-
-class PreflowPushSolver:
-	def __init__(self, adj_mat, source, sink, debug=False):
-		self.source = source
-		self.sink = sink
-		self.caps = adj_mat
+	# With global_relabel, heights are set to exact distances to the sink
+	# (by a reverse BFS) before solving and again after every n relabels.
+	# With gap_heuristic, whenever no node is left at some height h < n,
+	# every node between h and n is lifted to n, since none of them can
+	# reach the sink any more.
+	def __init__(self, graph, debug=False, global_relabel=True, gap_heuristic=True, tracer=None):
 		self.debug = debug
-		self.vertices = [i for i in range(len(adj_mat))]
+		self.use_global_relabel = global_relabel
+		self.use_gap_heuristic = gap_heuristic
+
+		# Operation counts, reported so heuristics can be compared.
+		self.num_pushes = 0
+		self.num_saturating_pushes = 0
+		self.num_nonsaturating_pushes = 0
+		self.num_relabels = 0
+		self.num_global_relabels = 0
+		self.num_gaps = 0
+		# Heights whose list of nodes with excess was looked at by
+		# `find_pushable_node'.
+		self.num_bucket_scans = 0
+		self.relabels_since_global = 0
+
+		# The arcs leaving u are offsets[u] to offsets[u + 1] - 1. Arc a
+		# points to heads[a], and rev[a] is its paired reverse arc.
+		# self.residual[a] is the remaining capacity of arc a. Flow over an
+		# edge (u, v) is the residual capacity of its reverse arc (v, u).
+		# These are all set up by MaxFlowSolver.
+		super().__init__(graph, tracer)
+		self.init_preflow()
 
-		# self.flow[u][v] defines the current flow over edge [u][v]
-		self.flow = collections.defaultdict(dict)
+	def load_graph(self, graph, residual=None):
+		super().load_graph(graph, residual)
+		n = graph.num_nodes
+		self.vertices = range(n)
+
+		# Per-node state lives in flat lists indexed by node, like the
+		# residual capacities in MaxFlowSolver.
+		#
 		# self.excess[u] defines the current excess flow at node u.
 		# I.e. the difference between inflow and outflow at node u.
-		self.excess = collections.defaultdict(int)
-		# self.neighbors[u] gives a list of all neighbors of node u,
-		# i.e. all nodes v s.t. (u, v) or (v, u) is an edge.
-		self.neighbors = collections.defaultdict(list)
+		self.excess = [0] * n
 		
 		# As described in textbook, it is preferable that, when we 
 		# repeatedly push excess from a node v, we push it from the
-		# same neighbor. self.current_neighbor[u] gives the last
-		# neighbor of u to which u pushed excess.
-		self.current_neighbor = collections.defaultdict(int)
+		# same neighbor. self.current_neighbor[u] gives the position,
+		# among the arcs leaving u, of the last arc over which u pushed
+		# excess.
+		self.current_neighbor = [0] * n
 		# self.height[u] stores the current height of a node u.
-		self.height = {}
-		# self.nodes_with_excess[h] contains a doubly-linked list of
-		# all nodes which currently have positive excess and a height
-		# of h.
-		self.nodes_with_excess = []
+		self.height = [0] * n
+		# The nodes which currently have positive excess and a height of h
+		# form a linked list, in the order they got there, that starts at
+		# first_active[h], ends at last_active[h] and goes on from node v at
+		# next_active[v]. -1 marks an empty list or its end. Nodes only
+		# ever leave a list from the front, so no back links are needed.
+		# NOTE: height is upper bounded by 2n, as described in textbook.
+		self.first_active = [-1] * (2 * n)
+		self.last_active = [-1] * (2 * n)
+		self.next_active = [-1] * n
 		# self.current_max_height is the maximum height of any node in
 		# the graph at any given time.
 		self.current_max_height = 0
-		self.pp = pprint.PrettyPrinter(indent=4)
+		# self.height_count[h] is the number of nodes, with or without
+		# excess, at height h. Used to detect gaps.
+		self.height_count = [0] * (2 * n)
+		# Set when the flow was changed from outside, so that the heights
+		# may no longer be valid and must be recomputed before solving.
+		self.labels_stale = residual is not None
+		self.reset_heights()
 
-		for src in self.vertices:
-			self.flow[src] = {}
-			self.height[src] = len(self.vertices) if src == source else 0
+	# Start every node at height 0, and the source at height n.
+	def reset_heights(self):
+		n = len(self.vertices)
+		self.height[:] = [0] * n
+		self.height[self.source] = n
+		self.height_count[:] = [0] * (2 * n)
+		self.height_count[0] = n - 1
+		self.height_count[n] = 1
+		self.current_neighbor[:] = [0] * n
+		self.relabels_since_global = 0
 
-			for (dst, capacity) in enumerate(self.caps[src]):
-				if self.caps[src][dst] != 0:
-					self.flow[src][dst] = capacity if src == source else 0
-					self.neighbors[src].append(dst)
-					self.neighbors[dst].append(src)
-					self.excess[src] -= self.flow[src][dst]
-					self.excess[dst] += self.flow[src][dst]
+	def reset(self, source=None, sink=None):
+		super().reset(source, sink)
+		self.reset_heights()
+		self.labels_stale = False
+		self.init_preflow()
 
+	# Append v to the list of nodes with excess at its height.
+	def add_active(self, v):
+		h = self.height[v]
+		self.next_active[v] = -1
+		if self.last_active[h] < 0:
+			self.first_active[h] = v
+		else:
+			self.next_active[self.last_active[h]] = v
+		self.last_active[h] = v
 
-		# NOTE: height is upper bounded by 2n, as described in textbook.
-		for i in range(2*len(self.vertices)):
-			self.nodes_with_excess.append(collections.deque())
-		
-		for vertex in self.vertices:
-			if self.excess[vertex] > 0 and vertex != self.sink:
-				v_height = self.height[vertex]
-				self.nodes_with_excess[v_height].append(vertex)
-	
-	# Print a string if solver is in debug mode.
-	def print_if_debugging(self, string):
-		if self.debug:
-			print(string)
-	
-	# Ensures that currnet flow does not violate capacity or balance conditions.
-	def sanity_check_flow(self):
-		inflow = {}
-		outflow = {}
-		error = False
-		for (v, outflows) in self.flow.items():
-			if v not in outflow:
-				outflow[v] = 0
-			for (dst, val) in outflows.items():
-				if val > self.caps[v][dst]:
-					print(f"ERROR: Edge ({v}, {dst}) violates capacity.")
-					print(f"Capacity is self.caps[v][dst]. Flow is {val}.")
-					error = True
-				if dst not in inflow:
-					inflow[dst] = 0
-				inflow[dst] += val
-				outflow[v] += val
-			
-		for v in self.flow.keys():
-			if v not in [self.source, self.sink] and inflow[v] != outflow[v]:
-				print(f"ERROR: Node {v} violates balance.")
-				print(f"Inflow is {inflow[v]}. Outflow is {outflow[v]}.")
-				error = True
-
-		if outflow[self.source] != inflow[self.sink]:
-			print(f"ERROR: Source has outflow of {outflow[self.source]}. "
-					"Sink has inflow of {inflow[self.sink]}")
-			error = True
-
-		if error:
-			print("Error detected. Exiting.")
-			exit(1)
+	# Empty the lists of nodes with excess and refill them from self.excess.
+	# Returns the number of nodes with excess.
+	def rebuild_active(self):
+		n = len(self.vertices)
+		self.first_active[:] = [-1] * (2 * n)
+		self.last_active[:] = [-1] * (2 * n)
+		self.current_max_height = 0
+		excess = self.excess
+		height = self.height
+		active = 0
+		for v in self.vertices:
+			if excess[v] > 0 and v != self.sink and v != self.source:
+				self.add_active(v)
+				self.current_max_height = max(self.current_max_height, height[v])
+				active += 1
+		return active
+
+	# Turn the current flow into a preflow to start pushing from: recompute
+	# every excess from the residual capacities, then saturate every arc
+	# leaving the source. On a fresh solver the flow is zero; after
+	# `update_edges' this re-injects flow wherever the updates left room.
+	def init_preflow(self):
+		self.excess[:] = self.node_excess().tolist()
+
+		# Saturate every arc leaving the source.
+		for arc in range(self.offsets[self.source], self.offsets[self.source + 1]):
+			delta = self.residual[arc]
+			self.residual[arc] = 0
+			self.residual[self.rev[arc]] += delta
+			self.excess[self.source] -= delta
+			self.excess[self.heads[arc]] += delta
+
+		self.rebuild_active()
+
+	def flow_changed(self):
+		self.init_preflow()
+		self.labels_stale = True
 	
-	# Determine value of self.flow (i.e. outflow from source).
+	# Determine value of the current flow (i.e. net outflow from source).
 	def get_flow_val(self):
-		val = 0
-		for node in self.neighbors[self.source]:
-			val += self.flow[self.source][node]
-		return val
+		return self.flow_value()
 	
-	# Calculate remaining capacity over edge (v, w).
-	def remaining_cap(self, v, w):
-		return self.caps[v][w] - self.flow[v][w]
-
-	# Push as much flow as possible along some edge (v, w) in the residual
-	# graph. v is assumed to be a node with height of self.current_max_height,
-	# as selected by `find_pushable_node' function. w is assumed to be a neighbor
-	# of v. direction is "FW" is (v, w) is forward edge in residual graph,
-	# "BW" if it is backwards edge.
-	def push(self, v, w, direction):
-		delta = None
-		saturating = None
-		# If (v,w) is forward edge in G_f.
-		if direction == "FW":
-			delta = min(self.excess[v], self.caps[v][w] - self.flow[v][w])
-			saturating = (delta == self.caps[v][w] - self.flow[v][w])
-			self.flow[v][w] += delta
-
-		# If (v,w) is backwards edge in G_f.
-		elif direction == "BW":
-			# There is edge from (w, v) with flow flow[w][v]
-			delta = min(self.excess[v], self.flow[w][v])
-			saturating = (delta == self.flow[w][v])
-			self.flow[w][v] -= delta
+	# Push as much flow as possible along some arc of the residual graph,
+	# leaving v. v is assumed to be a node with height of
+	# self.current_max_height, as selected by `find_pushable_node' function.
+	# The arc may be the forward arc of an edge (v, w) or the reverse arc
+	# of an edge (w, v); both are handled identically.
+	def push(self, v, arc):
+		self.num_pushes += 1
+		w = self.heads[arc]
+		delta = min(self.excess[v], self.residual[arc])
+		saturating = (delta == self.residual[arc])
+		self.residual[arc] -= delta
+		self.residual[self.rev[arc]] += delta
 		
-		self.print_if_debugging(f"Pushing {delta} from {v} to {w}")
+		if self.debug:
+			print(f"Pushing {delta} from {v} to {w}")
+		if self.tracer is not None:
+			self.tracer.event("push", node=v, to=w, amount=delta, saturating=saturating)
 
 		# Note that, regardless of whether edge is backwards or forwards,
 		# the excess decreases at v and increases at w.
@@ -174,88 +176,244 @@ class PreflowPushSolver:
 		self.excess[w] += delta
 
 		if old_excess_w == 0 and w != self.sink:
-			w_height = self.height[w]
-			self.nodes_with_excess[w_height].append(w)
+			self.add_active(w)
 
-		# If v no longer has excess, then remove it from `nodes_with_excess' list.
-		# We know v is first element in  self.nodes_with_excess[self.current_max_height], 		 # because it is chosen this way by `find_pushable_node' function as invoked in
-		# the `solve_max_flow' function.
+		# If v no longer has excess, then remove it from its list of nodes
+		# with excess. We know v is first in the list at
+		# self.current_max_height, because it is chosen this way by
+		# `find_pushable_node' function as invoked in `discharge'.
 		if self.excess[v] == 0:
-			self.nodes_with_excess[self.current_max_height].popleft()
+			h = self.current_max_height
+			self.first_active[h] = self.next_active[v]
+			if self.first_active[h] < 0:
+				self.last_active[h] = -1
 
 		if saturating:
+			self.num_saturating_pushes += 1
 			self.current_neighbor[v] += 1
+		else:
+			self.num_nonsaturating_pushes += 1
 
-	# Increase height of node v, which is assumed to be the first element with
-	# excess at height self.current_max_height in self.nodes_with_excess, as
-	# selected by `find_pushable_node'
+	# Lift node v, which is assumed to be the first node with excess at
+	# height self.current_max_height, as selected by `find_pushable_node',
+	# to one above its lowest residual neighbor.
 	def relabel(self, v):
-		self.print_if_debugging(f"Relabeling {v} to height {self.height[v] + 1}")
-		self.height[v] += 1
-		self.nodes_with_excess[self.current_max_height].popleft()
-		self.current_max_height += 1
-		self.nodes_with_excess[self.current_max_height].append(v)
+		old_height = self.height[v]
+		new_height = 1 + min(self.height[self.heads[arc]]
+				for arc in range(self.offsets[v], self.offsets[v + 1])
+				if self.residual[arc] > 0)
+		if self.debug:
+			print(f"Relabeling {v} to height {new_height}")
+		if self.tracer is not None:
+			self.tracer.event("relabel", node=v, old_height=old_height, new_height=new_height)
+		self.num_relabels += 1
+		self.num_arcs_scanned += self.offsets[v + 1] - self.offsets[v]
+		self.relabels_since_global += 1
+
+		self.first_active[old_height] = self.next_active[v]
+		if self.first_active[old_height] < 0:
+			self.last_active[old_height] = -1
+		self.height_count[old_height] -= 1
+		self.height[v] = new_height
+		self.height_count[new_height] += 1
+		self.add_active(v)
+		self.current_max_height = new_height
 		self.current_neighbor[v] = 0
 
-	# Find a node of maximum height from self.nodes_with_excess[self.current_max_height].
-	# If one does not exist, decrement current max height until one is found. (Though,
-	# if such a node exists, we will only need to decrement once, as proven in textbook.)
-	def find_pushable_node(self):
+		if (self.use_gap_heuristic and self.height_count[old_height] == 0
+				and old_height < len(self.vertices)):
+			self.lift_above_gap(old_height)
+
+	# No node is left at height `gap', so no node above it (and below n) can
+	# reach the sink. Lift all of them to height n, where they can only
+	# return their excess to the source.
+	def lift_above_gap(self, gap):
+		n = len(self.vertices)
+		self.num_gaps += 1
+		self.trace("gap", height=gap)
+		for v in self.vertices:
+			if gap < self.height[v] < n:
+				self.height_count[self.height[v]] -= 1
+				self.height_count[n] += 1
+				self.height[v] = n
+				self.current_neighbor[v] = 0
+
+		# Move the lists of nodes with excess above the gap to the end of
+		# the one at height n.
+		first_active = self.first_active
+		last_active = self.last_active
+		for h in range(gap + 1, n):
+			if first_active[h] >= 0:
+				if last_active[n] < 0:
+					first_active[n] = first_active[h]
+				else:
+					self.next_active[last_active[n]] = first_active[h]
+				last_active[n] = last_active[h]
+				first_active[h] = last_active[h] = -1
+		if first_active[n] >= 0:
+			self.current_max_height = max(self.current_max_height, n)
+
+	# Set every height to its exact distance to the sink in the residual
+	# graph, or, for nodes that can no longer reach the sink, to n plus their
+	# distance to the source. Found with two BFS passes over reverse residual
+	# arcs, after which the excess buckets are rebuilt.
+	def global_relabel(self):
+		n = len(self.vertices)
+		self.num_global_relabels += 1
+		self.relabels_since_global = 0
+		start = self.clock()
+
+		self.height[:] = [2 * n - 1] * n
+		self.height[self.sink] = 0
+		self.height[self.source] = n
+
+		for root in (self.sink, self.source):
+			queue = collections.deque([root])
+			while queue:
+				w = queue.popleft()
+				next_height = self.height[w] + 1
+				self.num_arcs_scanned += self.offsets[w + 1] - self.offsets[w]
+				for arc in range(self.offsets[w], self.offsets[w + 1]):
+					u = self.heads[arc]
+					if self.height[u] == 2 * n - 1 and self.residual[self.rev[arc]] > 0:
+						self.height[u] = next_height
+						queue.append(u)
+
+		self.height_count[:] = [0] * (2 * n)
+		for h in self.height:
+			self.height_count[h] += 1
+		self.current_neighbor[:] = [0] * n
+		active = self.rebuild_active()
+		self.end_phase("global_relabel", start)
+		if self.tracer is not None:
+			self.tracer.event("global_relabel", active=active)
+
+	# Find a node of maximum height from the nodes with excess at
+	# self.current_max_height. If one does not exist, decrement current max
+	# height until one is found. (Though, if such a node exists, we will only
+	# need to decrement once, as proven in textbook.) Nodes at height_limit or
+	# above are ignored.
+	def find_pushable_node(self, height_limit=None):
+		if height_limit is not None:
+			self.current_max_height = min(self.current_max_height, height_limit - 1)
+		first_active = self.first_active
 		while self.current_max_height >= 0:
-			if len(self.nodes_with_excess[self.current_max_height]) > 0:
-				return self.nodes_with_excess[self.current_max_height][0]
+			self.num_bucket_scans += 1
+			if first_active[self.current_max_height] >= 0:
+				return first_active[self.current_max_height]
 			self.current_max_height -= 1
 		return None
 
-	# Find a neighbor of v using current neighbor pointer.
-	# For neighbor w, return ("FW", w) if (v, w) is selected edge in graph
-	# and ("BW", v) if (w, v) is selected edge in graph.
+	# Find an arc leaving v over which v can push, using current neighbor
+	# pointer. Return None if there is no such arc.
 	def find_neighbor_for_push(self, v):
 		# 0 is minimum height, so if v has height 0, it can have no
 		# neighbors with lower heights.
-		if self.height[v] == 0:
+		height = self.height
+		v_height = height[v]
+		if v_height == 0:
 			return None
 
-		current = self.current_neighbor[v]
-		for i in range(current, len(self.neighbors[v])):
-			w = self.neighbors[v][i]
-			if self.caps[v][w] > 0:
-				if self.height[w] < self.height[v] and self.remaining_cap(v, w) > 0:
-					return ("FW", w)
-			
-			if self.caps[w][v] > 0:
-				if self.height[w] < self.height[v] and self.flow[w][v] > 0:
-					return ("BW", w)
-				
-			self.current_neighbor[v] += 1
+		residual = self.residual
+		heads = self.heads
+		base = self.offsets[v]
+		first = base + self.current_neighbor[v]
+		last = self.offsets[v + 1]
+		for arc in range(first, last):
+			if residual[arc] > 0 and height[heads[arc]] < v_height:
+				self.current_neighbor[v] = arc - base
+				self.num_arcs_scanned += arc + 1 - first
+				return arc
 
+		self.current_neighbor[v] = last - base
+		self.num_arcs_scanned += last - first
 		return None
 	
-	# Calculate the max flow and return its value.
-	def solve_max_flow(self):
-		v = self.find_pushable_node()
+	# Nodes at height k or more form a cut for 1 <= k <= n, whatever the
+	# heights, and right after a global relabel these are the cuts closest
+	# to the sink.
+	def cut_ranks(self):
+		return [-h for h in self.height]
+
+	# Push and relabel until no node below height_limit has excess. Returns
+	# False if the budget ran out first.
+	def discharge(self, height_limit=None):
+		start = self.clock()
+		if self.use_global_relabel or self.labels_stale:
+			self.global_relabel()
+			self.labels_stale = False
+
+		v = self.find_pushable_node(height_limit)
+		until_check = CHECK_INTERVAL
 		while v is not None:
-			dir_w_tuple = self.find_neighbor_for_push(v)
-			if dir_w_tuple is None:
+			until_check -= 1
+			if until_check == 0:
+				until_check = CHECK_INTERVAL
+				if self.out_of_budget():
+					self.end_phase("discharge", start)
+					return False
+			if self.use_global_relabel and self.relabels_since_global >= len(self.vertices):
+				self.global_relabel()
+				v = self.find_pushable_node(height_limit)
+				continue
+
+			arc = self.find_neighbor_for_push(v)
+			if arc is None:
 				self.relabel(v)
 			else:
-				(direction, w) = dir_w_tuple
-				self.push(v, w, direction)
+				self.push(v, arc)
 			
-			v = self.find_pushable_node()
+			v = self.find_pushable_node(height_limit)
+		self.end_phase("discharge", start)
+		return True
+
+	# Find a minimum s-t cut without building a full flow. Once no node below
+	# height n has excess, the nodes that can no longer reach the sink in the
+	# residual graph are exactly those at height n or more after a global
+	# relabel, and they form the source side of a minimum cut. Excess stranded
+	# on that side is not returned to the source, so the preflow is left as
+	# is and excess[sink] is the cut capacity.
+	def solve_min_cut(self):
+		n = len(self.vertices)
+		self.start_budget(None)
+		self.discharge(n)
+		self.global_relabel()
+		return self.describe_cut([self.height[v] >= n for v in self.vertices])
+
+	# Calculate the max flow and return its value. If the budget runs out
+	# first, return the flow that has reached the sink so far; the heights
+	# and excesses are kept, so the next call goes on from there.
+	def solve_max_flow(self, budget=None):
+		self.start_budget(budget)
+		if not self.discharge():
+			return self.excess[self.sink]
+		self.complete = True
 
 		if self.debug:
-			self.sanity_check_flow()
+			self.certify()
 		return self.get_flow_val()
 
 if __name__ == "__main__":
-	(src, sink, adjmat) = file_to_adjmat(sys.argv[1])
-	debug = len(sys.argv) > 2 and sys.argv[2] == "--debug"
+	graph = read_graph(sys.argv[1])
+	debug = "--debug" in sys.argv[2:]
+	heuristics = "--no-heuristics" not in sys.argv[2:]
+	cut_only = "--cut" in sys.argv[2:]
 	start_time = time.time()
-	solver = PreflowPushSolver(adjmat, src, sink, debug)
-	end_time = time.time()
-	print(f"Max flow is: {solver.solve_max_flow()}")
+	solver = PreflowPushSolver(graph, debug, heuristics, heuristics, tracer_from_args(sys.argv[2:]))
+	if cut_only:
+		cut = solver.solve_min_cut()
+		end_time = time.time()
+		print(f"Min cut is: {cut.capacity}")
+		print(f"Source side: {len(cut.source_side)} nodes, cut edges: {len(cut.edges)}")
+	else:
+		flow_val = solver.solve_max_flow()
+		end_time = time.time()
+		print(f"Max flow is: {flow_val}")
 	print(f"Elapsed time: {end_time - start_time}")
+	print(f"Pushes: {solver.num_pushes} ({solver.num_saturating_pushes} saturating), "
+			f"relabels: {solver.num_relabels}, global relabels: {solver.num_global_relabels}, "
+			f"gaps: {solver.num_gaps}, bucket scans: {solver.num_bucket_scans}")
+	print(solver.stats())
 
 	
 		
@@ -0,0 +1,244 @@
+import sys
+import time
+import collections
+import numpy as np
+from graph import read_graph, ResidualGraph, INDEX_DTYPE, CAP_DTYPE
+from max_flow_solver import MaxFlowSolver
+from solve import ALGORITHMS
+from options import option_value
+
+# Shrink a network before solving it, without changing its maximum flow:
+#   - edges of zero capacity and self-loops are dropped,
+#   - nodes that the source cannot reach, or that cannot reach the sink,
+#     are dropped with their edges,
+#   - parallel edges are merged into one, with their capacities added up,
+#   - a node other than the terminals with a single neighbor is dropped,
+#     since whatever flows into it has to go back,
+#   - a node v with exactly two neighbors a and b is contracted: the flow
+#     through it becomes an edge a -> b of capacity min(c(a, v), c(v, b)),
+#     and likewise b -> a, added to any edge already there. Repeating this
+#     turns a series chain into a single edge.
+# min(capacity out of the source, capacity into the sink) of what is left
+# bounds the flow. If it is zero, there is nothing to solve.
+#
+# Any solver can then run on self.graph, and `expand' maps its flow back to
+# the original graph, where min_cut and the rest of MaxFlowSolver work.
+#
+# Usage: python presolve.py FILE [--algo dinic]
+class Reduction:
+	def __init__(self, graph):
+		self.original = graph
+		self.num_dead = 0
+		self.num_merged = 0
+		self.num_contracted = 0
+		# (v, a, b, c(a, b), c(b, a)) for every contracted node v, with
+		# the capacities between a and b from before the contraction.
+		self.contractions = []
+
+		alive = self.live_nodes()
+		self.num_dead = graph.num_nodes - int(alive.sum())
+		(succ, pred) = self.merged_edges(alive)
+		self.contract(succ, pred, alive)
+
+		s = graph.source
+		t = graph.sink
+		self.upper_bound = min(sum(succ[s].values()), sum(pred[t].values()))
+		self.graph = None if self.upper_bound == 0 else self.reduced_graph(succ)
+
+	# Nodes that the source reaches and that reach the sink over edges of
+	# positive capacity, found with a BFS forward from the source and one
+	# backward from the sink.
+	def live_nodes(self):
+		graph = self.original
+		arcs = graph.edge_arcs[graph.caps[graph.edge_arcs] > 0]
+		tails = graph.tails[arcs]
+		heads = graph.heads[arcs]
+
+		def reached(start, sources, targets):
+			order = np.argsort(sources, kind="stable")
+			offsets = np.zeros(graph.num_nodes + 1, dtype=np.int64)
+			np.cumsum(np.bincount(sources, minlength=graph.num_nodes), out=offsets[1:])
+			offsets = offsets.tolist()
+			targets = targets[order].tolist()
+			seen = [False] * graph.num_nodes
+			seen[start] = True
+			queue = collections.deque([start])
+			while queue:
+				u = queue.popleft()
+				for i in range(offsets[u], offsets[u + 1]):
+					v = targets[i]
+					if not seen[v]:
+						seen[v] = True
+						queue.append(v)
+			return np.array(seen, dtype=bool)
+
+		return reached(graph.source, tails, heads) & reached(graph.sink, heads, tails)
+
+	# The edges between live nodes, without self-loops and with parallel
+	# edges merged, as succ[u][v] = pred[v][u] = capacity of u -> v.
+	def merged_edges(self, alive):
+		graph = self.original
+		n = graph.num_nodes
+		arcs = graph.edge_arcs
+		tails = graph.tails[arcs].astype(np.int64)
+		heads = graph.heads[arcs].astype(np.int64)
+		caps = graph.caps[arcs]
+		keep = (caps > 0) & (tails != heads) & alive[tails] & alive[heads]
+
+		(keys, inverse) = np.unique(tails[keep] * n + heads[keep], return_inverse=True)
+		merged_caps = np.zeros(len(keys), dtype=CAP_DTYPE)
+		np.add.at(merged_caps, inverse, caps[keep])
+		self.num_merged = int(keep.sum()) - len(keys)
+
+		succ = collections.defaultdict(dict)
+		pred = collections.defaultdict(dict)
+		for (key, cap) in zip(keys.tolist(), merged_caps.tolist()):
+			(u, v) = divmod(key, n)
+			succ[u][v] = cap
+			pred[v][u] = cap
+		return (succ, pred)
+
+	# Drop nodes with one neighbor and contract nodes with two, until none
+	# is left. Changes succ, pred and alive in place.
+	def contract(self, succ, pred, alive):
+		terminals = (self.original.source, self.original.sink)
+		stack = [v for v in np.flatnonzero(alive).tolist() if v not in terminals]
+		while stack:
+			v = stack.pop()
+			if not alive[v]:
+				continue
+			neighbors = set(succ[v]) | set(pred[v])
+			if len(neighbors) > 2:
+				continue
+
+			out_caps = succ.pop(v)
+			in_caps = pred.pop(v)
+			for u in out_caps:
+				del pred[u][v]
+			for u in in_caps:
+				del succ[u][v]
+			alive[v] = False
+			if len(neighbors) < 2:
+				self.num_dead += 1
+			else:
+				(a, b) = neighbors
+				self.contractions.append((v, a, b, succ[a].get(b, 0), succ[b].get(a, 0)))
+				self.num_contracted += 1
+				for (u, w) in ((a, b), (b, a)):
+					cap = min(in_caps.get(u, 0), out_caps.get(w, 0))
+					if cap > 0:
+						succ[u][w] = succ[u].get(w, 0) + cap
+						pred[w][u] = succ[u][w]
+			stack += [u for u in neighbors if u not in terminals]
+
+	# Build the reduced ResidualGraph, with the original labels.
+	def reduced_graph(self, succ):
+		graph = self.original
+		nodes = sorted(set(succ) | {v for heads in succ.values() for v in heads}
+				| {graph.source, graph.sink})
+		index = {v: i for (i, v) in enumerate(nodes)}
+		tails = []
+		heads = []
+		caps = []
+		for u in nodes:
+			for (v, cap) in succ[u].items():
+				tails.append(index[u])
+				heads.append(index[v])
+				caps.append(cap)
+
+		labels = graph.labels
+		node_mapping = {labels[v]: i for (i, v) in enumerate(nodes)}
+		return ResidualGraph(np.array(tails, dtype=INDEX_DTYPE), np.array(heads, dtype=INDEX_DTYPE),
+				np.array(caps, dtype=CAP_DTYPE), node_mapping, labels[graph.source], labels[graph.sink])
+
+	# Map the flow of a solver that ran on self.graph back to the original
+	# graph. Returns a MaxFlowSolver on the original graph holding that
+	# flow. With no solver, e.g. when self.graph is None, the flow is zero.
+	def expand(self, solver=None):
+		graph = self.original
+		# Net flow between pairs of original nodes, from the smaller node
+		# number to the larger one.
+		net = collections.defaultdict(int)
+
+		def add(u, v, amount):
+			if u < v:
+				net[(u, v)] += amount
+			else:
+				net[(v, u)] -= amount
+
+		def flow(u, v):
+			return net[(u, v)] if u < v else -net[(v, u)]
+
+		if solver is not None:
+			reduced = solver.graph
+			arcs = reduced.edge_arcs.tolist()
+			for (arc, u, v) in zip(arcs, reduced.tails[arcs].tolist(), reduced.heads[arcs].tolist()):
+				amount = solver.caps[arc] - solver.residual[arc]
+				if amount:
+					add(graph.node_mapping[reduced.labels[u]], graph.node_mapping[reduced.labels[v]], amount)
+
+		# Undo the contractions, latest first. What the edge a -> b (b -> a)
+		# had before v was contracted is kept there, the rest goes via v.
+		for (v, a, b, cap_ab, cap_ba) in reversed(self.contractions):
+			amount = flow(a, b)
+			if amount > 0:
+				via = amount - min(amount, cap_ab)
+			else:
+				via = amount + min(-amount, cap_ba)
+			if via:
+				add(a, b, -via)
+				add(a, v, via)
+				add(v, b, via)
+
+		# Spread the flow between two nodes over the edges between them.
+		arcs_between = collections.defaultdict(list)
+		for arc in graph.edge_arcs.tolist():
+			arcs_between[(int(graph.tails[arc]), int(graph.heads[arc]))].append(arc)
+
+		full = MaxFlowSolver(graph)
+		residual = full.residual
+		for ((u, v), amount) in net.items():
+			if amount < 0:
+				(u, v, amount) = (v, u, -amount)
+			for arc in arcs_between[(u, v)]:
+				taken = min(amount, residual[arc])
+				residual[arc] -= taken
+				residual[full.rev[arc]] += taken
+				amount -= taken
+		return full
+
+	# Run a solver of class solver_class on the reduced graph with its
+	# method `method', and return the flow mapped back as by `expand'.
+	def solve(self, solver_class, method, **options):
+		if self.graph is None:
+			return self.expand()
+		solver = solver_class(self.graph, **options)
+		getattr(solver, method)()
+		return self.expand(solver)
+
+	def stats(self):
+		return {
+			"nodes": self.original.num_nodes,
+			"edges": self.original.num_edges,
+			"reduced_nodes": 0 if self.graph is None else self.graph.num_nodes,
+			"reduced_edges": 0 if self.graph is None else self.graph.num_edges,
+			"dead_nodes": self.num_dead,
+			"merged_edges": self.num_merged,
+			"contracted_nodes": self.num_contracted,
+			"upper_bound": self.upper_bound,
+		}
+
+if __name__ == "__main__":
+	graph = read_graph(sys.argv[1])
+	algorithm = option_value("--algo", "dinic", str)
+	if algorithm not in ALGORITHMS:
+		print(f"ERROR: Unknown algorithm {algorithm}")
+		exit(1)
+
+	start_time = time.time()
+	reduction = Reduction(graph)
+	reduce_time = time.time() - start_time
+	print(reduction.stats())
+	full = reduction.solve(*ALGORITHMS[algorithm])
+	print("Max Flow:", full.flow_value())
+	print(f"Reduction took {reduce_time}s, total {time.time() - start_time}s")
@@ -1,10 +1,16 @@
 import sys
 import os
+import collections
 import numpy as np
+from graph import read_graph
+from ford_fulkerson import SEARCH_MODES
+from max_flow_solver import MaxFlowSolver
+from instrumentation import tracer_from_args
 
 
-def init_d(capacities: np.ndarray, source: int) -> int:
-	s_max = np.max(capacities[source])
+# source_caps holds the residual capacities of the arcs leaving the source.
+def init_d(source_caps: list) -> int:
+	s_max = max(source_caps, default=0)
 
 	# Assuming integer weights
 	d = 1
@@ -14,109 +20,208 @@ def init_d(capacities: np.ndarray, source: int) -> int:
 	return d
 
 
-class ScalingFordFulkerson:
-	def __init__(self, graph_file, file_delim=" "):
-		self.graph, self.node_mapping = self.read_graph(graph_file, file_delim)
-		self.num_nodes = len(self.node_mapping)
-		self.source = self.node_mapping['s']
-		self.sink = self.node_mapping['t']
-
-	def augment(self, path: list, residual_graph: np.ndarray) -> int:
-		min_capacity = min(residual_graph[u][v] for u, v in path)
-		for u, v in path:
-			residual_graph[u][v] -= min_capacity
-			residual_graph[v][u] += min_capacity
+class ScalingFordFulkerson(MaxFlowSolver):
+	def __init__(self, graph, search="dfs", tracer=None):
+		if search not in SEARCH_MODES:
+			raise ValueError(f"Unknown search mode {search!r}, expected one of {SEARCH_MODES}")
+		self.search = search
+		super().__init__(graph, tracer)
+
+		# Index of the arcs usable in the current d-phase. phase_arcs[u] holds
+		# the arcs leaving u whose residual capacity was at least d when last
+		# looked at, and in_phase[a] says whether arc a is in it. Arcs that
+		# drop below d are removed lazily when a search next reaches them;
+		# arcs that rise to d are added by `augment'.
+		self.phase_arcs: list = []
+		self.in_phase: list = []
+
+		# One dict per d-phase, with the number of augmenting paths found and
+		# arcs looked at by the searches in that phase.
+		self.phase_stats: list = []
+		self.arcs_scanned: int = 0
+		# The d-phase to resume at, if the last solve ran out of budget.
+		self.delta = None
+
+	def reset(self, source=None, sink=None):
+		super().reset(source, sink)
+		self.delta = None
+
+	def operations(self) -> int:
+		return self.num_arcs_scanned + self.arcs_scanned
+
+	# Rebuild the phase index for a new value of d in one vectorized pass.
+	def build_phase_index(self, residual_graph: list, d: int):
+		usable = np.asarray(residual_graph) >= d
+		arcs = np.flatnonzero(usable).tolist()
+		counts = np.bincount(self.graph.tails[usable], minlength=self.num_nodes)
+		bounds = [0] + np.cumsum(counts).tolist()
+
+		self.phase_arcs = [arcs[bounds[u]:bounds[u + 1]] for u in range(self.num_nodes)]
+		self.in_phase = usable.tolist()
+
+	# path is a list of arc indices in the residual graph.
+	def augment(self, path: list, residual_graph: list, d: int) -> int:
+		min_capacity = min(residual_graph[arc] for arc in path)
+		for arc in path:
+			residual_graph[arc] -= min_capacity
+			reverse = self.rev[arc]
+			residual_graph[reverse] += min_capacity
+			if residual_graph[reverse] >= d and not self.in_phase[reverse]:
+				self.in_phase[reverse] = True
+				self.phase_arcs[self.tails[reverse]].append(reverse)
 
 		return min_capacity
 
-	def dfs(self, start: int, end: int, path: list, residual_graph: np.ndarray, visited: list, d: int) -> list:
-		visited[start] = True
-		path.append(start)
-
-		if start == end:
-			return path
-
-		for next_node, capacity in enumerate(residual_graph[start]):
-			if not visited[next_node] and (capacity) >= d:
-				result = self.dfs(next_node, end, path, residual_graph, visited, d)
-				if result:
-					return result
-
-		path.pop()
-		return None
-
-	def read_graph(self, graph_file, delimiter=" "):
-		with open(graph_file, 'r') as file:
-			lines = file.readlines()
-
-		graph = []
-		node_mapping = {}
-		node_count = 0
-
-		for line in lines:
-			# Bizzarely, this is last line of mesh graph files.
-			if line == "Done Mesh\n":
-				continue
-
-			u, v, capacity = filter(None, line.split(delimiter))
-			if u not in node_mapping:
-				node_mapping[u] = node_count
-				node_count += 1
-			if v not in node_mapping:
-				node_mapping[v] = node_count
-				node_count += 1
-
-			u, v, capacity = node_mapping[u], node_mapping[v], int(capacity)
-			graph.append((u, v, capacity))
-
-		adjacency_matrix = np.zeros((node_count, node_count), dtype=int)
-
-		for u, v, capacity in graph:
-			adjacency_matrix[u][v] = capacity
-
-		return adjacency_matrix, node_mapping
-
-	def init_residual_graph(self, residual_graph: np.ndarray, d: int):
-		new_residual_graph = np.copy(residual_graph)
-
-		for i in range(new_residual_graph.shape[0]):
-			for j in range(new_residual_graph.shape[1]):
-				if new_residual_graph[i, j] < d:
-					new_residual_graph[i, j] = 0
-
-		return new_residual_graph
-
-	def scaling_ff(self) -> int:
-		residual_graph: np.ndarray = np.copy(self.graph)
-		d: int = init_d(self.graph, self.source)
-		flow: int = 0
+	# Iterative DFS for a path of arcs with residual capacity at least d,
+	# looking only at the arcs in the phase index. Arcs found to have dropped
+	# below d are swapped out of the index on the way.
+	def dfs(self, start: int, end: int, residual_graph: list, d: int) -> list:
+		self.stamp += 1
+		stamp = self.stamp
+		visited = self.visited
+		heads = self.heads
+		phase_arcs = self.phase_arcs
+		in_phase = self.in_phase
+		scanned = 0
+
+		visited[start] = stamp
+		path = []
+		# next_pos[i] is the next position to try in phase_arcs of the i-th
+		# node on the path.
+		next_pos = [0]
+		node = start
+
+		while node != end:
+			arcs = phase_arcs[node]
+			i = next_pos[-1]
+			found = False
+			while i < len(arcs):
+				arc = arcs[i]
+				scanned += 1
+				if residual_graph[arc] < d:
+					in_phase[arc] = False
+					arcs[i] = arcs[-1]
+					arcs.pop()
+				elif visited[heads[arc]] == stamp:
+					i += 1
+				else:
+					found = True
+					break
+
+			if found:
+				next_pos[-1] = i + 1
+				node = heads[arc]
+				visited[node] = stamp
+				path.append(arc)
+				next_pos.append(0)
+			else:
+				next_pos.pop()
+				if not path:
+					self.arcs_scanned += scanned
+					return None
+				node = self.tails[path.pop()]
+
+		self.arcs_scanned += scanned
+		return path
+
+	# BFS for a shortest path of arcs with residual capacity at least d,
+	# looking only at the arcs in the phase index.
+	def bfs(self, start: int, end: int, residual_graph: list, d: int) -> list:
+		self.stamp += 1
+		stamp = self.stamp
+		visited = self.visited
+		parent_arc = self.parent_arc
+		heads = self.heads
+		phase_arcs = self.phase_arcs
+		in_phase = self.in_phase
+		scanned = 0
+
+		visited[start] = stamp
+		queue = collections.deque([start])
+		while queue and visited[end] != stamp:
+			node = queue.popleft()
+			arcs = phase_arcs[node]
+			i = 0
+			while i < len(arcs):
+				arc = arcs[i]
+				scanned += 1
+				if residual_graph[arc] < d:
+					in_phase[arc] = False
+					arcs[i] = arcs[-1]
+					arcs.pop()
+					continue
+				next_node = heads[arc]
+				if visited[next_node] != stamp:
+					visited[next_node] = stamp
+					parent_arc[next_node] = arc
+					queue.append(next_node)
+				i += 1
+
+		self.arcs_scanned += scanned
+		if visited[end] != stamp:
+			return None
+
+		path = []
+		node = end
+		while node != start:
+			arc = parent_arc[node]
+			path.append(arc)
+			node = self.tails[arc]
+		path.reverse()
+		return path
+
+	# Run the d-phases from the solver's current flow and return the value of
+	# the resulting maximum flow, or of the flow so far if the budget runs
+	# out first, in which case the next call resumes at the same d.
+	def scaling_ff(self, budget=None) -> int:
+		self.start_budget(budget)
+		residual_graph: list = self.residual
+		d: int = init_d(residual_graph[self.offsets[self.source]:self.offsets[self.source + 1]])
+		if self.delta is not None:
+			d = self.delta
+		search = self.dfs if self.search == "dfs" else self.bfs
+		self.phase_stats = []
+		stopped = False
 
 		while d >= 1:
-			P = self.dfs(self.source, self.sink, [], residual_graph, [False] * self.num_nodes, d)
+			if self.out_of_budget():
+				self.delta = d
+				return self.flow_value()
+			start = self.clock()
+			self.build_phase_index(residual_graph, d)
+			self.arcs_scanned = 0
+			paths = 0
+
+			P = search(self.source, self.sink, residual_graph, d)
 			while P:
-				b = self.augment([(P[i], P[i + 1]) for i in range(len(P) - 1)], residual_graph)
-				flow += b
-				P = self.dfs(self.source, self.sink, [], residual_graph, [False] * self.num_nodes, d)
-			d = d / 2
-
-		return flow
-
-	def scaling_ford_fulkerson(self):
-		max_flow = 0
-		residual_graph = self.graph.copy()
-
-		while True:
-			path = self.dfs(self.source, self.sink, [], residual_graph, [False] * self.num_nodes)
-
-			if not path:
-				break
-
-			flow = self.augment([(path[i], path[i + 1]) for i in range(len(path) - 1)], residual_graph)
-			max_flow += flow
-
-		return max_flow
-
-if __name__ == "__main__":	
-	ford_fulkerson = ScalingFordFulkerson(sys.argv[1])
+				self.augment(P, residual_graph, d)
+				paths += 1
+				stopped = self.out_of_budget()
+				if stopped:
+					break
+				P = search(self.source, self.sink, residual_graph, d)
+
+			self.phase_stats.append({"delta": d, "paths": paths, "arcs_scanned": self.arcs_scanned})
+			self.num_searches += paths if stopped else paths + 1
+			self.num_augmenting_paths += paths
+			self.num_arcs_scanned += self.arcs_scanned
+			self.arcs_scanned = 0
+			self.end_phase("delta_phase", start)
+			self.trace("delta_phase", **self.phase_stats[-1])
+			if stopped:
+				self.delta = d
+				return self.flow_value()
+			d = d // 2
+
+		self.delta = None
+		self.complete = True
+		return self.flow_value()
+
+if __name__ == "__main__":
+	search = "bfs" if "--bfs" in sys.argv[2:] else "dfs"
+	ford_fulkerson = ScalingFordFulkerson(read_graph(sys.argv[1]), search, tracer_from_args(sys.argv[2:]))
 	result_sff = ford_fulkerson.scaling_ff()
 	print("Flow SFF:", result_sff)
+	for stats in ford_fulkerson.phase_stats:
+		print(f"Delta {stats['delta']}: {stats['paths']} paths, {stats['arcs_scanned']} arcs scanned")
+	print(ford_fulkerson.stats())
@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import socket
+import asyncio
+import multiprocessing
+import concurrent.futures
+from batch import BatchSolver, LRUCache, DEFAULT_GRAPHS, DEFAULT_RESULTS
+from max_flow_solver import Budget
+from options import option_value
+
+# Long-running max flow service, so that callers do not start an interpreter
+# and parse the graph for every solve.
+#
+# Clients connect to a Unix socket or a TCP port and send jobs as JSON lines,
+# in the format of batch.py, plus an optional "deadline" in seconds:
+#   {"id": 1, "graph": "data_test/mesh_examples/output_mesh_3_42.txt", "deadline": 2}
+#   {"id": 2, "edges": [["s", "a", 3], ["a", "t", 2]], "algorithm": "pfp"}
+# Every job gets one result line, also as in batch.py. Results on a
+# connection come back as they are done, not necessarily in order, so jobs
+# should carry an id. {"op": "stats"} returns the server's counters.
+#
+# Solves run on a pool of worker processes, so the event loop only reads
+# and writes sockets. Each worker keeps its most recently used graphs
+# loaded, and graph files go through the compiled graph cache, which all
+# workers map from the same files. The server remembers recent results, and
+# a job identical to one that is still running waits for that one's result
+# instead of being solved twice.
+#
+# At most max_pending jobs are taken in at once. Beyond that, the server
+# stops reading from connections until a job is done, which pushes back on
+# the clients through their sockets. A job that is not done by its deadline
+# gets {"id": ..., "error": "deadline exceeded"}. A worker stops a solve at
+# the deadline of the job that started it, through the solver's Budget, so
+# it overruns by at most one augmenting path or phase, plus the time to load
+# the graph; jobs that were waiting on it with time left start the solve
+# again, with their own deadline.
+#
+# Workers are forked from a fork server, which holds none of the server's
+# sockets. If a worker dies, the jobs it was running get an error, and the
+# pool is replaced for the jobs after them.
+#
+# Usage: python server.py [--socket PATH | --port N] [--host HOST] [--workers N]
+#     [--max-pending N] [--deadline SECONDS] [--graphs N] [--results N]
+
+DEFAULT_PORT = 7878
+DEFAULT_DEADLINE = 60
+
+# Solver of a worker process, set up once by `init_worker'.
+worker_batch = None
+
+def init_worker(graphs):
+	global worker_batch
+	worker_batch = BatchSolver(graphs, results=0)
+
+# Solve a job with key `key' in a worker process, giving up at time
+# `deadline', as given by time.time(). Returns the result, or None if the
+# deadline passed.
+def worker_solve(job, key, deadline):
+	remaining = deadline - time.time()
+	if remaining <= 0:
+		return None
+	return worker_batch.solve(job, key, Budget(seconds=remaining))
+
+class DeadlineExceeded(Exception):
+	pass
+
+class MaxFlowServer:
+	def __init__(self, workers=None, max_pending=None, deadline=DEFAULT_DEADLINE,
+			graphs=DEFAULT_GRAPHS, results=DEFAULT_RESULTS):
+		self.workers = workers or os.cpu_count()
+		self.graphs = graphs
+		self.executor = self.start_workers()
+		# Used in a thread, to hash graph files and validate jobs without
+		# blocking the event loop.
+		self.batch = BatchSolver(graphs=0, results=0)
+		self.results = LRUCache(results)
+		self.deadline = deadline
+		self.slots = asyncio.Semaphore(max_pending or 4 * self.workers)
+		# Key of every job being solved, mapped to the future of its result.
+		self.in_flight = {}
+		self.num_jobs = 0
+		self.num_coalesced = 0
+		self.num_solved = 0
+		self.num_errors = 0
+		self.num_late = 0
+		self.num_restarts = 0
+
+	def start_workers(self):
+		return concurrent.futures.ProcessPoolExecutor(max_workers=self.workers,
+				mp_context=multiprocessing.get_context("forkserver"),
+				initializer=init_worker, initargs=(self.graphs,))
+
+	# Replace the pool of workers if it is still `executor', which is broken
+	# because one of its workers died.
+	def restart_workers(self, executor):
+		if self.executor is executor:
+			self.num_restarts += 1
+			self.executor = self.start_workers()
+			executor.shutdown(wait=False)
+
+	# Start solving a job in a worker.
+	def submit(self, job, key, deadline):
+		loop = asyncio.get_running_loop()
+		executor = self.executor
+		try:
+			future = loop.run_in_executor(executor, worker_solve, job, key, deadline)
+		except concurrent.futures.process.BrokenProcessPool:
+			self.restart_workers(executor)
+			executor = self.executor
+			future = loop.run_in_executor(executor, worker_solve, job, key, deadline)
+		future.executor = executor
+		return future
+
+	def stats(self):
+		return {
+			"jobs": self.num_jobs,
+			"solved": self.num_solved,
+			"result_hits": self.results.hits,
+			"coalesced": self.num_coalesced,
+			"in_flight": len(self.in_flight),
+			"errors": self.num_errors,
+			"late": self.num_late,
+			"worker_restarts": self.num_restarts,
+		}
+
+	# The result of a job, without its id. Raises OSError, KeyError or
+	# ValueError if the job cannot be run, and DeadlineExceeded if it is not
+	# done by `deadline'.
+	async def run(self, job, deadline):
+		loop = asyncio.get_running_loop()
+		key = await loop.run_in_executor(None, self.batch.job_key, job)
+		result = self.results.get(key)
+		if result is not None:
+			return dict(result, cached=True)
+
+		# A solve this job waits on can stop at an earlier deadline than its
+		# own, and then it is solved again.
+		while True:
+			future = self.in_flight.get(key)
+			if future is None or future.done():
+				future = self.submit(job, key, deadline)
+				self.in_flight[key] = future
+				future.add_done_callback(lambda done: self.finish(key, done))
+			else:
+				self.num_coalesced += 1
+
+			try:
+				result = await asyncio.wait_for(asyncio.shield(future), deadline - time.time())
+			except asyncio.TimeoutError:
+				raise DeadlineExceeded()
+			except concurrent.futures.process.BrokenProcessPool:
+				self.restart_workers(future.executor)
+				raise
+			if result is not None:
+				return result
+			if time.time() >= deadline:
+				raise DeadlineExceeded()
+
+	# Remember the result of a finished solve.
+	def finish(self, key, future):
+		if self.in_flight.get(key) is future:
+			del self.in_flight[key]
+		if not future.cancelled() and future.exception() is None and future.result() is not None:
+			self.num_solved += 1
+			self.results.put(key, future.result())
+
+	# The response to one request line.
+	async def respond(self, line, received):
+		try:
+			job = json.loads(line)
+		except json.JSONDecodeError as err:
+			job = {"error": str(err)}
+		if not isinstance(job, dict):
+			job = {"error": "expected a JSON object"}
+		if job.get("op") == "stats":
+			return dict(id=job.get("id"), **self.stats())
+
+		self.num_jobs += 1
+		try:
+			deadline = received + float(job.get("deadline", self.deadline))
+			result = await self.run(job, deadline)
+		except DeadlineExceeded:
+			self.num_late += 1
+			result = {"error": "deadline exceeded"}
+		except (OSError, KeyError, ValueError, TypeError) as err:
+			self.num_errors += 1
+			result = {"error": err.args[0] if isinstance(err, KeyError) and err.args else str(err)}
+		except Exception as err:
+			# A bug in a solver, or a worker that died: still answer the job.
+			self.num_errors += 1
+			result = {"error": f"{type(err).__name__}: {err}"}
+		return dict(id=job.get("id"), **result)
+
+	async def handle_connection(self, reader, writer):
+		lock = asyncio.Lock()
+		tasks = set()
+
+		async def answer(line, received):
+			try:
+				response = await self.respond(line, received)
+				async with lock:
+					writer.write((json.dumps(response) + "\n").encode())
+					await writer.drain()
+			except ConnectionError:
+				pass
+			finally:
+				self.slots.release()
+
+		try:
+			while True:
+				line = await reader.readline()
+				if not line:
+					break
+				if not line.strip():
+					continue
+				received = time.time()
+				# Take no more jobs while max_pending are in progress.
+				await self.slots.acquire()
+				task = asyncio.create_task(answer(line, received))
+				tasks.add(task)
+				task.add_done_callback(tasks.discard)
+			if tasks:
+				await asyncio.gather(*tasks)
+		except ConnectionError:
+			pass
+		finally:
+			writer.close()
+
+	async def serve(self, socket_path=None, host="127.0.0.1", port=DEFAULT_PORT):
+		# Start the fork server and the workers before any connection is
+		# open, so that neither inherits a socket and keeps it from closing.
+		await asyncio.get_running_loop().run_in_executor(self.executor, os.getpid)
+		if socket_path is not None:
+			server = await asyncio.start_unix_server(self.handle_connection, socket_path)
+		else:
+			server = await asyncio.start_server(self.handle_connection, host, port)
+		async with server:
+			await server.serve_forever()
+
+# Send jobs to a running server and wait for all their results, in the
+# order of the jobs. address is a socket path, or a (host, port) pair.
+def request(jobs, address):
+	family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+	with socket.socket(family, socket.SOCK_STREAM) as sock:
+		sock.connect(address)
+		jobs = [dict(job, id=i) for (i, job) in enumerate(jobs)]
+		sock.sendall("".join(json.dumps(job) + "\n" for job in jobs).encode())
+		sock.shutdown(socket.SHUT_WR)
+		with sock.makefile() as f:
+			results = [json.loads(line) for line in f]
+	results.sort(key=lambda result: result["id"])
+	return results
+
+if __name__ == "__main__":
+	socket_path = option_value("--socket", None, str)
+	host = option_value("--host", "127.0.0.1", str)
+	port = option_value("--port", DEFAULT_PORT, int)
+	if socket_path is not None and os.path.exists(socket_path):
+		os.remove(socket_path)
+
+	async def main():
+		server = MaxFlowServer(option_value("--workers", None, int), option_value("--max-pending", None, int),
+				option_value("--deadline", DEFAULT_DEADLINE, float), option_value("--graphs", DEFAULT_GRAPHS, int),
+				option_value("--results", DEFAULT_RESULTS, int))
+		print(f"Listening on {socket_path or f'{host}:{port}'}", flush=True)
+		await server.serve(socket_path, host, port)
+
+	try:
+		asyncio.run(main())
+	except KeyboardInterrupt:
+		pass
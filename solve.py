@@ -0,0 +1,301 @@
+import sys
+import os
+import csv
+import json
+import math
+import time
+import collections
+import numpy as np
+from ford_fulkerson import FordFulkerson
+from scaling_ford_fulkerson import ScalingFordFulkerson
+from preflow_push import PreflowPushSolver
+from dinic import Dinic
+from bulk_push_relabel import BulkPushRelabel
+from boykov_kolmogorov import BoykovKolmogorov, is_grid
+from hopcroft_karp import HopcroftKarp, detect_bipartite
+from max_flow_solver import Budget
+from certificate import CertificateError
+from graph_cache import read_graph_cached
+from options import option_value
+
+# One entry point for all solvers: solve(graph) picks the one expected to be
+# fastest on the graph, from a few cheap features of the graph and a cost
+# model fitted to the benchmark CSVs.
+#
+# The model predicts log(time) of every algorithm as a linear function of
+# the features, fitted by least squares to the runs recorded in the
+# *_benchmark.csv files, and solve picks the smallest prediction. Matching
+# instances go to Hopcroft-Karp, which the benchmarks do not cover.
+# Boykov-Kolmogorov only runs on grid graphs, and the mesh benchmarks, with
+# unit capacities only, cannot tell how its time depends on them, so it is
+# picked by a rule instead: for grids of at least BK_MIN_NODES nodes whose
+# capacities vary, where it beat the other solvers on generated grids. Run
+# "python solve.py fit" after a new benchmark run to refit the model.
+#
+# Usage:
+#   python solve.py FILE [--algo auto] [--seconds S] [--operations N] [--verify]
+#   python solve.py fit [--data-dir data_test] [--out solver_model.json] [CSV ...]
+
+# Solver class and solve method of every algorithm.
+ALGORITHMS = {
+	"ff": (FordFulkerson, "ford_fulkerson"),
+	"sff": (ScalingFordFulkerson, "scaling_ff"),
+	"pfp": (PreflowPushSolver, "solve_max_flow"),
+	"dinic": (Dinic, "dinic"),
+	"hk": (HopcroftKarp, "hopcroft_karp"),
+	"bpr": (BulkPushRelabel, "solve_max_flow"),
+	"bk": (BoykovKolmogorov, "boykov_kolmogorov"),
+}
+
+# Used when there is no fitted model.
+DEFAULT_ALGORITHM = "dinic"
+
+# Smallest grid graph given to Boykov-Kolmogorov.
+BK_MIN_NODES = 500
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "solver_model.json")
+
+# The inputs of the cost model, computed from graph_features by `model_inputs'.
+MODEL_INPUTS = ("bias", "log_nodes", "log_edges", "log_density", "log_cap_max",
+		"log_cap_spread", "bipartite", "grid", "log_source_degree", "log_sink_degree")
+
+# Weight of the ridge penalty in the fit, which keeps the weights of inputs
+# that barely vary in the data, e.g. bipartite, from blowing up.
+RIDGE = 1e-3
+
+# Inputs whose weights are kept from going negative, so that predicted times
+# never fall as capacities grow.
+CAPACITY_INPUTS = ("log_cap_max", "log_cap_spread")
+
+# Benchmark CSV columns: the number of parameters that start every row of a
+# family, then a (time, flow) pair per algorithm in this order. Mesh rows
+# end with one more for Boykov-Kolmogorov, which the model leaves out.
+FAMILY_PARAMS = {"bipartite": 3, "fixeddegree": 4, "mesh": 2, "random": 3}
+CSV_ALGORITHMS = ("ff", "sff", "pfp", "dinic")
+
+Solution = collections.namedtuple("Solution", ["flow", "algorithm", "solver"])
+
+# Cheap structural features of a graph, in O(n + m) array operations:
+#   nodes, edges, density (m / n(n - 1)),
+#   cap_min, cap_max: the range of the positive capacities,
+#   bipartite: whether the source only feeds one side, only the other side
+#       drains into the sink, and every other edge goes across,
+#   grid: the fraction of nodes other than the terminals with at most four
+#       distinct neighbors,
+#   source_degree, sink_degree: edges out of the source and into the sink.
+def graph_features(graph):
+	n = graph.num_nodes
+	arcs = graph.edge_arcs
+	tails = graph.tails[arcs].astype(np.int64)
+	heads = graph.heads[arcs].astype(np.int64)
+	caps = graph.caps[arcs]
+	positive = caps[caps > 0]
+
+	from_s = tails == graph.source
+	to_t = heads == graph.sink
+	side = np.zeros(n, dtype=np.int8)
+	side[heads[from_s]] |= 1
+	side[tails[to_t]] |= 2
+	middle = ~from_s & ~to_t
+	bipartite = bool(not np.any(side == 3) and np.all(side[tails[middle]] == 1)
+			and np.all(side[heads[middle]] == 2) and not np.any(from_s & to_t))
+
+	inner = middle & (tails != heads)
+	pairs = np.unique(np.minimum(tails[inner], heads[inner]) * n + np.maximum(tails[inner], heads[inner]))
+	degree = np.bincount(pairs // n, minlength=n) + np.bincount(pairs % n, minlength=n)
+	others = np.ones(n, dtype=bool)
+	others[[graph.source, graph.sink]] = False
+	grid = float(np.mean(degree[others] <= 4)) if np.any(others) else 0.0
+
+	return {
+		"nodes": n,
+		"edges": graph.num_edges,
+		"density": graph.num_edges / (n * (n - 1)) if n > 1 else 0.0,
+		"cap_min": int(positive.min()) if len(positive) > 0 else 0,
+		"cap_max": int(positive.max()) if len(positive) > 0 else 0,
+		"bipartite": bipartite,
+		"grid": grid,
+		"source_degree": int(from_s.sum()),
+		"sink_degree": int(to_t.sum()),
+	}
+
+# The model inputs of a dict of graph features, in MODEL_INPUTS order.
+def model_inputs(features):
+	return [
+		1.0,
+		math.log1p(features["nodes"]),
+		math.log1p(features["edges"]),
+		math.log(features["density"] + 1e-9),
+		math.log1p(features["cap_max"]),
+		math.log1p(features["cap_max"] / max(features["cap_min"], 1)),
+		float(features["bipartite"]),
+		features["grid"],
+		math.log1p(features["source_degree"]),
+		math.log1p(features["sink_degree"]),
+	]
+
+# The runs recorded in benchmark CSV files, as (graph file, algo, seconds)
+# triples. The graph file of a row is taken from the stats file written
+# next to the CSV, if there is one, and otherwise rebuilt from the row's
+# parameters, which is not possible for the random family, whose CSV lacks
+# the maximum capacity. Rows whose file is missing, and runs that timed
+# out, are skipped.
+def read_runs(csv_paths, data_dir):
+	runs = []
+	for path in csv_paths:
+		family = os.path.basename(path).split("_")[0]
+		num_params = FAMILY_PARAMS[family]
+		stats_path = path[:-len(".csv")] + "_stats.jsonl"
+		files = None
+		if os.path.exists(stats_path):
+			with open(stats_path) as f:
+				files = [json.loads(line)["file"] for line in f]
+
+		with open(path) as f:
+			rows = list(csv.reader(f))
+		for (i, row) in enumerate(rows):
+			if files is not None and i < len(files):
+				fname = files[i]
+			else:
+				fname = os.path.join(data_dir, f"{family}_examples",
+						f"output_{family}_{'_'.join(row[:num_params])}.txt")
+			if not os.path.isfile(fname):
+				continue
+			for (algo, seconds) in zip(CSV_ALGORITHMS, row[num_params::2]):
+				try:
+					runs.append((fname, algo, float(seconds)))
+				except ValueError:
+					pass
+	return runs
+
+# Least squares weights of inputs x for log times y, with the ridge penalty.
+# A capacity input that gets a negative weight is left out, its weight kept
+# at 0, and the rest refitted, until none is negative.
+def fit_weights(x, y):
+	fitted = np.ones(len(MODEL_INPUTS), dtype=bool)
+	while True:
+		weights = np.zeros(len(MODEL_INPUTS))
+		xf = x[:, fitted]
+		gram = xf.T @ xf + RIDGE * len(y) * np.eye(int(fitted.sum()))
+		weights[fitted] = np.linalg.solve(gram, xf.T @ y)
+		negative = [MODEL_INPUTS.index(name) for name in CAPACITY_INPUTS
+				if weights[MODEL_INPUTS.index(name)] < 0]
+		if not negative:
+			return weights
+		fitted[negative] = False
+
+# Fit the cost model to a list of runs. Returns it as a dict that can be
+# saved as JSON: the input names, the range of every input in the runs, the
+# weights of every algorithm, and the number of runs each was fitted to.
+# Inputs are clamped to their range when predicting, so that the model does
+# not extrapolate beyond the graphs it was fitted to.
+def fit_model(runs):
+	inputs = {}
+	by_algo = collections.defaultdict(lambda: ([], []))
+	for (fname, algo, seconds) in runs:
+		if fname not in inputs:
+			inputs[fname] = model_inputs(graph_features(read_graph_cached(fname)))
+		by_algo[algo][0].append(inputs[fname])
+		by_algo[algo][1].append(math.log(max(seconds, 1e-7)))
+
+	all_inputs = np.array(list(inputs.values()))
+	bounds = np.stack([all_inputs.min(axis=0), all_inputs.max(axis=0)], axis=1)
+	weights = {}
+	counts = {}
+	for (algo, (xs, ys)) in by_algo.items():
+		weights[algo] = fit_weights(np.array(xs), np.array(ys)).tolist()
+		counts[algo] = len(ys)
+	return {"inputs": list(MODEL_INPUTS), "bounds": bounds.tolist(), "weights": weights, "runs": counts}
+
+# The saved cost model, or None if there is none.
+def load_model(path=MODEL_PATH):
+	if not os.path.exists(path):
+		return None
+	with open(path) as f:
+		model = json.load(f)
+	if model["inputs"] != list(MODEL_INPUTS) or "bounds" not in model:
+		raise ValueError(f"{path}: model inputs do not match, refit it with 'python solve.py fit'")
+	return model
+
+# The model in MODEL_PATH, read on first use.
+saved = None
+
+def saved_model():
+	global saved
+	if saved is None:
+		saved = load_model()
+	return saved
+
+# Predicted seconds of every algorithm in the model on a graph, with the
+# inputs clamped to the range the model was fitted on.
+def predict_times(graph, model):
+	bounds = np.array(model["bounds"])
+	x = np.clip(model_inputs(graph_features(graph)), bounds[:, 0], bounds[:, 1])
+	return {algo: math.exp(float(x @ np.array(w))) for (algo, w) in model["weights"].items()}
+
+def choose_algorithm(graph, model):
+	if detect_bipartite(graph) is not None:
+		return "hk"
+	features = graph_features(graph)
+	if (features["grid"] == 1.0 and features["nodes"] >= BK_MIN_NODES
+			and features["cap_max"] > features["cap_min"] and is_grid(graph)):
+		return "bk"
+	if model is None:
+		return DEFAULT_ALGORITHM
+	times = predict_times(graph, model)
+	return min(times, key=times.get)
+
+# Solve graph with the named algorithm, or with the one chosen by the cost
+# model (the saved one, unless another is given) for "auto". Returns the
+# flow value, the algorithm used and the solver, which holds the flow. With
+# a Budget that runs out, the flow is a lower bound and solver.progress()
+# gives both bounds; calling the solver's method again continues the solve.
+def solve(graph, algorithm="auto", model=None, tracer=None, budget=None):
+	if algorithm == "auto":
+		algorithm = choose_algorithm(graph, saved_model() if model is None else model)
+	if algorithm not in ALGORITHMS:
+		raise ValueError(f"Unknown algorithm {algorithm!r}, expected 'auto' or one of {tuple(ALGORITHMS)}")
+	(solver_class, method) = ALGORITHMS[algorithm]
+	solver = solver_class(graph, tracer=tracer)
+	return Solution(getattr(solver, method)(budget), algorithm, solver)
+
+if __name__ == "__main__":
+	if len(sys.argv) < 2:
+		print("Usage: python solve.py FILE [--algo auto] | fit [--data-dir DIR] [--out PATH] [CSV ...]")
+		exit(1)
+
+	if sys.argv[1] == "fit":
+		args = sys.argv[2:]
+		csv_paths = [arg for (i, arg) in enumerate(args)
+				if not arg.startswith("--") and (i == 0 or not args[i - 1].startswith("--"))]
+		csv_paths = csv_paths or [f"{family}_benchmark.csv" for family in FAMILY_PARAMS]
+		runs = read_runs(csv_paths, option_value("--data-dir", "data_test", str))
+		if not runs:
+			print("ERROR: No benchmark runs found")
+			exit(1)
+		model = fit_model(runs)
+		out = option_value("--out", MODEL_PATH, str)
+		with open(out, "w+") as f:
+			json.dump(model, f, indent=1)
+		print(f"Fitted {len(model['weights'])} algorithms to {len(runs)} runs, wrote {out}")
+		exit(0)
+
+	graph = read_graph_cached(sys.argv[1])
+	print(graph_features(graph))
+	budget = Budget(option_value("--seconds", None, float), option_value("--operations", None, int))
+	start_time = time.time()
+	solution = solve(graph, option_value("--algo", "auto", str), budget=budget)
+	progress = solution.solver.progress()
+	if progress.complete:
+		print(f"Max Flow: {solution.flow} ({solution.algorithm}, {time.time() - start_time}s)")
+		if "--verify" in sys.argv[2:]:
+			try:
+				solution.solver.certify()
+			except CertificateError as err:
+				print(f"ERROR: {err}")
+				print("PANICKING.")
+				exit(1)
+			print("Verified against the minimum cut")
+	else:
+		print(f"Stopped early: max flow between {progress.lower} and {progress.upper} "
+				f"({solution.algorithm}, {time.time() - start_time}s)")